@@ -1,17 +1,35 @@
 import os
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, List, Tuple, Callable
 import requests
 import json
+from response_cache import create_response_cache
+from circuit_breaker import CallDeclined, get_breaker
+from rate_limiter import PRIORITY_NORMAL, estimate_tokens, get_rate_limiter
+from intent_classifier import Intents, get_intent_classifier
+from llm_client import blocked_reason, candidate_text
 
 class APIHandler:
+    GEMINI_MODEL = "gemini-pro"
+    OPENAI_MODEL = "gpt-3.5-turbo"
+    GENERATION_CONFIG = {"temperature": 0.7, "max_tokens": 1000}
+
     def __init__(self):
         """Initialize API handlers for OpenAI and Gemini."""
         self.setup_apis()
+        self.response_cache = create_response_cache()
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
     
     def setup_apis(self):
         """Setup API clients with environment variables."""
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         self.gemini_api_key = os.getenv('GEMINI_API_KEY')
+        self.openai_api_base = os.getenv('OPENAI_API_BASE', 'https://api.openai.com').rstrip('/')
+        self.gemini_api_base = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com').rstrip('/')
+        
+        # Seconds to wait for the primary provider before racing the secondary; unset = sequential
+        hedge_delay = os.getenv('LLM_HEDGE_DELAY')
+        self.hedge_delay = float(hedge_delay) if hedge_delay else None
         
         if self.openai_api_key:
             print("OpenAI API key found")
@@ -21,13 +39,25 @@ class APIHandler:
         if not self.openai_api_key and not self.gemini_api_key:
             print("No API keys found - will use mock responses")
     
-    def get_openai_response(self, prompt: str, system_message: str = "") -> Optional[str]:
-        """Get response from OpenAI API using direct HTTP requests."""
+    def get_openai_response(self, prompt: str, system_message: str = "",
+                            priority: int = PRIORITY_NORMAL) -> Optional[str]:
+        """Get response from OpenAI API, unless it is out of quota or its circuit breaker is open."""
         if not self.openai_api_key:
             return None
-        
+        breaker = get_breaker("openai")
+        admission = breaker.allow_request()
+        if not admission:
+            return None
+        limiter = get_rate_limiter("openai", self.openai_api_key)
+        if not limiter.try_acquire(estimate_tokens(prompt + system_message, 1000), priority):
+            breaker.release(admission)
+            return None
+        return breaker.call(self.request_openai, prompt, system_message, admission=admission)
+    
+    def request_openai(self, prompt: str, system_message: str = "") -> Optional[str]:
+        """Get response from OpenAI API using direct HTTP requests."""
         try:
-            url = "https://api.openai.com/v1/chat/completions"
+            url = f"{self.openai_api_base}/v1/chat/completions"
             headers = {
                 "Authorization": f"Bearer {self.openai_api_key}",
                 "Content-Type": "application/json"
@@ -39,29 +69,48 @@ class APIHandler:
             messages.append({"role": "user", "content": prompt})
             
             data = {
-                "model": "gpt-3.5-turbo",  # Free tier model
+                "model": self.OPENAI_MODEL,  # Free tier model
                 "messages": messages,
                 "max_tokens": 1000,
                 "temperature": 0.7
             }
             
             response = requests.post(url, headers=headers, json=data, timeout=30)
+            get_rate_limiter("openai", self.openai_api_key).record_response(
+                response.status_code, response.headers.get("Retry-After")
+            )
+            if response.status_code == 429:
+                raise CallDeclined("OpenAI quota exceeded (429)")
             response.raise_for_status()
             
             result = response.json()
             return result['choices'][0]['message']['content'].strip()
             
+        except CallDeclined:
+            raise
         except Exception as e:
             print(f"OpenAI API error: {e}")
             return None
     
-    def get_gemini_response(self, prompt: str, system_message: str = "") -> Optional[str]:
-        """Get response from Gemini API using direct HTTP requests."""
+    def get_gemini_response(self, prompt: str, system_message: str = "",
+                            priority: int = PRIORITY_NORMAL) -> Optional[str]:
+        """Get response from Gemini API, unless it is out of quota or its circuit breaker is open."""
         if not self.gemini_api_key:
             return None
-        
+        breaker = get_breaker("gemini")
+        admission = breaker.allow_request()
+        if not admission:
+            return None
+        limiter = get_rate_limiter("gemini", self.gemini_api_key)
+        if not limiter.try_acquire(estimate_tokens(prompt + system_message, 1000), priority):
+            breaker.release(admission)
+            return None
+        return breaker.call(self.request_gemini, prompt, system_message, admission=admission)
+    
+    def request_gemini(self, prompt: str, system_message: str = "") -> Optional[str]:
+        """Get response from Gemini API using direct HTTP requests."""
         try:
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key={self.gemini_api_key}"
+            url = f"{self.gemini_api_base}/v1beta/models/{self.GEMINI_MODEL}:generateContent?key={self.gemini_api_key}"
             
             # Combine system message and prompt
             full_prompt = prompt
@@ -83,55 +132,125 @@ class APIHandler:
             }
             
             response = requests.post(url, json=data, timeout=30)
+            get_rate_limiter("gemini", self.gemini_api_key).record_response(
+                response.status_code, response.headers.get("Retry-After")
+            )
+            if response.status_code == 429:
+                raise CallDeclined("Gemini quota exceeded (429)")
             response.raise_for_status()
             
             result = response.json()
-            if 'candidates' in result and len(result['candidates']) > 0:
-                content = result['candidates'][0]['content']['parts'][0]['text']
+            content = candidate_text(result)
+            if content:
                 return content.strip()
-            else:
-                return None
+            raise CallDeclined(f"Gemini gave no answer: {blocked_reason(result) or 'no candidates'}")
                 
+        except CallDeclined:
+            raise
         except Exception as e:
             print(f"Gemini API error: {e}")
             return None
     
-    def get_fallback_response(self, prompt: str, system_message: str = "") -> str:
-        """Get response from available APIs with intelligent fallback."""
-        # Try Gemini first (more generous free tier)
-        response = self.get_gemini_response(prompt, system_message)
-        if response:
-            return response
+    def get_fallback_response(self, prompt: str, system_message: str = "",
+                              priority: int = PRIORITY_NORMAL) -> str:
+        """Get response from available APIs with intelligent fallback.
+        
+        `priority` orders the request in the providers' quota queues (see rate_limiter).
+        """
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self.response_cache.make_key(
+                prompt, system_message, f"{self.GEMINI_MODEL}|{self.OPENAI_MODEL}", self.GENERATION_CONFIG
+            )
+            cached = self.response_cache.get(cache_key)
+            if cached:
+                return cached
+        
+        if self.hedge_delay is not None:
+            response = self.get_hedged_response(prompt, system_message, priority)
+        else:
+            # Try Gemini first (more generous free tier)
+            response = self.get_gemini_response(prompt, system_message, priority)
+            
+            # Fallback to OpenAI
+            if not response:
+                response = self.get_openai_response(prompt, system_message, priority)
         
-        # Fallback to OpenAI
-        response = self.get_openai_response(prompt, system_message)
         if response:
+            if cache_key:
+                self.response_cache.set(cache_key, response)
             return response
         
         # If both APIs fail, provide intelligent mock response
         return self.get_intelligent_mock_response(prompt, system_message)
     
+    def get_providers(self) -> List[Tuple[str, Callable[[str, str, int], Optional[str]]]]:
+        """Configured providers in priority order (Gemini has the more generous free tier)."""
+        providers = []
+        if self.gemini_api_key:
+            providers.append(("gemini", self.get_gemini_response))
+        if self.openai_api_key:
+            providers.append(("openai", self.get_openai_response))
+        return providers
+    
+    def get_hedged_response(self, prompt: str, system_message: str = "",
+                            priority: int = PRIORITY_NORMAL) -> Optional[str]:
+        """Race providers: start the next one if the current ones fail or stay silent for hedge_delay.
+        
+        The first successful answer wins. Losers that have not started are cancelled;
+        an in-flight loser cannot be interrupted, so its result is simply discarded.
+        """
+        providers = self.get_providers()
+        if not providers:
+            return None
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('LLM_HEDGE_WORKERS', '16')), thread_name_prefix="llm-hedge"
+            )
+        
+        pending = {self._hedge_executor.submit(providers[0][1], prompt, system_message, priority)}
+        next_provider = 1
+        while pending:
+            can_hedge = next_provider < len(providers)
+            done, pending = wait(pending, timeout=self.hedge_delay if can_hedge else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                response = future.result()
+                if response:
+                    for loser in pending:
+                        loser.cancel()
+                    return response
+            
+            # The hedge delay expired or a provider failed: bring in the next provider
+            if can_hedge:
+                name, provider = providers[next_provider]
+                print(f"Hedging LLM request to {name}")
+                pending.add(self._hedge_executor.submit(provider, prompt, system_message, priority))
+                next_provider += 1
+        
+        return None
+    
     def get_intelligent_mock_response(self, prompt: str, system_message: str = "") -> str:
         """Generate intelligent mock responses when APIs are unavailable."""
-        prompt_lower = prompt.lower()
+        intents = get_intent_classifier().classify(prompt)
         
         # Medical/health queries
-        if any(word in prompt_lower for word in ['symptom', 'omicron', 'covid', 'fever', 'cough', 'health']):
-            return self.get_medical_mock_response(prompt)
+        if "mock_medical" in intents:
+            return self.get_medical_mock_response(prompt, intents)
         
         # Data analysis queries
-        elif any(word in prompt_lower for word in ['analyze', 'data', 'statistics', 'trend']):
+        elif "mock_data" in intents:
             return self.get_data_analysis_mock_response(prompt)
         
         # General queries
         else:
             return self.get_general_mock_response(prompt)
     
-    def get_medical_mock_response(self, prompt: str) -> str:
+    def get_medical_mock_response(self, prompt: str, intents: Optional[Intents] = None) -> str:
         """Generate medical-focused mock response."""
-        prompt_lower = prompt.lower()
+        intents = intents or get_intent_classifier().classify(prompt)
         
-        if 'omicron' in prompt_lower or 'covid' in prompt_lower:
+        if "omicron" in intents:
             return """**About Omicron Variant:**
 
 Omicron is a variant of COVID-19 that was first identified in November 2021. Based on current medical knowledge:
@@ -157,7 +276,7 @@ Omicron is a variant of COVID-19 that was first identified in November 2021. Bas
 
 *Note: I'm currently running in offline mode. For real-time medical information, please add your API keys or consult current medical sources.*"""
         
-        elif any(word in prompt_lower for word in ['symptom', 'fever', 'cough', 'headache']):
+        elif "mock_symptom" in intents:
             return """**General Health Information:**
 
 Common symptoms you asked about can have various causes. Here's general guidance:
@@ -269,15 +388,7 @@ To unlock full AI capabilities with personalized, intelligent responses:
     
     def is_medical_query(self, query: str) -> bool:
         """Determine if a query is medical-related."""
-        medical_keywords = [
-            'symptom', 'disease', 'medicine', 'treatment', 'doctor', 'hospital',
-            'health', 'medical', 'diagnosis', 'cure', 'therapy', 'medication',
-            'covid', 'omicron', 'virus', 'vaccine', 'infection', 'fever',
-            'cough', 'pain', 'sick', 'illness', 'patient', 'clinic'
-        ]
-        
-        query_lower = query.lower()
-        return any(keyword in query_lower for keyword in medical_keywords)
+        return "api_medical" in get_intent_classifier().classify(query)
     
     def get_medical_system_message(self) -> str:
         """Get system message for medical queries."""
@@ -291,15 +402,7 @@ To unlock full AI capabilities with personalized, intelligent responses:
     
     def is_medical_query(self, query: str) -> bool:
         """Determine if a query is medical-related."""
-        medical_keywords = [
-            'symptom', 'disease', 'medicine', 'treatment', 'doctor', 'hospital',
-            'health', 'medical', 'diagnosis', 'cure', 'therapy', 'medication',
-            'covid', 'omicron', 'virus', 'vaccine', 'infection', 'fever',
-            'cough', 'pain', 'sick', 'illness', 'patient', 'clinic'
-        ]
-        
-        query_lower = query.lower()
-        return any(keyword in query_lower for keyword in medical_keywords)
+        return "api_medical" in get_intent_classifier().classify(query)
     
     def get_medical_system_message(self) -> str:
         """Get system message for medical queries."""
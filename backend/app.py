@@ -1,8 +1,10 @@
 import streamlit as st
-import pandas as pd
 import os
+import uuid
 from dotenv import load_dotenv
 from chatbot import MedicalChatbot
+from data_processor import get_data_processor
+from api_handler import APIHandler
 
 # Load environment variables
 load_dotenv()
@@ -15,9 +17,24 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_resource
+def get_chatbot() -> MedicalChatbot:
+    """Chatbot shared by every session of this process; conversations are kept per session id."""
+    return MedicalChatbot(get_data_processor(), APIHandler())
+
+def get_session_chatbot() -> MedicalChatbot:
+    """The shared chatbot, after making sure this session has a conversation id.
+    
+    The shared data is reloaded only when the CSV's modification time changes.
+    """
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    get_data_processor()
+    return get_chatbot()
+
 class MediCareApp:
     def __init__(self):
-        self.chatbot = MedicalChatbot()
+        self.chatbot = get_session_chatbot()
         self.initialize_session()
         
     def initialize_session(self):
@@ -130,6 +147,7 @@ class MediCareApp:
         if st.button("🔄 Change Service", key="change_service"):
             st.session_state.service_selected = False
             st.session_state.messages = []
+            self.chatbot.conversation_store.clear(st.session_state.session_id)
             st.rerun()
         
         # Display chat messages
@@ -144,15 +162,14 @@ class MediCareApp:
             with st.chat_message("user"):
                 st.markdown(prompt)
             
-            # Get bot response
+            # Stream bot response as it is generated
             with st.chat_message("assistant"):
-                with st.spinner("🤔 Thinking..."):
-                    response = self.chatbot.get_response(
-                        prompt, 
-                        st.session_state.user_name, 
-                        st.session_state.selected_service
-                    )
-                st.markdown(response)
+                response = st.write_stream(self.chatbot.stream_response(
+                    prompt, 
+                    st.session_state.user_name, 
+                    st.session_state.selected_service,
+                    session_id=st.session_state.session_id
+                ))
             
             # Add assistant response
             st.session_state.messages.append({"role": "assistant", "content": response})
@@ -239,8 +256,7 @@ def main():
     st.markdown('<h1 class="main-header">🏥 Medical AI Chatbot</h1>', unsafe_allow_html=True)
     
     # Initialize chatbot
-    if 'chatbot' not in st.session_state:
-        st.session_state.chatbot = MedicalChatbot()
+    chatbot = get_session_chatbot()
     
     # Initialize chat history
     if 'messages' not in st.session_state:
@@ -250,14 +266,14 @@ def main():
     with st.sidebar:
         st.header("📊 Data Info")
         
-        # Load and display omicron data info
-        try:
-            omicron_data = pd.read_csv("omicron_2025.csv")
-            st.write(f"📈 Total tweets: {len(omicron_data)}")
-            if 'date' in omicron_data.columns:
-                st.write(f"📅 Date range: {omicron_data['date'].min()} - {omicron_data['date'].max()}")
-        except Exception as e:
+        # Display omicron data info from the shared data layer
+        stats = chatbot.data_processor.get_statistics()
+        if 'error' in stats:
             st.warning("Could not load omicron data")
+        else:
+            st.write(f"📈 Total tweets: {stats['total_tweets']}")
+            if stats['date_range']:
+                st.write(f"📅 Date range: {stats['date_range']['start']} - {stats['date_range']['end']}")
         
         st.markdown("---")
         st.header("🤖 Features")
@@ -268,6 +284,7 @@ def main():
         
         if st.button("Clear Chat History"):
             st.session_state.messages = []
+            chatbot.conversation_store.clear(st.session_state.session_id)
             st.rerun()
     
     # Main chat interface
@@ -292,7 +309,7 @@ def main():
         # Get bot response
         with st.spinner("Thinking..."):
             try:
-                response = st.session_state.chatbot.get_response(user_input)
+                response = chatbot.get_response(user_input, session_id=st.session_state.session_id)
                 st.session_state.messages.append({"role": "assistant", "content": response})
             except Exception as e:
                 error_msg = f"Sorry, I encountered an error: {str(e)}"
@@ -0,0 +1,943 @@
+"""Load benchmarks for the MediCare AI backend against a local Gemini stub.
+
+Usage:
+    python benchmark.py chat --clients 1 10 100 --requests 200
+    python benchmark.py chat --stream --clients 1 10 --requests 100
+    python benchmark.py hedge --error-rate 0.05 --slow-rate 0.05
+    python benchmark.py search --rows 1000000
+    python benchmark.py quota --rpm 120 --requests 180
+    python benchmark.py preprocess --rows 1000000
+    python benchmark.py ingest --rows 1000000 --chunk-rows 0 100000
+    python benchmark.py cache --rows 1000000
+    python benchmark.py keywords --rows 1000000
+    python benchmark.py trends --rows 1000000
+    python benchmark.py summaries --rows 1000000
+    python benchmark.py rank --rows 100000 --docs 5000000
+    python benchmark.py semantic --rows 1000000
+    python benchmark.py append --rows 1000000 --batch 1 100 10000
+    python benchmark.py results --rows 1000000 --limit 50 1000
+    python benchmark.py intents --terms 100 10000 --intents 20
+    python benchmark.py prompt --turns 0 4 50 --budget 500 1500 4000
+    python benchmark.py conversation --turns 200 --summarize-after 16
+    python benchmark.py prefix --clients 1 10 --requests 100 --prefill-per-1k 0.05
+    python benchmark.py batch --messages 200 --concurrency 1 16 64
+"""
+import argparse
+import asyncio
+import atexit
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(module_app: str, port: int, env: dict) -> subprocess.Popen:
+    """Run an ASGI app with uvicorn in a child process and wait until it accepts connections."""
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module_app, "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env}
+    )
+    atexit.register(process.terminate)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{module_app} did not start on port {port}")
+
+
+def start_stack(stub_latency: float, stub_env: Optional[Dict[str, str]] = None, **env) -> str:
+    """Start the Gemini stub and the FastAPI app pointed at it; return the app base URL."""
+    stub_port = free_port()
+    start_server("stub_server:app", stub_port, {"STUB_LATENCY": str(stub_latency), **(stub_env or {})})
+
+    app_port = free_port()
+    start_server("main:app", app_port, {
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "stub-key",
+        "GEMINI_API_BASE": f"http://127.0.0.1:{stub_port}",
+        **env
+    })
+    return f"http://127.0.0.1:{app_port}"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def timed_chat(client: httpx.AsyncClient, base_url: str, payload: dict, stream: bool):
+    """Send one chat request; return (time to first token, total time) in seconds."""
+    started = time.perf_counter()
+    if not stream:
+        response = await client.post(f"{base_url}/api/chat", json=payload)
+        response.raise_for_status()
+        elapsed = time.perf_counter() - started
+        return elapsed, elapsed
+
+    first_token = None
+    async with client.stream("POST", f"{base_url}/api/chat/stream", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_token is None and line.startswith("data: {"):
+                first_token = time.perf_counter() - started
+    return first_token, time.perf_counter() - started
+
+
+async def run_chat_load(base_url: str, clients: int, total: int, stream: bool = False,
+                        same_message: bool = False):
+    """Fire `total` chat requests from `clients` concurrent clients."""
+    ttfts, latencies = [], []
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            message = "I have a fever, what should I do?" if same_message else f"I have a fever, what should I do? #{i}"
+            payload = {"message": message, "selectedService": "health"}
+            ttft, latency = await timed_chat(client, base_url, payload, stream)
+            ttfts.append(ttft)
+            latencies.append(latency)
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    return elapsed, ttfts, latencies
+
+
+def bench_chat(args):
+    # Keep the response cache out of the way so every request reaches get_gemini_response
+    base_url = start_stack(args.stub_latency, RESPONSE_CACHE_BACKEND="off")
+    endpoint = "/api/chat/stream" if args.stream else "/api/chat"
+    print(f"Endpoint: {endpoint}, stub latency: {args.stub_latency * 1000:.0f} ms, "
+          f"requests per run: {args.requests}")
+    print(f"{'clients':>8} {'req/s':>10} {'ttft p50':>10} {'ttft p99':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for clients in args.clients:
+        elapsed, ttfts, latencies = asyncio.run(
+            run_chat_load(base_url, clients, args.requests, args.stream, args.same_message)
+        )
+        print(f"{clients:>8} {len(latencies) / elapsed:>10.1f} "
+              f"{statistics.median(ttfts) * 1000:>10.1f} {percentile(ttfts, 99) * 1000:>10.1f} "
+              f"{statistics.median(latencies) * 1000:>10.1f} {percentile(latencies, 99) * 1000:>10.1f}")
+    single_flight = httpx.get(f"{base_url}/health").json()["single_flight"]
+    print(f"Upstream Gemini calls: {single_flight['upstream_calls']}, coalesced: {single_flight['coalesced']}")
+
+
+async def run_quota_load(base_url: str, clients: int, total: int) -> Dict[str, int]:
+    """Send `total` distinct chat requests; count real answers, fallback answers and 429 rejections."""
+    outcomes = {"answered": 0, "fallback": 0, "rejected": 0}
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker(client: httpx.AsyncClient):
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            payload = {"message": f"I have a fever, what should I do? #{i}", "selectedService": "health"}
+            response = await client.post(f"{base_url}/api/chat", json=payload)
+            if response.status_code == 429:
+                outcomes["rejected"] += 1
+            elif "Stub answer" in response.json()["response"]:
+                outcomes["answered"] += 1
+            else:
+                outcomes["fallback"] += 1
+
+    async with httpx.AsyncClient(timeout=300) as client:
+        await asyncio.gather(*(worker(client) for _ in range(clients)))
+    return outcomes
+
+
+def bench_quota(args):
+    print(f"Provider quota: {args.rpm:g} requests/minute, {args.requests} requests from {args.clients} clients")
+    print(f"{'limiter':>22} {'answered':>9} {'fallback':>9} {'rejected':>9} {'upstream 429':>13} {'seconds':>8}")
+    modes = [("429 Retry-After only", {}), (f"GEMINI_RPM={args.rpm:g}", {"GEMINI_RPM": str(args.rpm)})]
+    for label, env in modes:
+        base_url = start_stack(args.stub_latency, stub_env={"STUB_RPM": str(args.rpm)},
+                               RESPONSE_CACHE_BACKEND="off", RATE_LIMIT_MAX_WAIT=str(args.max_wait), **env)
+        started = time.perf_counter()
+        outcomes = asyncio.run(run_quota_load(base_url, args.clients, args.requests))
+        elapsed = time.perf_counter() - started
+        limits = httpx.get(f"{base_url}/health").json()["rate_limits"]
+        throttled = sum(stats["throttled_by_provider"] for stats in limits.values())
+        print(f"{label:>22} {outcomes['answered']:>9} {outcomes['fallback']:>9} {outcomes['rejected']:>9} "
+              f"{throttled:>13} {elapsed:>8.1f}")
+
+
+SYNTHETIC_WORDS = (
+    "omicron covid fever cough sore throat headache fatigue tired recovered recovery mild severe "
+    "taste smell loss vaccine booster test positive negative quarantine isolation day week better "
+    "worse hope fear worried sick doctor hospital symptoms body aches runny nose congestion feeling "
+    "today yesterday family work school kids still finally getting much more than expected"
+).split()
+SYNTHETIC_LOCATIONS = ["New York", "California", "Texas", "Florida", "Illinois", "Ohio", "Georgia", "Washington"]
+SYNTHETIC_SENTIMENTS = ["positive", "neutral", "negative"]
+
+
+def make_synthetic_csv(path: str, rows: int, seed: int = 7) -> str:
+    """Write a synthetic tweet CSV with the same columns as omicron_2025.csv."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(SYNTHETIC_WORDS + [f"w{i}" for i in range(20000)], dtype=object)
+    words = vocabulary[rng.zipf(1.3, size=(rows, 14)) % len(vocabulary)]
+    extras = rng.integers(0, 10, size=rows)
+    texts = []
+    for i, row in enumerate(words):
+        text = " ".join(row)
+        if extras[i] == 0:
+            text += f" https://t.co/x{i} #omicron"
+        elif extras[i] == 1:
+            text = f"@user{i % 5000} " + text
+        texts.append(text)
+
+    frame = pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "text": texts,
+        "date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 90, size=rows), unit="D"),
+        "user": [f"user{u}" for u in rng.integers(0, 50000, size=rows)],
+        "location": np.array(SYNTHETIC_LOCATIONS, dtype=object)[rng.integers(0, len(SYNTHETIC_LOCATIONS), size=rows)],
+        "sentiment": np.array(SYNTHETIC_SENTIMENTS, dtype=object)[rng.integers(0, 3, size=rows)],
+    })
+    frame.to_csv(path, index=False, date_format="%Y-%m-%d")
+    return path
+
+
+def synthetic_csv(rows: int) -> str:
+    """Path of a cached synthetic CSV with `rows` rows, generating it on first use."""
+    import tempfile
+
+    path = os.path.join(tempfile.gettempdir(), f"omicron_synthetic_{rows}.csv")
+    if not os.path.exists(path):
+        print(f"Generating {rows:,} synthetic tweets at {path} ...")
+        make_synthetic_csv(path, rows)
+    return path
+
+
+def timed(func, repeat: int = 1):
+    """Best wall time in seconds over `repeat` runs, and the last result."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def start_providers(primary_env: dict, secondary_env: dict) -> dict:
+    """Start fake Gemini (primary) and OpenAI (secondary) stubs; return env vars pointing at them."""
+    gemini_port, openai_port = free_port(), free_port()
+    start_server("stub_server:app", gemini_port, primary_env)
+    start_server("stub_server:app", openai_port, secondary_env)
+    return {
+        "GEMINI_API_KEY": "stub-key",
+        "GEMINI_API_BASE": f"http://127.0.0.1:{gemini_port}",
+        "OPENAI_API_KEY": "stub-key",
+        "OPENAI_API_BASE": f"http://127.0.0.1:{openai_port}",
+        "RESPONSE_CACHE_BACKEND": "off",
+    }
+
+
+def run_handler_load(handler, total: int, clients: int) -> List[float]:
+    """Latencies of `total` get_fallback_response calls issued from `clients` threads."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    def one(i):
+        started = time.perf_counter()
+        handler.get_fallback_response(f"I have a fever, what should I do? #{i}")
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        return list(pool.map(one, range(total)))
+
+
+def bench_hedge(args):
+    import contextlib
+    import io
+
+    primary = {"STUB_LATENCY": str(args.latency), "STUB_ERROR_RATE": str(args.error_rate),
+               "STUB_SLOW_RATE": str(args.slow_rate), "STUB_SLOW_LATENCY": str(args.slow_latency)}
+    secondary = {"STUB_LATENCY": str(args.latency * 1.5)}
+    os.environ.update(start_providers(primary, secondary))
+    print(f"Primary: {args.latency * 1000:.0f} ms, {args.error_rate:.0%} errors, "
+          f"{args.slow_rate:.0%} stalled for {args.slow_latency:.1f} s; secondary: {args.latency * 1500:.0f} ms")
+    print(f"{'mode':>12} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10}")
+
+    for label, hedge_delay in (("sequential", None), (f"hedge {args.hedge_delay:g}s", args.hedge_delay)):
+        with contextlib.redirect_stdout(io.StringIO()):
+            from api_handler import APIHandler
+            handler = APIHandler()
+            handler.hedge_delay = hedge_delay
+            latencies = run_handler_load(handler, args.requests, args.clients)
+        print(f"{label:>12} {statistics.median(latencies) * 1000:>10.1f} "
+              f"{percentile(latencies, 90) * 1000:>10.1f} {percentile(latencies, 99) * 1000:>10.1f}")
+
+
+def bench_search(args):
+    from data_processor import OmicronDataProcessor
+
+    path = synthetic_csv(args.rows)
+    os.environ.setdefault("DATA_CACHE_DIR", "off")
+    load_time, processor = timed(lambda: OmicronDataProcessor(path))
+    print(f"Load + preprocess + index: {load_time:.2f} s ({len(processor.search_index):,} terms)")
+
+    text = processor.data['text']
+    print(f"{'query':>16} {'scan ms':>10} {'index ms':>10} {'matches':>8} {'same':>6}")
+    for query in args.queries:
+        query_lower = query.lower()
+        scan_time, expected = timed(
+            lambda: list(processor.data[text.str.lower().str.contains(query_lower, regex=False)].head(args.limit).index),
+            repeat=1
+        )
+        index_time, rows = timed(lambda: processor.find_rows(query_lower, args.limit), repeat=5)
+        same = list(processor.data.index[rows]) == expected
+        print(f"{query:>16} {scan_time * 1000:>10.1f} {index_time * 1000:>10.3f} {len(rows):>8} {str(same):>6}")
+
+
+# Inputs where the order of the cleaning passes or whitespace handling matters
+PREPROCESS_EDGE_CASES = [
+    "", " ", "\t\n", "  leading and trailing  ", "tabs\tand\nnewlines\r\nmixed",
+    "@httpx mention that looks like a url", "#http://t.co/a hashtag url", "@user#tag",
+    "see www.example.com/x?y=1 and https://t.co/abc.", "unicode\u00a0nbsp\u2003em\u2028line\x1csep\x85space",
+    "@", "#", "http", "nan"
+]
+
+
+def legacy_clean_text(text: str) -> str:
+    """clean_text as it was before batching, applied row by row."""
+    import re
+
+    text = re.sub(r'http\S+|www\S+|https\S+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'@\w+|#', '', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def bench_preprocess(args):
+    import pandas as pd
+    from concurrent.futures import ProcessPoolExecutor
+    from data_processor import CATEGORY_COLUMNS, clean_text_column
+
+    path = synthetic_csv(args.rows)
+    data = pd.read_csv(path)
+    texts = pd.concat([data['text'].astype(str), pd.Series(PREPROCESS_EDGE_CASES, dtype=data['text'].dtype)],
+                      ignore_index=True)
+    print(f"Cleaning {len(texts):,} texts")
+
+    legacy_time, expected = timed(lambda: texts.apply(legacy_clean_text))
+    print(f"{'row-wise apply':>24} {legacy_time:>8.2f} s")
+    for workers in args.workers:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            batch_time, cleaned = timed(lambda: clean_text_column(texts, executor if workers > 1 else None))
+        same = cleaned.equals(expected)
+        print(f"{f'batched, {workers} worker(s)':>24} {batch_time:>8.2f} s  identical: {same}")
+
+    before = data[CATEGORY_COLUMNS].memory_usage(deep=True, index=False).sum()
+    after = data[CATEGORY_COLUMNS].astype('category').memory_usage(deep=True, index=False).sum()
+    print(f"{'/'.join(CATEGORY_COLUMNS)} memory: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB as categoricals")
+
+
+INGEST_SCRIPT = """
+import json, resource, sys, time
+from data_processor import OmicronDataProcessor
+started = time.perf_counter()
+processor = OmicronDataProcessor(sys.argv[1], progress=lambda *args: None)
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "seconds": elapsed,
+    "rows": len(processor.data),
+    "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "frame_bytes": int(processor.data.memory_usage(deep=True).sum())
+}))
+"""
+
+
+def run_ingest(path: str, env: Dict[str, str]) -> dict:
+    """Load a CSV with OmicronDataProcessor in a fresh interpreter, so timings and peak RSS are its own."""
+    import json
+
+    output = subprocess.run(
+        [sys.executable, "-c", INGEST_SCRIPT, path], capture_output=True, text=True, check=True,
+        env={**os.environ, **env}
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def bench_ingest(args):
+    path = synthetic_csv(args.rows)
+    print(f"CSV: {os.path.getsize(path) / 2**20:.0f} MiB, {args.rows:,} rows")
+    print(f"{'chunk rows':>12} {'seconds':>9} {'peak RSS MiB':>13} {'frame MiB':>10}")
+    for chunk_rows in args.chunk_rows:
+        result = run_ingest(path, {"DATA_CHUNK_ROWS": str(chunk_rows), "DATA_CACHE_DIR": "off"})
+        label = "whole file" if chunk_rows == 0 else f"{chunk_rows:,}"
+        print(f"{label:>12} {result['seconds']:>9.1f} {result['peak_rss_kib'] / 1024:>13.0f} "
+              f"{result['frame_bytes'] / 2**20:>10.0f}")
+
+
+def bench_cache(args):
+    import shutil
+    import tempfile
+
+    path = synthetic_csv(args.rows)
+    cache_dir = tempfile.mkdtemp(prefix="omicron_cache_")
+    print(f"CSV: {os.path.getsize(path) / 2**20:.0f} MiB, {args.rows:,} rows")
+    print(f"{'start':>26} {'seconds':>9} {'peak RSS MiB':>13}")
+    try:
+        runs = [("CSV, no cache", "off"), ("CSV, writing cache", cache_dir), ("from cache", cache_dir)]
+        for label, directory in runs:
+            result = run_ingest(path, {"DATA_CACHE_DIR": directory})
+            print(f"{label:>26} {result['seconds']:>9.2f} {result['peak_rss_kib'] / 1024:>13.0f}")
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(cache_dir) for name in names)
+        print(f"Cache size: {size / 2**20:.0f} MiB")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+# Substrings the old join-and-count approach counted as keyword mentions
+KEYWORD_EDGE_CASES = [
+    "badge badly bad", "sickness sick-day", "hopeful hope", "smelly smell", "glossy loss", "feverish fever",
+    "tiredness tired", "mildly mild", "negatively negative", "good,better;worse.", "sore throat", "BAD Fever"
+]
+
+
+def bench_keywords(args):
+    import re
+    import pandas as pd
+    from data_processor import OmicronDataProcessor
+    from keyword_matcher import KeywordMatcher
+    from search_index import tokenize_documents
+
+    path = synthetic_csv(args.rows)
+    os.environ.setdefault("DATA_CACHE_DIR", "off")
+    processor = OmicronDataProcessor(path, progress=lambda *args: None)
+    keywords = processor.keyword_matcher.keywords
+    text = processor.data['text']
+
+    def join_and_count():
+        all_text = ' '.join(text.astype(str).str.lower())
+        return {keyword: all_text.count(keyword) for keyword in keywords}
+
+    legacy_time, _ = timed(join_and_count)
+    texts_lower = pd.Series(processor.text_lower, dtype=object)
+    count_time, _ = timed(lambda: KeywordMatcher(keywords).count(texts_lower))
+    batch = tokenize_documents(texts_lower)
+    match_time, _ = timed(lambda: processor.keyword_matcher.match(batch), repeat=3)
+    lookup_time, _ = timed(processor.analyze_sentiment_keywords, repeat=5)
+    print(f"{len(text):,} tweets, {len(keywords)} keywords")
+    print(f"{'join + str.count':>28} {legacy_time * 1000:>10.1f} ms")
+    print(f"{'tokenize + match':>28} {count_time * 1000:>10.1f} ms")
+    print(f"{'match, tokens shared w/ index':>28} {match_time * 1000:>10.1f} ms")
+    print(f"{'precomputed lookup':>28} {lookup_time * 1000:>10.3f} ms")
+
+    # Whole-word reference counts on a sample plus the edge cases
+    sample = pd.Series(list(processor.text_lower[:args.check_rows]) + [t.lower() for t in KEYWORD_EDGE_CASES],
+                       dtype=object)
+    reference = {keyword: int(sample.str.count(rf"\b{re.escape(keyword)}\b").sum()) for keyword in keywords}
+    matched = KeywordMatcher(keywords).count(sample)
+    print(f"Whole-word counts match regex reference on {len(sample):,} rows: {matched == reference}")
+    all_text = ' '.join(sample)
+    over_counted = {keyword: all_text.count(keyword) - matched[keyword] for keyword in keywords
+                    if all_text.count(keyword) != matched[keyword]}
+    print(f"Substring over-counts by the old approach: {over_counted or 'none'}")
+
+
+def bench_trends(args):
+    import pandas as pd
+    from data_processor import OmicronDataProcessor
+
+    path = synthetic_csv(args.rows)
+    os.environ.setdefault("DATA_CACHE_DIR", "off")
+    processor = OmicronDataProcessor(path, progress=lambda *args: None)
+    data = processor.data
+    queries = [
+        ("Texas, weekly by sentiment", dict(location="Texas", freq="W")),
+        ("Texas, January, daily", dict(location="Texas", start="2024-01-01", end="2024-01-31", freq="D")),
+        ("fever, monthly by location", dict(keyword="fever", freq="M", group_by="location")),
+    ]
+
+    def scan(location=None, keyword=None, start=None, end=None, freq="W", group_by="sentiment"):
+        """The same counts computed from the tweets on every request."""
+        mask = pd.Series(True, index=data.index)
+        if location:
+            mask &= data['location'].astype(str).str.lower() == location.lower()
+        if start:
+            mask &= data['date'] >= pd.Timestamp(start)
+        if end:
+            mask &= data['date'] <= pd.Timestamp(end)
+        if keyword:
+            mask &= pd.Series(processor.text_lower, index=data.index).str.contains(rf"\b{keyword}\b")
+        rows = data[mask & data['date'].notna()]
+        counts = rows.groupby([rows['date'].dt.to_period(freq).dt.start_time, rows[group_by]], observed=True).size()
+        return int(counts.sum())
+
+    print(f"{len(data):,} tweets, cube of {len(processor.trends.to_frames()[0]):,} + "
+          f"{len(processor.trends.to_frames()[1]):,} rows")
+    print(f"{'query':>28} {'scan ms':>10} {'cube ms':>10} {'same total':>11}")
+    for label, query in queries:
+        scan_time, expected = timed(lambda: scan(**query))
+        cube_time, result = timed(lambda: processor.query_trends(**query), repeat=5)
+        print(f"{label:>28} {scan_time * 1000:>10.1f} {cube_time * 1000:>10.1f} {str(result['total'] == expected):>11}")
+
+
+def bench_summaries(args):
+    from data_processor import OmicronDataProcessor
+
+    path = synthetic_csv(args.rows)
+    os.environ.setdefault("DATA_CACHE_DIR", "off")
+    processor = OmicronDataProcessor(path, progress=lambda *args: None)
+    calls = [
+        ("get_statistics", processor.get_statistics),
+        ("get_topic_summary", lambda: processor.get_topic_summary("sore throat")),
+        ("count_keywords", lambda: processor.count_keywords(["sore throat", "runny nose"])),
+    ]
+    print(f"{len(processor.data):,} tweets")
+    print(f"{'summary':>20} {'first call ms':>14} {'repeat ms':>10}")
+    for label, call in calls:
+        first_time, _ = timed(call)
+        repeat_time, _ = timed(call, repeat=100)
+        print(f"{label:>20} {first_time * 1000:>14.2f} {repeat_time * 1000:>10.4f}")
+
+
+def bm25_reference(texts_lower, query: str, limit: int) -> List[int]:
+    """Top rows by BM25 computed directly from the text and fully sorted, to check InvertedIndex.rank."""
+    import numpy as np
+    import re
+    from search_index import BM25_B, BM25_K1, tokenize
+
+    lengths = texts_lower.str.count(r"\w+").to_numpy(dtype=np.float64)
+    scores = np.zeros(len(texts_lower))
+    for term in dict.fromkeys(tokenize(query)):
+        frequencies = texts_lower.str.count(rf"\b{re.escape(term)}\b").to_numpy(dtype=np.float64)
+        documents = np.count_nonzero(frequencies)
+        if documents == 0:
+            continue
+        idf = np.log(1 + (len(texts_lower) - documents + 0.5) / (documents + 0.5))
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / lengths.mean())
+        scores += idf * frequencies * (BM25_K1 + 1) / (frequencies + norms)
+    order = np.lexsort((np.arange(len(scores)), -scores))
+    return [int(row) for row in order[:limit] if scores[row] > 0]
+
+
+def bench_rank(args):
+    import numpy as np
+    import pandas as pd
+    from data_processor import OmicronDataProcessor
+    from search_index import InvertedIndex, TokenizedBatch
+
+    path = synthetic_csv(args.rows)
+    os.environ.setdefault("DATA_CACHE_DIR", "off")
+    processor = OmicronDataProcessor(path, progress=lambda *args: None)
+    texts_lower = pd.Series(processor.text_lower, dtype=object)
+    print(f"{len(texts_lower):,} tweets: top {args.limit} by BM25 vs a full-sort reference")
+    print(f"{'query':>28} {'rank ms':>10} {'same top-k':>11}")
+    for query in args.queries:
+        rank_time, ranked = timed(lambda: processor.search_index.rank(query, args.limit), repeat=5)
+        expected = bm25_reference(texts_lower, query, args.limit)
+        print(f"{query:>28} {rank_time * 1000:>10.2f} {str([row for row, _ in ranked] == expected):>11}")
+
+    # A larger index straight from random tokens, skipping CSV parsing
+    rng = np.random.default_rng(3)
+    words = np.array(SYNTHETIC_WORDS + [f"w{i}" for i in range(50000)], dtype=object)
+    lengths = rng.integers(5, 25, size=args.docs)
+    codes = rng.zipf(1.3, size=int(lengths.sum())) % len(words)
+    index = InvertedIndex()
+    build_time, _ = timed(lambda: index.add_tokens(TokenizedBatch(lengths, codes, words)))
+    print(f"{args.docs:,} synthetic documents indexed in {build_time:.1f} s")
+    print(f"{'query':>28} {'rank ms':>10} {'matching rows':>14}")
+    for query in args.queries:
+        rank_time, _ = timed(lambda: index.rank(query, args.limit), repeat=5)
+        matching = len(np.unique(np.concatenate([index.postings(term) for term in query.split()])))
+        print(f"{query:>28} {rank_time * 1000:>10.2f} {matching:>14,}")
+
+
+def bench_semantic(args):
+    import pandas as pd
+    from data_processor import OmicronDataProcessor
+    from semantic_index import create_semantic_index
+
+    path = synthetic_csv(args.rows)
+    os.environ.setdefault("DATA_CACHE_DIR", "off")
+    processor = OmicronDataProcessor(path, progress=lambda *args: None)
+    build_time, index = timed(lambda: create_semantic_index(pd.Series(processor.text_lower, dtype=object)))
+    print(f"{len(index):,} vectors x {index.projection.shape[1]} dims in {len(index.centroids):,} groups, "
+          f"built in {build_time:.1f} s ({index.vectors.nbytes / 2**20:.0f} MiB int8)")
+
+    print(f"{'query':>28} {'nprobe':>7} {'ms':>8} {'recall@10':>10}")
+    for query in args.queries:
+        exact = {row for row, _ in index.search(query, 10, nprobe=len(index.centroids))}
+        for nprobe in args.nprobe:
+            search_time, found = timed(lambda: index.search(query, 10, nprobe=nprobe), repeat=5)
+            recall = len(exact & {row for row, _ in found}) / max(len(exact), 1)
+            print(f"{query:>28} {nprobe:>7} {search_time * 1000:>8.2f} {recall:>10.2f}")
+        exhaustive_time, _ = timed(lambda: index.search(query, 10, nprobe=len(index.centroids)), repeat=3)
+        print(f"{query:>28} {'all':>7} {exhaustive_time * 1000:>8.2f} {1.0:>10.2f}")
+
+
+def bench_append(args):
+    import pandas as pd
+    from data_processor import OmicronDataProcessor
+
+    path = synthetic_csv(args.rows)
+    os.environ.setdefault("DATA_CACHE_DIR", "off")
+    reload_time, processor = timed(lambda: OmicronDataProcessor(path, progress=lambda *args: None))
+    print(f"Full load of {args.rows:,} rows: {reload_time:.2f} s")
+
+    source = pd.read_csv(path, nrows=max(args.batch))
+    next_id = int(processor.data['id'].max()) + 1
+    print(f"{'batch rows':>11} {'append ms':>10} {'upsert ms':>10} {'rows/s':>10}")
+    for batch in args.batch:
+        rows = source.head(batch).assign(id=range(next_id, next_id + batch))
+        next_id += batch
+        append_time, _ = timed(lambda: processor.append_tweets(rows))
+        # Same ids again: every row replaces the one just appended
+        upsert_time, _ = timed(lambda: processor.upsert_tweets(rows))
+        print(f"{batch:>11,} {append_time * 1000:>10.1f} {upsert_time * 1000:>10.1f} {batch / append_time:>10,.0f}")
+
+    # The incremental structures must agree with a fresh load of the same rows
+    expected = OmicronDataProcessor(path, progress=lambda *args: None)
+    expected.data = processor.live_data().reset_index(drop=True)
+    expected.build_search_index()
+    expected.advance_version()
+    same = (processor.analyze_sentiment_keywords() == expected.analyze_sentiment_keywords() and
+            processor.query_trends(group_by="location") == expected.query_trends(group_by="location") and
+            processor.get_statistics() == expected.get_statistics())
+    print(f"Counts, trends and statistics match a rebuild: {same}")
+
+
+def bench_results(args):
+    import tracemalloc
+    from data_processor import OmicronDataProcessor
+    from tweet_results import TweetResults
+
+    path = synthetic_csv(args.rows)
+    os.environ.setdefault("DATA_CACHE_DIR", "off")
+    processor = OmicronDataProcessor(path, progress=lambda *args: None)
+    data = processor.data
+
+    def allocated(call) -> int:
+        tracemalloc.start()
+        result = call()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+        return size
+
+    print(f"{'limit':>7} {'materialize':>22} {'ms':>8} {'KiB held':>9}")
+    for limit in args.limit:
+        rows = processor.find_rows("omicron", limit)
+        ways = [
+            ("to_dict('records')", lambda: data.iloc[rows].to_dict('records')),
+            ("TweetResults, all", lambda: TweetResults(data, rows).to_records()),
+            ("TweetResults, text", lambda: [tweet['text'][:150] for tweet in TweetResults(data, rows, ['text'])]),
+        ]
+        for label, call in ways:
+            elapsed, _ = timed(call, repeat=20)
+            print(f"{limit:>7} {label:>22} {elapsed * 1000:>8.2f} {allocated(call) / 1024:>9.0f}")
+
+
+def bench_intents(args):
+    import random
+    from intent_classifier import INTENT_KEYWORDS, IntentClassifier
+
+    rng = random.Random(0)
+    words = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(4, 10))) for _ in range(50_000)]
+    messages = [
+        "What are the symptoms of omicron and how long does the fever last?",
+        "Show me how tweets about loss of smell changed over time in Texas during January 2024, "
+        "and summarize what people reported about recovery, vaccines and sore throats " * 20,
+    ]
+    print(f"{'terms':>7} {'message words':>14} {'any() ms':>10} {'trie ms':>9} {'build ms':>9}")
+    for terms in args.terms:
+        # Real routing keywords plus random words and two-word phrases, spread over the intents
+        intents = {name: list(keywords) for name, keywords in INTENT_KEYWORDS.items()}
+        names = list(intents) + [f"specialty_{i}" for i in range(max(0, args.intents - len(intents)))]
+        for i in range(terms):
+            term = rng.choice(words) if i % 4 else f"{rng.choice(words)} {rng.choice(words)}"
+            intents.setdefault(names[i % len(names)], []).append(term)
+
+        build_time, classifier = timed(lambda: IntentClassifier(intents))
+        for message in messages:
+            message_lower = message.lower()
+            scan_time, _ = timed(lambda: {name for name, keywords in intents.items()
+                                          if any(keyword in message_lower for keyword in keywords)}, repeat=5)
+            trie_time, _ = timed(lambda: classifier.classify(message), repeat=5)
+            print(f"{terms:>7,} {len(message.split()):>14,} {scan_time * 1000:>10.3f} {trie_time * 1000:>9.3f} "
+                  f"{build_time * 1000:>9.1f}")
+
+
+def bench_prompt(args):
+    import random
+    os.environ.setdefault("GEMINI_API_KEY", "")
+    import main as app
+    from prompt_builder import count_tokens
+
+    rng = random.Random(0)
+    words = "fever cough omicron vaccine booster fatigue sore throat recovery isolation test positive days".split()
+    sentence = lambda n: " ".join(rng.choice(words) for _ in range(n)).capitalize() + "."
+
+    def fixed_prompt(message, history):
+        # The previous build_prompt: the last four messages, each cut at 100 characters
+        recent = "".join(f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content'][:100]}...\n"
+                         for msg in (history or [])[-4:])
+        os.environ["PROMPT_TOKEN_BUDGET"] = "1000000"
+        return app.build_system_instruction("health") + "\n\n" + app.build_prompt(message, "Alex", "health").replace(
+            "User Query:", f"Recent conversation:\n{recent}\nUser Query:" if recent else "User Query:")
+
+    message = "What should I do if my fever comes back after a week?"
+    print(f"{'turns':>6} {'budget':>7} {'fixed tok':>10} {'budgeted tok':>13} {'history kept':>13} "
+          f"{'dropped':>8} {'build ms':>9}")
+    for turns in args.turns:
+        history = []
+        for _ in range(turns):
+            history.append({"role": "user", "content": sentence(rng.randint(8, 40))})
+            history.append({"role": "assistant", "content": " ".join(sentence(12) for _ in range(rng.randint(3, 30)))})
+        fixed_tokens = count_tokens(fixed_prompt(message, history))
+        for budget in args.budget:
+            os.environ["PROMPT_TOKEN_BUDGET"] = str(budget)
+            build_time, prompt = timed(lambda: app.assemble_prompt(message, "Alex", "health", history), repeat=5)
+            assert prompt.total_tokens == count_tokens(prompt.text) + prompt.tokens["system"]
+            conversation = prompt.text.partition("Recent conversation:\n")[2].partition("\n\n")[0]
+            kept = len(conversation.splitlines())
+            print(f"{turns:>6} {budget:>7,} {fixed_tokens:>10,} "
+                  f"{prompt.total_tokens:>13,} {kept:>6}/{len(history):<6} {sum(prompt.dropped.values()):>8,} "
+                  f"{build_time * 1000:>9.2f}")
+
+
+def bench_prefix(args):
+    import json
+    os.environ.setdefault("GEMINI_API_KEY", "")
+    import main as app
+    from llm_client import AsyncGeminiClient
+
+    message = "I have a fever, what should I do?"
+    prompt = app.build_prompt(message, "", "health")
+    instruction = app.build_system_instruction("health")
+    inline = len(json.dumps(AsyncGeminiClient.build_payload(prompt, app.GENERATION_CONFIG, instruction)))
+    cached = len(json.dumps(AsyncGeminiClient.build_payload(prompt, app.GENERATION_CONFIG, None,
+                                                            "cachedContents/0123456789ab")))
+    print(f"Request body: {inline:,} bytes with the system instruction inline, {cached:,} bytes by reference; "
+          f"stub prefill {args.prefill_per_1k * 1000:.0f} ms per 1000 uncached chars")
+    print(f"{'prefix cache':>13} {'clients':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for mode in ("off", "on"):
+        base_url = start_stack(args.stub_latency, stub_env={"STUB_PREFILL_PER_1K_CHARS": str(args.prefill_per_1k)},
+                               RESPONSE_CACHE_BACKEND="off", GEMINI_PROMPT_CACHE=mode)
+        # The first request registers the prefix in the background; later ones reference it
+        httpx.post(f"{base_url}/api/chat", json={"message": message, "selectedService": "health"}, timeout=60)
+        time.sleep(1)
+        for clients in args.clients:
+            elapsed, _, latencies = asyncio.run(run_chat_load(base_url, clients, args.requests, False))
+            print(f"{mode:>13} {clients:>8} {len(latencies) / elapsed:>10.1f} "
+                  f"{statistics.median(latencies) * 1000:>10.1f} {percentile(latencies, 99) * 1000:>10.1f}")
+        print(f"{'':>13} {httpx.get(f'{base_url}/health').json()['prompt_cache']}")
+
+
+def bench_batch(args):
+    base_url = start_stack(args.stub_latency, RESPONSE_CACHE_BACKEND="off", CHAT_BATCH_CONCURRENCY="256")
+    messages = [{"message": f"I have a fever, what should I do? #{i}", "selectedService": "health"}
+                for i in range(args.messages)]
+    print(f"{args.messages} messages, stub latency {args.stub_latency * 1000:.0f} ms")
+    print(f"{'mode':>24} {'seconds':>8} {'msg/s':>8} {'item p50 ms':>12} {'failed':>7}")
+
+    with httpx.Client(timeout=600) as client:
+        started = time.perf_counter()
+        for payload in messages:
+            client.post(f"{base_url}/api/chat", json=payload).raise_for_status()
+        elapsed = time.perf_counter() - started
+        print(f"{'one /api/chat at a time':>24} {elapsed:>8.2f} {args.messages / elapsed:>8.1f} "
+              f"{elapsed / args.messages * 1000:>12.1f} {0:>7}")
+
+        for concurrency in args.concurrency:
+            started = time.perf_counter()
+            response = client.post(f"{base_url}/api/chat/batch",
+                                   json={"requests": messages, "max_concurrency": concurrency})
+            elapsed = time.perf_counter() - started
+            body = response.json()
+            assert [item["index"] for item in body["results"]] == list(range(args.messages))
+            item_p50 = statistics.median(item["elapsed_ms"] for item in body["results"])
+            print(f"{f'batch, concurrency {concurrency}':>24} {elapsed:>8.2f} {args.messages / elapsed:>8.1f} "
+                  f"{item_p50:>12.1f} {body['failed']:>7}")
+
+
+def bench_conversation(args):
+    import random
+    os.environ.setdefault("GEMINI_API_KEY", "")
+    os.environ["PROMPT_TOKEN_BUDGET"] = "1000000"
+    import main as app
+    from conversation_store import ConversationStore
+    from conversation_summarizer import ConversationSummarizer
+
+    rng = random.Random(0)
+    words = "fever cough omicron vaccine booster fatigue sore throat recovery isolation test positive days".split()
+    sentence = lambda n: " ".join(rng.choice(words) for _ in range(n)).capitalize() + "."
+    turns = [(sentence(rng.randint(8, 30)), " ".join(sentence(12) for _ in range(rng.randint(3, 12))))
+             for _ in range(args.turns)]
+
+    print(f"{'mode':>12} {'turn':>6} {'stored msgs':>12} {'prompt tok':>11} {'append ms':>10}")
+    for mode in ("ring buffer", "summarized"):
+        store = ConversationStore(max_messages=args.max_messages)
+        summarizer = None
+        if mode == "summarized":
+            summarizer = ConversationSummarizer(store, threshold=args.summarize_after, keep_recent=args.keep_recent)
+        for turn, (question, answer) in enumerate(turns, 1):
+            history = store.history("bench", include_summary=True)
+            tokens = app.assemble_prompt(question, "Alex", "health", history).total_tokens
+            append_time, _ = timed(lambda: (store.append("bench", "user", question),
+                                            store.append("bench", "assistant", answer)))
+            if summarizer is not None:
+                summarizer.wait()
+            if turn in (1, 5, 10, 25, 50, 100) or turn == len(turns):
+                print(f"{mode:>12} {turn:>6} {len(history):>12} {tokens:>11,} {append_time * 1000:>10.3f}")
+        if summarizer is not None:
+            print(f"{'':>12} summaries: {summarizer.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    chat = subparsers.add_parser("chat", help="Throughput of /api/chat at N concurrent clients")
+    chat.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50])
+    chat.add_argument("--requests", type=int, default=200)
+    chat.add_argument("--stub-latency", type=float, default=0.2)
+    chat.add_argument("--stream", action="store_true", help="Use /api/chat/stream and measure time to first token")
+    chat.add_argument("--same-message", action="store_true", help="Send one identical message from every client")
+    chat.set_defaults(func=bench_chat)
+
+    hedge = subparsers.add_parser("hedge", help="APIHandler tail latency with fake providers, sequential vs hedged")
+    hedge.add_argument("--requests", type=int, default=200)
+    hedge.add_argument("--clients", type=int, default=10)
+    hedge.add_argument("--latency", type=float, default=0.1)
+    hedge.add_argument("--error-rate", type=float, default=0.05)
+    hedge.add_argument("--slow-rate", type=float, default=0.05)
+    hedge.add_argument("--slow-latency", type=float, default=3.0)
+    hedge.add_argument("--hedge-delay", type=float, default=0.5)
+    hedge.set_defaults(func=bench_hedge)
+
+    search = subparsers.add_parser("search", help="search_tweets index lookups vs full-column scans")
+    search.add_argument("--rows", type=int, default=1_000_000)
+    search.add_argument("--limit", type=int, default=10)
+    search.add_argument("--queries", nargs="+", default=["fever", "sore throat", "feeling better", "w1234", "recovered"])
+    search.set_defaults(func=bench_search)
+
+    quota = subparsers.add_parser("quota", help="/api/chat against a provider quota, with and without GEMINI_RPM")
+    quota.add_argument("--rpm", type=float, default=120)
+    quota.add_argument("--requests", type=int, default=180)
+    quota.add_argument("--clients", type=int, default=10)
+    quota.add_argument("--stub-latency", type=float, default=0.1)
+    quota.add_argument("--max-wait", type=float, default=60)
+    quota.set_defaults(func=bench_quota)
+
+    preprocess = subparsers.add_parser("preprocess", help="Row-wise vs batched text cleaning, with output check")
+    preprocess.add_argument("--rows", type=int, default=1_000_000)
+    preprocess.add_argument("--workers", type=int, nargs="+", default=[1])
+    preprocess.set_defaults(func=bench_preprocess)
+
+    ingest = subparsers.add_parser("ingest", help="Load time and peak memory, whole-file vs chunked CSV reads")
+    ingest.add_argument("--rows", type=int, default=1_000_000)
+    ingest.add_argument("--chunk-rows", type=int, nargs="+", default=[0, 100_000])
+    ingest.set_defaults(func=bench_ingest)
+
+    cache = subparsers.add_parser("cache", help="Process start time from the CSV vs from the dataset cache")
+    cache.add_argument("--rows", type=int, default=1_000_000)
+    cache.set_defaults(func=bench_cache)
+
+    keyword_counts = subparsers.add_parser("keywords", help="Sentiment keyword counting, join + str.count vs token matcher")
+    keyword_counts.add_argument("--rows", type=int, default=1_000_000)
+    keyword_counts.add_argument("--check-rows", type=int, default=20_000)
+    keyword_counts.set_defaults(func=bench_keywords)
+
+    trends = subparsers.add_parser("trends", help="Trend queries from the aggregate cube vs scanning the tweets")
+    trends.add_argument("--rows", type=int, default=1_000_000)
+    trends.set_defaults(func=bench_trends)
+
+    summaries = subparsers.add_parser("summaries", help="Dataset summaries, first call vs memoized repeat")
+    summaries.add_argument("--rows", type=int, default=1_000_000)
+    summaries.set_defaults(func=bench_summaries)
+
+    rank = subparsers.add_parser("rank", help="BM25 top-k ranking latency, checked against a full-sort reference")
+    rank.add_argument("--rows", type=int, default=100_000)
+    rank.add_argument("--docs", type=int, default=5_000_000)
+    rank.add_argument("--limit", type=int, default=10)
+    rank.add_argument("--queries", nargs="+",
+                      default=["fever", "sore throat", "runny nose congestion", "w1234", "finally feeling better"])
+    rank.set_defaults(func=bench_rank)
+
+    semantic = subparsers.add_parser("semantic", help="Semantic search build time, latency and recall by nprobe")
+    semantic.add_argument("--rows", type=int, default=1_000_000)
+    semantic.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    semantic.add_argument("--queries", nargs="+",
+                          default=["can't taste anything", "loss of smell", "feeling better finally", "fever and cough"])
+    semantic.set_defaults(func=bench_semantic)
+
+    append = subparsers.add_parser("append", help="Incremental append/upsert latency vs a full reload")
+    append.add_argument("--rows", type=int, default=1_000_000)
+    append.add_argument("--batch", type=int, nargs="+", default=[1, 100, 10_000])
+    append.set_defaults(func=bench_append)
+
+    results = subparsers.add_parser("results", help="Search result materialization, dict records vs lazy projected results")
+    results.add_argument("--rows", type=int, default=1_000_000)
+    results.add_argument("--limit", type=int, nargs="+", default=[50, 1000])
+    results.set_defaults(func=bench_results)
+
+    intents = subparsers.add_parser("intents", help="Intent classification, per-intent any() scans vs one word-trie pass")
+    intents.add_argument("--terms", type=int, nargs="+", default=[100, 10_000])
+    intents.add_argument("--intents", type=int, default=20)
+    intents.set_defaults(func=bench_intents)
+
+    prompt = subparsers.add_parser("prompt", help="Prompt size with a fixed history cut vs the token-budgeted assembler")
+    prompt.add_argument("--turns", type=int, nargs="+", default=[0, 2, 10, 50])
+    prompt.add_argument("--budget", type=int, nargs="+", default=[500, 1500, 4000])
+    prompt.set_defaults(func=bench_prompt)
+
+    conversation = subparsers.add_parser("conversation", help="Prompt size per turn of a long session, ring buffer vs background summaries")
+    conversation.add_argument("--turns", type=int, default=200)
+    conversation.add_argument("--max-messages", type=int, default=20)
+    conversation.add_argument("--summarize-after", type=int, default=16)
+    conversation.add_argument("--keep-recent", type=int, default=6)
+    conversation.set_defaults(func=bench_conversation)
+
+    prefix = subparsers.add_parser("prefix", help="Chat latency with system instructions sent inline vs cached upstream")
+    prefix.add_argument("--clients", type=int, nargs="+", default=[1, 10])
+    prefix.add_argument("--requests", type=int, default=100)
+    prefix.add_argument("--stub-latency", type=float, default=0.05)
+    prefix.add_argument("--prefill-per-1k", type=float, default=0.05,
+                        help="Stub prefill seconds per 1000 prompt characters not served from its cache")
+    prefix.set_defaults(func=bench_prefix)
+
+    batch = subparsers.add_parser("batch", help="Many messages through /api/chat one by one vs one /api/chat/batch call")
+    batch.add_argument("--messages", type=int, default=200)
+    batch.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    batch.add_argument("--stub-latency", type=float, default=0.1)
+    batch.set_defaults(func=bench_batch)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,91 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator
+import calendar
 import re
 import json
 import os
+import time
 from dotenv import load_dotenv
-from data_processor import OmicronDataProcessor
+from data_processor import OmicronDataProcessor, SENTIMENT_KEYWORDS, get_data_processor
 from api_handler import APIHandler
+from llm_client import (DEFAULT_GEMINI_API_BASE, STALE_CACHE_STATUSES, AsyncGeminiClient, blocked_reason,
+                        candidate_text, parse_sse_chunk)
+from prompt_cache import cached_content_body, create_prefix_cache
+from circuit_breaker import CallDeclined, get_breaker
+from rate_limiter import estimate_tokens, get_rate_limiter, priority_for_service
+from conversation_store import ConversationStore, DEFAULT_SESSION, SUMMARY_ROLE, create_conversation_store
+from conversation_summarizer import create_conversation_summarizer
+from intent_classifier import Intents, get_intent_classifier
+from prompt_builder import (AssembledPrompt, ContextAssembler, EVIDENCE_ITEM_TOKENS, HISTORY_MESSAGE_TOKENS,
+                            PRIORITY_EVIDENCE, PRIORITY_HISTORY, prompt_stats, prompt_token_budget,
+                            truncate_to_tokens)
 
 # Load environment variables
 load_dotenv()
 
 class MedicalChatbot:
-    def __init__(self):
-        """Initialize the medical chatbot with Gemini API."""
-        self.data_processor = OmicronDataProcessor()
-        self.api_handler = APIHandler()
-        self.conversation_history = []
+    def __init__(self, data_processor: Optional[OmicronDataProcessor] = None, api_handler: Optional[APIHandler] = None,
+                 conversation_store: Optional[ConversationStore] = None):
+        """Initialize the medical chatbot with Gemini API.
+        
+        The data processor defaults to the process-wide shared instance, so creating
+        a chatbot does not re-read the CSV.
+        """
+        self.data_processor = data_processor or get_data_processor()
+        self.api_handler = api_handler or APIHandler()
+        self.conversation_store = conversation_store or create_conversation_store()
+        if self.conversation_store.summarizer is None:
+            create_conversation_summarizer(self.conversation_store, self.api_handler.get_hedged_response)
+        self.intent_classifier = get_intent_classifier()
         self.use_ai_primary = True
         self.gemini_api_key = os.getenv('GEMINI_API_KEY')
-        
-    def get_response(self, user_input: str, user_name: str = "", selected_service: str = "") -> str:
+        self.gemini_api_base = os.getenv('GEMINI_API_BASE', DEFAULT_GEMINI_API_BASE).rstrip('/')
+        self.gemini_model = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+        # With GEMINI_PROMPT_CACHE=on, each service's system instruction is cached upstream once
+        self.prefix_cache = create_prefix_cache(self.gemini_model)
+        if self.prefix_cache is not None and self.gemini_api_key:
+            self.prefix_cache.start_thread(self.create_cached_content, self.update_cached_content)
+        
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """Messages of the default session (kept for callers that predate session ids)."""
+        return self.conversation_store.history(DEFAULT_SESSION)
+    
+    def get_response(self, user_input: str, user_name: str = "", selected_service: str = "",
+                     session_id: str = DEFAULT_SESSION) -> str:
         """Get chatbot response with service-specific guidance."""
-        # Add user input to conversation history
-        self.conversation_history.append({"role": "user", "content": user_input})
+        # Add user input to this session's conversation history
+        self.conversation_store.append(session_id, "user", user_input)
         
         # Get AI response with service context
-        response = self.get_ai_response(user_input, user_name, selected_service)
-        
-        # Add response to conversation history
-        self.conversation_history.append({"role": "assistant", "content": response})
+        response = self.get_ai_response(user_input, user_name, selected_service, session_id)
         
-        # Keep conversation history limited
-        if len(self.conversation_history) > 20:
-            self.conversation_history = self.conversation_history[-20:]
+        # Add response to conversation history (the store keeps it bounded)
+        self.conversation_store.append(session_id, "assistant", response)
         
         return response
     
-    def get_ai_response(self, query: str, user_name: str = "", selected_service: str = "") -> str:
+    def get_ai_response(self, query: str, user_name: str = "", selected_service: str = "",
+                        session_id: str = DEFAULT_SESSION) -> str:
         """Get AI response prioritizing general health queries over omicron data."""
         try:
             if self.gemini_api_key:
-                return self.get_gemini_response(query, user_name, selected_service)
+                return self.get_gemini_response(query, user_name, selected_service, session_id)
             else:
                 return self.get_fallback_response(query, user_name, selected_service)
                 
         except Exception as e:
             return f"I apologize, but I encountered an error processing your request: {str(e)}. Please try again."
     
-    def get_gemini_response(self, query: str, user_name: str = "", selected_service: str = "") -> str:
-        """Get response from Gemini API with comprehensive medical assistance."""
-        import requests
-        
-        # Use the correct model name for current Gemini API
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={self.gemini_api_key}"
-        
-        # Create context-aware prompt
+    def get_gemini_url(self, method: str = "generateContent") -> str:
+        """Build the Gemini REST URL for a model method."""
+        return f"{self.gemini_api_base}/v1beta/models/{self.gemini_model}:{method}?key={self.gemini_api_key}"
+    
+    def build_gemini_system_instruction(self, selected_service: str = "") -> str:
+        """The static part of the Gemini prompt for a service, sent as its system instruction."""
         service_context = self.get_service_context(selected_service)
-        omicron_context = self.get_minimal_omicron_context() if "omicron" in query.lower() or "covid" in query.lower() else ""
         
-        prompt = f"""You are MediCare AI, a comprehensive healthcare assistant. 
+        return f"""You are MediCare AI, a comprehensive healthcare assistant. 
 
-User: {user_name if user_name else "User"}
 Service Selected: {selected_service if selected_service else "General Consultation"}
 
 {service_context}
@@ -71,10 +97,6 @@ PRIORITY ORDER:
 4. Insurance and appointment help
 5. Omicron/COVID info (lowest priority - only if specifically asked)
 
-User Query: {query}
-
-{omicron_context}
-
 Instructions:
 - Be professional, caring, and comprehensive
 - Prioritize general health guidance and service-specific help
@@ -85,129 +107,364 @@ Instructions:
 - Tailor response to selected service when relevant
 
 Response format: Professional, well-structured with clear sections and helpful guidance."""
-
-        try:
-            payload = {
-                "contents": [{
-                    "parts": [{
-                        "text": prompt
-                    }]
-                }],
-                "generationConfig": {
-                    "temperature": 0.7,
-                    "topK": 40,
-                    "topP": 0.95,
-                    "maxOutputTokens": 1200,
-                }
-            }
+    
+    def build_gemini_prompt(self, query: str, user_name: str = "", selected_service: str = "",
+                            session_id: str = DEFAULT_SESSION) -> str:
+        """Create the per-request part of the Gemini prompt for a query (see build_gemini_system_instruction)."""
+        prompt = self.assemble_gemini_prompt(query, user_name, selected_service, session_id)
+        prompt_stats.record(prompt)
+        return prompt.text
+    
+    def assemble_gemini_prompt(self, query: str, user_name: str = "", selected_service: str = "",
+                               session_id: str = DEFAULT_SESSION) -> AssembledPrompt:
+        """The per-request Gemini prompt fitted into PROMPT_TOKEN_BUDGET, with its token breakdown.
+        
+        The system instruction (sent separately) and the question always fit; the
+        omicron context comes next, then the session's summary and recent history.
+        """
+        assembler = ContextAssembler(prompt_token_budget())
+        assembler.reserve("system", self.build_gemini_system_instruction(selected_service))
+        assembler.add("user", f"User: {user_name if user_name else 'User'}")
+        self.add_conversation(assembler, query, session_id)
+        assembler.add("query", f"User Query: {query}")
+        if "omicron" in query.lower() or "covid" in query.lower():
+            assembler.add("evidence", self.get_minimal_omicron_context(), PRIORITY_EVIDENCE)
+        return assembler.build()
+    
+    def build_gemini_payload(self, prompt: str, system_instruction: Optional[str] = None,
+                             cached_content: Optional[str] = None) -> Dict[str, Any]:
+        """Wrap a prompt in a Gemini generateContent request body."""
+        return AsyncGeminiClient.build_payload(prompt, {
+            "temperature": 0.7,
+            "topK": 40,
+            "topP": 0.95,
+            "maxOutputTokens": 1200,
+        }, system_instruction, cached_content)
+    
+    def create_cached_content(self, key: str, system_instruction: str) -> Optional[str]:
+        """Register a system instruction with Gemini's cachedContents API; its name, or None."""
+        import requests
+        
+        url = f"{self.gemini_api_base}/v1beta/cachedContents?key={self.gemini_api_key}"
+        body = cached_content_body(self.gemini_model, system_instruction, self.prefix_cache.ttl, key)
+        response = requests.post(url, json=body, timeout=30)
+        if response.status_code != 200:
+            print(f"❌ DEBUG: Gemini cachedContents error - Status: {response.status_code}, Response: {response.text[:200]}")
+            return None
+        return response.json().get("name")
+    
+    def update_cached_content(self, name: str) -> bool:
+        """Extend a cached system instruction by the prefix cache TTL."""
+        import requests
+        
+        url = f"{self.gemini_api_base}/v1beta/{name}?key={self.gemini_api_key}&updateMask=ttl"
+        response = requests.patch(url, json={"ttl": f"{int(self.prefix_cache.ttl)}s"}, timeout=30)
+        return response.status_code == 200
+    
+    def post_gemini(self, url: str, prompt: str, selected_service: str = "", **kwargs):
+        """POST a prompt with the service's system instruction, by cachedContents reference when cached."""
+        import requests
+        
+        system_instruction = self.build_gemini_system_instruction(selected_service)
+        cached_content = None
+        if self.prefix_cache is not None:
+            cached_content = self.prefix_cache.lookup(selected_service, system_instruction)
+        response = requests.post(url, json=self.build_gemini_payload(prompt, system_instruction, cached_content),
+                                 timeout=30, **kwargs)
+        if cached_content and response.status_code in STALE_CACHE_STATUSES:
+            # The cached prefix expired or was deleted upstream; resend it inline
+            response.close()
+            self.prefix_cache.invalidate(selected_service, cached_content)
+            response = requests.post(url, json=self.build_gemini_payload(prompt, system_instruction),
+                                     timeout=30, **kwargs)
+        return response
+    
+    def get_gemini_response(self, query: str, user_name: str = "", selected_service: str = "",
+                            session_id: str = DEFAULT_SESSION) -> str:
+        """Get response from Gemini API with comprehensive medical assistance.
+        
+        While Gemini's circuit breaker is open the call is skipped and the next
+        provider (or the default response) answers straight away.
+        """
+        prompt = self.build_gemini_prompt(query, user_name, selected_service, session_id)
+        system_instruction = self.build_gemini_system_instruction(selected_service)
+        priority = priority_for_service(selected_service)
+        
+        ai_response = None
+        breaker = get_breaker("gemini")
+        admission = breaker.allow_request()
+        if admission:
+            if self.acquire_gemini_quota(system_instruction + prompt, priority):
+                ai_response = breaker.call(self.request_gemini, prompt, query, selected_service, admission=admission)
+            else:
+                breaker.release(admission)
+        if ai_response:
+            return ai_response
+        
+        ai_response = self.api_handler.get_openai_response(prompt, system_instruction, priority=priority)
+        if ai_response:
+            return ai_response
             
+        print("🔄 DEBUG: Falling back to default response")
+        return self.get_fallback_response(query, user_name, selected_service)
+    
+    def acquire_gemini_quota(self, prompt: str, priority: int) -> bool:
+        """Wait for Gemini request/token quota; False if the quota queue cannot take the call."""
+        limiter = get_rate_limiter("gemini", self.gemini_api_key or "")
+        return limiter.try_acquire(estimate_tokens(prompt, 1200), priority)
+    
+    def request_gemini(self, prompt: str, query: str = "", selected_service: str = "") -> Optional[str]:
+        """Send a prompt to Gemini generateContent; None on any failure.
+        
+        Raises CallDeclined for a 429 or a blocked/empty answer, which say nothing
+        about Gemini's health (see CircuitBreaker.call).
+        """
+        try:
             print(f"🔍 DEBUG: Making Gemini API call for query: {query[:50]}...")
-            response = requests.post(url, json=payload, timeout=30)
+            response = self.post_gemini(self.get_gemini_url(), prompt, selected_service)
             print(f"🔍 DEBUG: Response status: {response.status_code}")
+            get_rate_limiter("gemini", self.gemini_api_key or "").record_response(
+                response.status_code, response.headers.get("Retry-After")
+            )
             
             if response.status_code == 200:
                 data = response.json()
-                if 'candidates' in data and len(data['candidates']) > 0:
-                    ai_response = data['candidates'][0]['content']['parts'][0]['text']
+                ai_response = candidate_text(data)
+                if ai_response:
                     print(f"✅ DEBUG: Gemini API success - response length: {len(ai_response)}")
                     return ai_response
-                else:
-                    print("❌ DEBUG: No candidates in Gemini response")
+                print("❌ DEBUG: No candidates in Gemini response")
+                raise CallDeclined(f"no answer: {blocked_reason(data) or 'no candidates'}")
             else:
                 print(f"❌ DEBUG: Gemini API error - Status: {response.status_code}, Response: {response.text[:200]}")
+                if response.status_code == 429:
+                    raise CallDeclined("quota exceeded (429)")
                     
+        except CallDeclined:
+            raise
         except Exception as e:
             print(f"❌ DEBUG: Gemini API exception: {e}")
-            
-        print("🔄 DEBUG: Falling back to default response")
-        return self.get_fallback_response(query, user_name, selected_service)
+        
+        return None
     
-    def process_ai_first_query(self, query: str) -> str:
+    def stream_response(self, user_input: str, user_name: str = "", selected_service: str = "",
+                        session_id: str = DEFAULT_SESSION) -> Iterator[str]:
+        """Yield the chatbot response in chunks as Gemini produces them.
+        
+        Records the conversation turn once the stream is exhausted, like get_response.
+        """
+        self.conversation_store.append(session_id, "user", user_input)
+        
+        chunks = []
+        try:
+            if self.gemini_api_key:
+                for chunk in self.stream_gemini_response(user_input, user_name, selected_service, session_id):
+                    chunks.append(chunk)
+                    yield chunk
+            if not chunks:
+                fallback = self.get_fallback_response(user_input, user_name, selected_service)
+                chunks.append(fallback)
+                yield fallback
+        finally:
+            self.conversation_store.append(session_id, "assistant", "".join(chunks))
+    
+    def stream_gemini_response(self, query: str, user_name: str = "", selected_service: str = "",
+                               session_id: str = DEFAULT_SESSION) -> Iterator[str]:
+        """Stream text chunks from Gemini streamGenerateContent; yields nothing on failure."""
+        prompt = self.build_gemini_prompt(query, user_name, selected_service, session_id)
+        system_instruction = self.build_gemini_system_instruction(selected_service)
+        breaker = get_breaker("gemini")
+        admission = breaker.allow_request()
+        if not admission:
+            return
+        if not self.acquire_gemini_quota(system_instruction + prompt, priority_for_service(selected_service)):
+            breaker.release(admission)
+            return
+        
+        url = self.get_gemini_url("streamGenerateContent") + "&alt=sse"
+        
+        started = time.perf_counter()
+        first_chunk_latency = None
+        declined = False
+        try:
+            print(f"🔍 DEBUG: Making streaming Gemini API call for query: {query[:50]}...")
+            with self.post_gemini(url, prompt, selected_service, stream=True) as response:
+                if response.status_code != 200:
+                    get_rate_limiter("gemini", self.gemini_api_key or "").record_response(
+                        response.status_code, response.headers.get("Retry-After")
+                    )
+                    print(f"❌ DEBUG: Gemini stream error - Status: {response.status_code}, Response: {response.text[:200]}")
+                    declined = response.status_code == 429
+                    return
+                for line in response.iter_lines(decode_unicode=True):
+                    text = parse_sse_chunk(line) if line else ""
+                    if text:
+                        if first_chunk_latency is None:
+                            first_chunk_latency = time.perf_counter() - started
+                        yield text
+                # A complete stream without text is a blocked or empty answer
+                declined = first_chunk_latency is None
+        except Exception as e:
+            print(f"❌ DEBUG: Gemini streaming exception: {e}")
+        finally:
+            if first_chunk_latency is not None:
+                breaker.record_success(first_chunk_latency, admission)
+            elif declined:
+                breaker.release(admission)
+            else:
+                breaker.record_failure(time.perf_counter() - started, admission)
+    
+    def classify(self, query: str) -> Intents:
+        """Every routing intent of a query, found in one pass (see intent_classifier.INTENT_KEYWORDS)."""
+        return self.intent_classifier.classify(query)
+    
+    def process_ai_first_query(self, query: str, session_id: str = DEFAULT_SESSION) -> str:
         """Process query using AI APIs as primary source with data context."""
         try:
-            # Get data context if available and relevant
-            data_context = self.get_data_context(query)
+            intents = self.classify(query)
+            
+            # Get data evidence if available and relevant
+            evidence = self.get_data_evidence(query, intents)
             
             # Determine if this is a medical/health query
-            if self.is_medical_health_query(query):
-                return self.handle_medical_ai_query(query, data_context)
+            if "medical" in intents:
+                return self.handle_medical_ai_query(query, session_id=session_id, intents=intents, evidence=evidence)
             else:
-                return self.handle_general_ai_query(query, data_context)
+                return self.handle_general_ai_query(query, evidence=evidence)
                 
         except Exception as e:
             return f"I apologize, but I encountered an error processing your request: {str(e)}. Please try again."
     
-    def get_data_context(self, query: str) -> str:
+    def get_data_context(self, query: str, intents: Optional[Intents] = None) -> str:
         """Get relevant data context from CSV if query is related to omicron/COVID."""
-        if not self.is_data_related_query(query):
-            return ""
+        return " ".join(truncate_to_tokens(item, EVIDENCE_ITEM_TOKENS) for item in self.get_data_evidence(query, intents))
+    
+    def get_data_evidence(self, query: str, intents: Optional[Intents] = None, limit: int = 5) -> List[str]:
+        """Facts from the CSV for a query about omicron/COVID, most important first.
+        
+        The dataset size, any trends asked about, then for questions about symptoms
+        or experiences the most relevant tweets; prompt builders keep as many as
+        their token budget allows.
+        """
+        intents = intents or self.classify(query)
+        if "data_context" not in intents:
+            return []
         
         try:
             # Get basic statistics
             stats = self.data_processor.get_statistics()
             if 'error' in stats:
-                return ""
+                return []
             
-            context = f"Dataset context: {stats['total_tweets']} omicron-related tweets available. "
+            evidence = [f"Dataset context: {stats['total_tweets']} omicron-related tweets available."]
             
-            # Try to get relevant data samples
-            if any(keyword in query.lower() for keyword in ['symptom', 'experience', 'recovery', 'fever', 'cough']):
-                # Get a few relevant tweets as examples
-                search_terms = self.extract_search_terms(query)
-                if search_terms:
-                    tweets = self.data_processor.search_tweets(search_terms[0], limit=3)
-                    if tweets:
-                        context += f"Sample experiences from data: "
-                        for tweet in tweets[:2]:
-                            text = tweet.get('text', '')[:100]
-                            if text:
-                                context += f'"{text}..." '
+            if "trend" in intents:
+                trends = self.describe_trends(query)
+                if trends:
+                    evidence.append(f"Trends from data: {trends}")
+            
+            # Add the most relevant tweets for all the search terms as evidence
+            search_terms = self.extract_search_terms(query, limit=None) if "data_samples" in intents else []
+            if search_terms:
+                if self.data_processor.semantic_index is not None:
+                    tweets = self.data_processor.semantic_search_tweets(query, limit=limit, columns=['text'])
+                else:
+                    tweets = self.data_processor.rank_tweets(" ".join(search_terms), limit=limit, columns=['text'])
+                for tweet in tweets:
+                    text = str(tweet.get('text', '')).strip()
+                    if text:
+                        evidence.append(f'Experience from data: "{text}"')
             
-            return context
+            return evidence
             
         except Exception as e:
-            return ""
+            return []
     
     def is_data_related_query(self, query: str) -> bool:
         """Check if query might benefit from data context."""
-        data_keywords = [
-            'omicron', 'covid', 'coronavirus', 'symptom', 'experience', 
-            'recovery', 'people', 'tweet', 'social media', 'report'
-        ]
-        return any(keyword in query.lower() for keyword in data_keywords)
+        return "data_context" in self.classify(query)
+    
+    def is_trend_query(self, query: str) -> bool:
+        """Check if query asks how something changed over time."""
+        return "trend" in self.classify(query)
+    
+    def describe_trends(self, query: str) -> str:
+        """Weekly tweet counts by sentiment for the location, month and symptom named in the query."""
+        query_lower = query.lower()
+        location = next((name for name in self.data_processor.trends.locations()
+                         if re.search(rf'\b{re.escape(name.lower())}\b', query_lower)), None)
+        keyword = next((word for word in SENTIMENT_KEYWORDS["Symptoms"]
+                        if re.search(rf'\b{word}\b', query_lower)), None)
+        start, end = self.extract_month(query_lower)
+        
+        trends = self.data_processor.query_trends(location=location, keyword=keyword, start=start, end=end,
+                                                  freq="W", group_by="sentiment")
+        if 'error' in trends or not trends['periods']:
+            return ""
+        
+        scope = " ".join(part for part in [
+            f"mentioning {keyword}" if keyword else "",
+            f"in {location}" if location else "",
+            f"from {start} to {end}" if start else ""
+        ] if part)
+        weeks = []
+        for i, period in enumerate(trends['periods']):
+            counts = ", ".join(f"{group} {values[i]}" for group, values in trends['series'].items())
+            weeks.append(f"week of {period}: {counts}")
+        return f"Tweets {scope} by sentiment ({trends['total']} total) - " + "; ".join(weeks)
+    
+    def extract_month(self, query_lower: str) -> tuple:
+        """First and last day of a month named in the query, or (None, None).
+        
+        Without an explicit year, the latest such month in the dataset is used.
+        """
+        month = None
+        for number in range(1, 13):
+            names = {calendar.month_name[number].lower(), calendar.month_abbr[number].lower()}
+            pattern = rf'\b({"|".join(names)})\b'
+            if names == {"may"}:
+                # "May" only counts as a month next to a preposition or a year
+                pattern = r'\b(in|over|during|since|through)\s+may\b|\bmay\s+(19|20)\d{2}\b'
+            if re.search(pattern, query_lower):
+                month = number
+                break
+        if month is None:
+            return None, None
+        
+        year_match = re.search(r'\b(19|20)\d{2}\b', query_lower)
+        if year_match:
+            year = int(year_match.group(0))
+        else:
+            stats = self.data_processor.get_statistics()
+            if not stats.get('date_range'):
+                return None, None
+            last = stats['date_range']['end']
+            year = int(last[:4]) if month <= int(last[5:7]) else int(last[:4]) - 1
+        return f"{year}-{month:02d}-01", f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
     
     def is_medical_health_query(self, query: str) -> bool:
         """Enhanced medical query detection."""
-        medical_keywords = [
-            'symptom', 'disease', 'medicine', 'treatment', 'doctor', 'hospital',
-            'health', 'medical', 'diagnosis', 'cure', 'therapy', 'medication',
-            'covid', 'omicron', 'virus', 'vaccine', 'infection', 'fever',
-            'cough', 'pain', 'sick', 'illness', 'patient', 'clinic', 'headache',
-            'fatigue', 'sore throat', 'body ache', 'recovery', 'quarantine',
-            'isolation', 'test', 'positive', 'negative', 'healthcare'
-        ]
-        
-        query_lower = query.lower()
-        return any(keyword in query_lower for keyword in medical_keywords)
+        return "medical" in self.classify(query)
     
-    def handle_medical_ai_query(self, query: str, data_context: str = "") -> str:
+    def handle_medical_ai_query(self, query: str, data_context: str = "", session_id: str = DEFAULT_SESSION,
+                                intents: Optional[Intents] = None, evidence: Optional[List[str]] = None) -> str:
         """Handle medical queries using AI with optional data context."""
         # Create comprehensive medical system message
         system_message = self.get_enhanced_medical_system_message()
         
         # Build context-aware prompt
-        full_prompt = self.build_medical_prompt(query, data_context)
+        full_prompt = self.build_medical_prompt(query, data_context, session_id, evidence)
         
         # Get AI response
         response = self.api_handler.get_fallback_response(full_prompt, system_message)
         
         # Add disclaimer if needed
-        if any(word in query.lower() for word in ['treatment', 'cure', 'medication', 'diagnosis']):
+        if "disclaimer" in (intents or self.classify(query)):
             response += "\n\n⚠️ **Medical Disclaimer**: This information is for educational purposes only. Always consult qualified healthcare professionals for medical advice, diagnosis, or treatment."
         
         return response
     
-    def handle_general_ai_query(self, query: str, data_context: str = "") -> str:
+    def handle_general_ai_query(self, query: str, data_context: str = "", evidence: Optional[List[str]] = None) -> str:
         """Handle general queries using AI."""
         system_message = (
             "You are a helpful AI assistant with knowledge about medical topics and COVID-19. "
@@ -215,9 +472,14 @@ Response format: Professional, well-structured with clear sections and helpful g
             "If discussing health topics, always remind users to consult healthcare professionals when appropriate."
         )
         
-        full_prompt = query
-        if data_context:
-            full_prompt = f"Context: {data_context}\n\nQuestion: {query}"
+        evidence = evidence if evidence is not None else [data_context]
+        assembler = ContextAssembler(prompt_token_budget())
+        assembler.reserve("system", system_message)
+        assembler.add_items("evidence", evidence, PRIORITY_EVIDENCE, header="Context:", item_tokens=EVIDENCE_ITEM_TOKENS)
+        assembler.add("query", f"Question: {query}" if any(evidence) else query)
+        prompt = assembler.build()
+        prompt_stats.record(prompt)
+        full_prompt = prompt.text
         
         response = self.api_handler.get_fallback_response(full_prompt, system_message)
         
@@ -242,28 +504,44 @@ Response format: Professional, well-structured with clear sections and helpful g
             "Remember: You're providing educational information, not personal medical advice."
         )
     
-    def build_medical_prompt(self, query: str, data_context: str = "") -> str:
+    def build_medical_prompt(self, query: str, data_context: str = "", session_id: str = DEFAULT_SESSION,
+                             evidence: Optional[List[str]] = None) -> str:
         """Build a comprehensive prompt for medical queries."""
-        prompt_parts = []
-        
-        if data_context:
-            prompt_parts.append(f"Available data context: {data_context}")
-        
-        # Add conversation context if available
-        if len(self.conversation_history) > 2:
-            recent_context = self.conversation_history[-4:]  # Last 2 exchanges
-            context_str = "Recent conversation:\n"
-            for msg in recent_context:
-                role = "User" if msg["role"] == "user" else "Assistant"
-                context_str += f"{role}: {msg['content'][:100]}...\n"
-            prompt_parts.append(context_str)
-        
-        prompt_parts.append(f"Current question: {query}")
-        
-        return "\n\n".join(prompt_parts)
+        prompt = self.assemble_medical_prompt(query, data_context, session_id, evidence)
+        prompt_stats.record(prompt)
+        return prompt.text
     
-    def extract_search_terms(self, query: str) -> List[str]:
-        """Extract search terms from user query."""
+    def assemble_medical_prompt(self, query: str, data_context: str = "", session_id: str = DEFAULT_SESSION,
+                                evidence: Optional[List[str]] = None) -> AssembledPrompt:
+        """The medical prompt fitted into PROMPT_TOKEN_BUDGET, with its token breakdown.
+        
+        The system message and question always fit; data evidence comes next, best
+        items first, then the summary of compacted turns, and the recent conversation
+        history fills what is left, newest first.
+        """
+        assembler = ContextAssembler(prompt_token_budget())
+        assembler.reserve("system", self.get_enhanced_medical_system_message())
+        assembler.add_items("evidence", evidence if evidence is not None else [data_context], PRIORITY_EVIDENCE,
+                            header="Available data context:", item_tokens=EVIDENCE_ITEM_TOKENS)
+        self.add_conversation(assembler, query, session_id)
+        assembler.add("query", f"Current question: {query}")
+        return assembler.build()
+    
+    def add_conversation(self, assembler: ContextAssembler, query: str, session_id: str = DEFAULT_SESSION):
+        """Add a session's summary of compacted turns and its recent messages to a prompt."""
+        # The current question is already the last history entry when asked through get_response
+        history = self.conversation_store.history(session_id, include_summary=True)
+        if history and history[-1]["role"] == "user" and history[-1]["content"] == query:
+            history = history[:-1]
+        if history and history[0]["role"] == SUMMARY_ROLE:
+            assembler.add("summary", f"Conversation so far:\n{history[0]['content']}", PRIORITY_HISTORY)
+            history = history[1:]
+        messages = [f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" for msg in history]
+        assembler.add_items("history", messages, PRIORITY_HISTORY, header="Recent conversation:",
+                            keep_last=True, item_tokens=HISTORY_MESSAGE_TOKENS)
+    
+    def extract_search_terms(self, query: str, limit: Optional[int] = 3) -> List[str]:
+        """Extract search terms from user query (the first `limit`, or all with None)."""
         # Remove common question words and find meaningful terms
         stop_words = {'search', 'find', 'about', 'related', 'to', 'for', 'tweets', 'data', 'omicron', 'show', 'me', 'what', 'how', 'when', 'where', 'why'}
         words = re.findall(r'\b\w+\b', query.lower())
@@ -273,7 +551,8 @@ Response format: Professional, well-structured with clear sections and helpful g
         quoted_terms = re.findall(r'"([^"]*)"', query)
         terms.extend(quoted_terms)
         
-        return terms[:3]  # Limit to 3 terms to avoid overly broad searches
+        # Substring searches use few terms to avoid overly broad results; ranking can take them all
+        return terms[:limit]
     
     # Keep legacy methods for backward compatibility
     def handle_data_query(self, query: str) -> str:
@@ -286,20 +565,15 @@ Response format: Professional, well-structured with clear sections and helpful g
     
     def is_data_query(self, query: str) -> bool:
         """Check if query is about omicron data analysis."""
-        data_keywords = [
-            'omicron', 'tweet', 'data', 'statistics', 'how many', 'count',
-            'analyze', 'search', 'find', 'show me', 'tweets about',
-            'dataset', 'csv', 'trends', 'summary'
-        ]
-        return any(keyword in query for keyword in data_keywords)
+        return "data_query" in self.classify(query)
     
     def handle_data_query(self, query: str) -> str:
         """Handle queries about omicron data."""
-        query_lower = query.lower()
+        intents = self.classify(query)
         
         try:
             # Statistics query
-            if any(word in query_lower for word in ['statistics', 'stats', 'how many', 'count', 'total']):
+            if "statistics" in intents:
                 stats = self.data_processor.get_statistics()
                 if 'error' in stats:
                     return "I'm sorry, I couldn't load the omicron data. Please make sure the CSV file is available."
@@ -317,7 +591,7 @@ Response format: Professional, well-structured with clear sections and helpful g
                 return response
             
             # Search query
-            elif any(word in query_lower for word in ['search', 'find', 'about', 'related to']):
+            elif "search" in intents:
                 # Extract search terms
                 search_terms = self.extract_search_terms(query)
                 if not search_terms:
@@ -325,7 +599,7 @@ Response format: Professional, well-structured with clear sections and helpful g
                 
                 results = []
                 for term in search_terms:
-                    tweets = self.data_processor.search_tweets(term, limit=5)
+                    tweets = self.data_processor.search_tweets(term, limit=5, columns=['text', 'text_clean'])
                     if tweets:
                         results.extend(tweets)
                 
@@ -346,7 +620,7 @@ Response format: Professional, well-structured with clear sections and helpful g
                 return response
             
             # Topic summary
-            elif any(word in query_lower for word in ['summary', 'summarize', 'tell me about']):
+            elif "summary" in intents:
                 topic = self.extract_topic(query)
                 if topic:
                     summary = self.data_processor.get_topic_summary(topic)
@@ -354,8 +628,15 @@ Response format: Professional, well-structured with clear sections and helpful g
                 else:
                     return "Please specify what topic you'd like me to summarize from the omicron data."
             
+            # Trends over time
+            elif "trend" in intents:
+                trends = self.describe_trends(query)
+                if not trends:
+                    return "I couldn't find dated tweets matching that trend question in the omicron data."
+                return f"📈 **Omicron Tweet Trends:**\n\n{trends}"
+            
             # Sentiment analysis
-            elif any(word in query_lower for word in ['sentiment', 'feeling', 'emotion', 'positive', 'negative']):
+            elif "sentiment" in intents:
                 keywords = self.data_processor.analyze_sentiment_keywords()
                 if not keywords:
                     return "I couldn't analyze sentiment from the current data."
@@ -363,11 +644,7 @@ Response format: Professional, well-structured with clear sections and helpful g
                 response = "😊 **Sentiment Analysis of Omicron Tweets:**\n\n"
                 
                 # Group keywords by type
-                positive_words = ['good', 'better', 'recovered', 'healing', 'hope', 'positive', 'mild']
-                negative_words = ['bad', 'worse', 'sick', 'severe', 'death', 'fear', 'worried', 'negative']
-                symptom_words = ['fever', 'cough', 'tired', 'headache', 'loss', 'taste', 'smell', 'sore', 'throat']
-                
-                for category, words in [("Positive", positive_words), ("Negative", negative_words), ("Symptoms", symptom_words)]:
+                for category, words in SENTIMENT_KEYWORDS.items():
                     response += f"**{category} mentions:**\n"
                     for word in words:
                         if word in keywords and keywords[word] > 0:
@@ -388,7 +665,7 @@ Response format: Professional, well-structured with clear sections and helpful g
         
         # Add context about having omicron data
         context = (
-            f"Context: I also have access to omicron tweet data with {len(self.data_processor.data) if not self.data_processor.data.empty else 0} tweets. "
+            f"Context: I also have access to omicron tweet data with {self.data_processor.get_statistics().get('total_tweets', 0)} tweets. "
             "If the question relates to omicron or COVID-19 experiences, I can reference this data.\n\n"
         )
         
@@ -408,24 +685,11 @@ Response format: Professional, well-structured with clear sections and helpful g
         response = self.api_handler.get_fallback_response(query, system_message)
         
         # Add suggestion to explore data if relevant
-        if any(word in query.lower() for word in ['covid', 'pandemic', 'health', 'social media']):
+        if "data_tip" in self.classify(query):
             response += "\n\n💡 *Tip: I also have omicron tweet data available. You can ask me to analyze or search through this data for insights!*"
         
         return response
     
-    def extract_search_terms(self, query: str) -> List[str]:
-        """Extract search terms from user query."""
-        # Remove common question words and find meaningful terms
-        stop_words = {'search', 'find', 'about', 'related', 'to', 'for', 'tweets', 'data', 'omicron', 'show', 'me'}
-        words = re.findall(r'\b\w+\b', query.lower())
-        terms = [word for word in words if word not in stop_words and len(word) > 2]
-        
-        # Also look for quoted phrases
-        quoted_terms = re.findall(r'"([^"]*)"', query)
-        terms.extend(quoted_terms)
-        
-        return terms[:3]  # Limit to 3 terms to avoid overly broad searches
-    
     def extract_topic(self, query: str) -> Optional[str]:
         """Extract topic from summary request."""
         # Look for pattern "about X" or "of X"
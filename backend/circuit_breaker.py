@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from collections import deque, Counter
+from typing import Optional, Dict, Any, Callable
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class Admission:
+    """A call let through by allow_request(); pass it back when recording the outcome.
+
+    Only the probe admissions of the current half-open period can close or re-open
+    the breaker, so slow calls admitted earlier cannot decide its state.
+    """
+    __slots__ = ("probe", "episode")
+
+    def __init__(self, probe: bool = False, episode: int = 0):
+        self.probe = probe
+        self.episode = episode
+
+
+class CallDeclined(Exception):
+    """Raised by a call the provider turned down for reasons that say nothing about its
+    health, such as an exhausted quota (429) or a safety block; it is not counted."""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, error_rate: float = 0.5,
+                 slow_call_seconds: float = 10.0, slow_rate: float = 0.5, open_seconds: float = 30.0,
+                 max_open_seconds: float = 300.0, half_open_probes: int = 1):
+        """Initialize a breaker that tracks the health of one provider.
+
+        The breaker opens when, over the last `window` calls (at least `min_calls`), the
+        failure rate reaches `error_rate` or the share of calls slower than
+        `slow_call_seconds` reaches `slow_rate`. After `open_seconds` it lets
+        `half_open_probes` probe requests through; a successful probe closes it, a failed
+        one re-opens it with the open period doubled (up to `max_open_seconds`).
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        self.open_seconds = open_seconds
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.half_open_episode = 0
+        self.rejected = 0
+        self.transitions: Counter = Counter()
+        self.avg_latency: Optional[float] = None
+        self._outcomes = deque(maxlen=window)  # (failed, slow) per call
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> Optional[Admission]:
+        """An admission if a call may go to the provider right now, None otherwise."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.time() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return None
+                self._transition(HALF_OPEN)
+
+            if self.state == HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_probes:
+                    self.rejected += 1
+                    return None
+                self.probes_in_flight += 1
+                return Admission(probe=True, episode=self.half_open_episode)
+            return Admission()
+
+    def record_success(self, latency: float, admission: Optional[Admission] = None):
+        self._record(False, latency, admission)
+
+    def record_failure(self, latency: float, admission: Optional[Admission] = None):
+        self._record(True, latency, admission)
+
+    def release(self, admission: Optional[Admission]):
+        """Give back an admission without recording an outcome (the call was not sent,
+        or was declined for reasons unrelated to the provider's health)."""
+        with self._lock:
+            if self._is_current_probe(admission):
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def call(self, func: Callable[..., Optional[Any]], *args, admission: Optional[Admission] = None,
+             **kwargs) -> Optional[Any]:
+        """Run `func` through the breaker; a None result or an exception counts as a failure.
+
+        Pass an `admission` already obtained from allow_request() (e.g. before waiting
+        for quota); a CallDeclined from `func` releases it and returns None.
+        """
+        admission = admission or self.allow_request()
+        if not admission:
+            return None
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except CallDeclined as e:
+            print(f"Circuit breaker '{self.name}': not counting declined call ({e})")
+            self.release(admission)
+            return None
+        except Exception:
+            self.record_failure(time.perf_counter() - started, admission)
+            raise
+        if result:
+            self.record_success(time.perf_counter() - started, admission)
+        else:
+            self.record_failure(time.perf_counter() - started, admission)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                "state": self.state,
+                "recent_calls": calls,
+                "error_rate": round(sum(f for f, _ in self._outcomes) / calls, 3) if calls else 0.0,
+                "slow_rate": round(sum(s for _, s in self._outcomes) / calls, 3) if calls else 0.0,
+                "avg_latency": round(self.avg_latency, 3) if self.avg_latency is not None else None,
+                "rejected": self.rejected,
+                "transitions": dict(self.transitions)
+            }
+
+    def _is_current_probe(self, admission: Optional[Admission]) -> bool:
+        return (admission is not None and admission.probe and self.state == HALF_OPEN
+                and admission.episode == self.half_open_episode)
+
+    def _record(self, failed: bool, latency: float, admission: Optional[Admission] = None):
+        with self._lock:
+            self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+            slow = latency >= self.slow_call_seconds
+
+            if self.state == HALF_OPEN:
+                # Only this period's probes decide; calls admitted before it opened are stragglers
+                if not self._is_current_probe(admission):
+                    return
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                if failed or slow:
+                    self.open_seconds = min(self.open_seconds * 2, self.max_open_seconds)
+                    self._transition(OPEN)
+                else:
+                    self.open_seconds = self.base_open_seconds
+                    self._outcomes.clear()
+                    self._transition(CLOSED)
+                return
+
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if self.state == CLOSED and calls >= self.min_calls:
+                failures = sum(f for f, _ in self._outcomes)
+                slow_calls = sum(s for _, s in self._outcomes)
+                if failures / calls >= self.error_rate or slow_calls / calls >= self.slow_rate:
+                    self._transition(OPEN)
+
+    def _transition(self, state: str):
+        self.transitions[f"{self.state}->{state}"] += 1
+        print(f"Circuit breaker '{self.name}': {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.time()
+            self.probes_in_flight = 0
+        elif state == HALF_OPEN:
+            self.half_open_episode += 1
+            self.probes_in_flight = 0
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-wide breaker for a provider, configured by CIRCUIT_BREAKER_* environment variables."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                window=int(os.getenv('CIRCUIT_BREAKER_WINDOW', '20')),
+                min_calls=int(os.getenv('CIRCUIT_BREAKER_MIN_CALLS', '5')),
+                error_rate=float(os.getenv('CIRCUIT_BREAKER_ERROR_RATE', '0.5')),
+                slow_call_seconds=float(os.getenv('CIRCUIT_BREAKER_SLOW_CALL_SECONDS', '10')),
+                slow_rate=float(os.getenv('CIRCUIT_BREAKER_SLOW_RATE', '0.5')),
+                open_seconds=float(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', '30')),
+                max_open_seconds=float(os.getenv('CIRCUIT_BREAKER_MAX_OPEN_SECONDS', '300')),
+                half_open_probes=int(os.getenv('CIRCUIT_BREAKER_HALF_OPEN_PROBES', '1'))
+            )
+        return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """State of every provider breaker, for the health endpoint."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
@@ -0,0 +1,249 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional, List, Dict, Any, Tuple
+
+DEFAULT_SESSION = "default"
+
+# Role of the pseudo-message carrying a session's summary of its compacted turns
+SUMMARY_ROLE = "summary"
+
+
+class _Session:
+    __slots__ = ("messages", "chars", "last_access", "summary", "offset", "compacting")
+
+    def __init__(self, max_messages: int):
+        self.messages = deque(maxlen=max_messages)
+        self.chars = 0
+        self.last_access = time.time()
+        self.summary = ""
+        self.offset = 0          # messages removed from the front so far, by the ring buffer or compaction
+        self.compacting = False  # a summary of the older messages is being written
+
+
+class ConversationStore:
+    def __init__(self, max_messages: int = 20, idle_ttl: float = 3600, max_total_chars: int = 50_000_000,
+                 db_path: Optional[str] = None):
+        """Initialize a session-keyed conversation store.
+
+        Each session keeps its last `max_messages` messages in a ring buffer. Sessions idle
+        for longer than `idle_ttl` seconds are evicted, and least recently used sessions are
+        evicted whenever the stored text across all sessions exceeds `max_total_chars`.
+        With `db_path`, messages are also written to SQLite and evicted sessions are
+        restored from there on their next access.
+        """
+        self.max_messages = max_messages
+        self.idle_ttl = idle_ttl
+        self.max_total_chars = max_total_chars
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._total_chars = 0
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.compactions = 0
+        self.summarizer = None
+
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+                "role TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS conversation_messages_session ON conversation_messages (session_id, id)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_summaries ("
+                "session_id TEXT PRIMARY KEY, summary TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def append(self, session_id: str, role: str, content: str):
+        """Add a message to a session's history.
+
+        With a summarizer attached, a session reaching its threshold is queued for
+        compaction; the summary is written in the background, not on this call.
+        """
+        with self._lock:
+            session = self._get_session(session_id)
+            if len(session.messages) == session.messages.maxlen:
+                dropped = session.messages[0]
+                session.chars -= len(dropped["content"])
+                self._total_chars -= len(dropped["content"])
+                session.offset += 1
+            session.messages.append({"role": role, "content": content})
+            session.chars += len(content)
+            self._total_chars += len(content)
+
+            if self._db is not None:
+                self._persist(session_id, role, content)
+
+            self._evict(keep=session_id)
+
+            summarizer = self.summarizer
+            compact = (summarizer is not None and not session.compacting
+                       and len(session.messages) >= min(summarizer.threshold, self.max_messages))
+            if compact:
+                session.compacting = True
+        if compact:
+            summarizer.schedule(session_id)
+
+    def history(self, session_id: str, last_n: Optional[int] = None,
+                include_summary: bool = False) -> List[Dict[str, str]]:
+        """A copy of a session's messages, oldest first (optionally only the last `last_n`).
+
+        With `include_summary`, a session with compacted turns starts with a
+        SUMMARY_ROLE message holding their summary.
+        """
+        with self._lock:
+            if session_id not in self._sessions and self._db is None:
+                return []
+            session = self._get_session(session_id)
+            messages = list(session.messages)
+            summary = session.summary
+        messages = messages[-last_n:] if last_n else messages
+        if include_summary and summary:
+            messages.insert(0, {"role": SUMMARY_ROLE, "content": summary})
+        return messages
+
+    def compaction_batch(self, session_id: str, keep_recent: int) -> Tuple[str, List[Dict[str, str]], int]:
+        """What a summarizer should fold together: the current summary, the messages
+        before the last `keep_recent`, and the position to pass to compact()."""
+        with self._lock:
+            session = self._get_session(session_id)
+            count = max(0, len(session.messages) - keep_recent)
+            return session.summary, list(session.messages)[:count], session.offset + count
+
+    def compact(self, session_id: str, summary: Optional[str], upto: int = 0):
+        """Replace the messages before position `upto` with `summary`, which covers them and
+        any earlier summary. A `summary` of None only ends the pending compaction.
+
+        Messages appended while the summary was written are kept.
+        """
+        with self._lock:
+            # A session evicted meanwhile is reloaded later without the summarized positions
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            session.compacting = False
+            if summary is None:
+                return
+            removed = 0
+            while session.messages and session.offset < upto:
+                removed += len(session.messages.popleft()["content"])
+                session.offset += 1
+            removed += len(session.summary) - len(summary)
+            session.summary = summary
+            session.chars -= removed
+            self._total_chars -= removed
+            self.compactions += 1
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO conversation_summaries (session_id, summary, updated_at) VALUES (?, ?, ?)",
+                    (session_id, summary, time.time())
+                )
+                self._trim_persisted(session_id, len(session.messages))
+                self._db.commit()
+
+    def clear(self, session_id: str):
+        """Forget a session, including any persisted messages."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._total_chars -= session.chars
+            if self._db is not None:
+                self._db.execute("DELETE FROM conversation_messages WHERE session_id = ?", (session_id,))
+                self._db.execute("DELETE FROM conversation_summaries WHERE session_id = ?", (session_id,))
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "stored_chars": self._total_chars,
+            "evictions": self.evictions,
+            "compactions": self.compactions,
+            "persistent": self._db is not None
+        }
+
+    def _get_session(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session(self.max_messages)
+            if self._db is not None:
+                for message in self._load(session_id):
+                    session.messages.append(message)
+                    session.chars += len(message["content"])
+                session.summary = self._load_summary(session_id)
+                session.chars += len(session.summary)
+                self._total_chars += session.chars
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_access = time.time()
+        return session
+
+    def _evict(self, keep: str):
+        """Drop idle sessions, then least recently used ones while over the memory cap."""
+        now = time.time()
+        if now - self._last_sweep >= min(self.idle_ttl, 60):
+            self._last_sweep = now
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if now - session.last_access < self.idle_ttl:
+                    break
+                self._drop(session_id)
+
+        while self._total_chars > self.max_total_chars and len(self._sessions) > 1:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._drop(session_id)
+
+    def _drop(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self._total_chars -= session.chars
+        self.evictions += 1
+
+    def _persist(self, session_id: str, role: str, content: str):
+        self._db.execute(
+            "INSERT INTO conversation_messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+            (session_id, role, content, time.time())
+        )
+        # Keep only what the ring buffer could hold
+        self._trim_persisted(session_id, self.max_messages)
+        self._db.commit()
+
+    def _trim_persisted(self, session_id: str, keep: int):
+        self._db.execute(
+            "DELETE FROM conversation_messages WHERE session_id = ? AND id NOT IN ("
+            "SELECT id FROM conversation_messages WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+            (session_id, session_id, keep)
+        )
+
+    def _load(self, session_id: str) -> List[Dict[str, str]]:
+        rows = self._db.execute(
+            "SELECT role, content FROM conversation_messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.max_messages)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def _load_summary(self, session_id: str) -> str:
+        row = self._db.execute(
+            "SELECT summary FROM conversation_summaries WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else ""
+
+
+def create_conversation_store() -> ConversationStore:
+    """Build the conversation store configured by CONVERSATION_* environment variables."""
+    return ConversationStore(
+        max_messages=int(os.getenv('CONVERSATION_MAX_MESSAGES', '20')),
+        idle_ttl=float(os.getenv('CONVERSATION_IDLE_TTL', '3600')),
+        max_total_chars=int(os.getenv('CONVERSATION_MAX_CHARS', '50000000')),
+        db_path=os.getenv('CONVERSATION_DB_PATH') or None
+    )
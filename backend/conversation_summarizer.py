@@ -0,0 +1,217 @@
+import math
+import os
+import queue
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from conversation_store import ConversationStore
+from prompt_builder import count_tokens, truncate_to_tokens
+from search_index import tokenize
+
+# Words that say nothing about what a conversation was about, ignored when scoring sentences
+STOP_WORDS = frozenset("""
+a about am an and any are as at be been but by can could did do does for from had has have how i if in is
+it its just me my no not of on or our so than that the their them then there these they this to too up us
+was we were what when where which who why will with would you your yes ok okay please thanks thank hi hello
+""".split())
+
+# Share of content words two sentences may have in common before the later-ranked one is left out
+REDUNDANT_OVERLAP = 0.6
+
+# Largest part of a single message passed to the LLM summarizer, in tokens
+SUMMARY_MESSAGE_TOKENS = 400
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+_SUMMARY_LINE_RE = re.compile(r'^(User|Assistant): (.*)$')
+_DECORATION_RE = re.compile(r'^[\W_]+|\*\*')
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences of a message with list markers, emojis and bold markup removed."""
+    sentences = (_DECORATION_RE.sub('', part).strip() for part in _SENTENCE_RE.split(text))
+    return [sentence for sentence in sentences if len(sentence) > 2]
+
+
+def extractive_summary(previous: str, messages: List[Dict[str, str]], max_tokens: int = 300) -> str:
+    """Summarize a conversation locally by keeping its most informative sentences.
+
+    Sentences of the previous summary and of the new messages are scored by how
+    often their content words recur across the conversation (the user's sentences
+    count extra, since they carry the symptoms and questions). The best ones that
+    do not repeat a sentence already kept are returned in conversation order, one
+    "User: " or "Assistant: " line each, up to `max_tokens`.
+    """
+    candidates: List[Tuple[str, str]] = []
+    for line in previous.splitlines():
+        match = _SUMMARY_LINE_RE.match(line.strip())
+        if match:
+            candidates.append((match.group(1), match.group(2)))
+    for message in messages:
+        role = "User" if message["role"] == "user" else "Assistant"
+        candidates.extend((role, sentence) for sentence in split_sentences(message["content"]))
+    if not candidates:
+        return previous
+
+    words = [[word for word in tokenize(sentence) if word not in STOP_WORDS and not word.isdigit()]
+             for _, sentence in candidates]
+    frequency: Dict[str, int] = {}
+    for sentence_words in words:
+        for word in set(sentence_words):
+            frequency[word] = frequency.get(word, 0) + 1
+
+    scores = []
+    for position, ((role, _), sentence_words) in enumerate(zip(candidates, words)):
+        distinct = set(sentence_words)
+        score = sum(frequency[word] for word in distinct) / math.sqrt(len(sentence_words) + 1)
+        scores.append((score * (1.5 if role == "User" else 1.0), position))
+
+    chosen, used = [], 0
+    for _, position in sorted(scores, key=lambda item: (-item[0], item[1])):
+        role, sentence = candidates[position]
+        distinct = set(words[position])
+        # Skip sentences that mostly repeat one already kept (e.g. the same advice given twice)
+        if any(len(distinct & set(words[other])) > REDUNDANT_OVERLAP * len(distinct | set(words[other]))
+               for other in chosen):
+            continue
+        cost = count_tokens(f"{role}: {sentence}")
+        if used + cost <= max_tokens:
+            chosen.append(position)
+            used += cost
+    return "\n".join(f"{candidates[position][0]}: {candidates[position][1]}" for position in sorted(chosen))
+
+
+def summary_prompt(previous: str, messages: List[Dict[str, str]], max_tokens: int = 300) -> str:
+    """The LLM request to fold `messages` into the running summary `previous`."""
+    transcript = "\n".join(
+        f"{'User' if message['role'] == 'user' else 'Assistant'}: "
+        f"{truncate_to_tokens(message['content'], SUMMARY_MESSAGE_TOKENS)}"
+        for message in messages
+    )
+    earlier = f"Summary so far:\n{previous}\n\n" if previous else ""
+    return f"""Update the summary of this conversation between a user and MediCare AI, a healthcare assistant.
+
+{earlier}New messages:
+{transcript}
+
+Write at most {max_tokens * 3 // 4} words. Keep the user's symptoms, conditions, medications, dates and
+open questions, and the main advice given. Write plain lines starting with "User: " or "Assistant: ",
+with no headings or formatting."""
+
+
+class ConversationSummarizer:
+    def __init__(self, store: ConversationStore, complete: Optional[Callable[[str], Optional[str]]] = None,
+                 threshold: int = 16, keep_recent: int = 6, max_tokens: int = 300):
+        """Initialize a background worker that compacts long sessions of `store`.
+
+        Once a session holds `threshold` messages, all but the last `keep_recent`
+        are folded into the session's running summary, which later prompts use in
+        their place. `complete` sends a prompt to an LLM and returns its answer (or
+        None); without it, or when it fails, the summary is extractive. The work
+        runs on a daemon thread, never on the request that crossed the threshold.
+        """
+        self.store = store
+        self.complete = complete
+        self.threshold = max(threshold, keep_recent + 2)
+        self.keep_recent = keep_recent
+        self.max_tokens = max_tokens
+        self.summaries = 0
+        self.llm_summaries = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        store.summarizer = self
+
+    def schedule(self, session_id: str):
+        """Queue a session for compaction, starting the worker on first use."""
+        self.start()
+        self._queue.put(session_id)
+
+    def summarize(self, previous: str, messages: List[Dict[str, str]]) -> str:
+        """New running summary covering `previous` and `messages`."""
+        if self.complete is not None:
+            try:
+                summary = self.complete(summary_prompt(previous, messages, self.max_tokens))
+                if summary and summary.strip():
+                    self.llm_summaries += 1
+                    return truncate_to_tokens(summary.strip(), self.max_tokens)
+            except Exception as e:
+                print(f"LLM summary failed, using an extractive one: {e}")
+        return extractive_summary(previous, messages, self.max_tokens)
+
+    def compact(self, session_id: str):
+        """Fold the older messages of one session into its summary."""
+        previous, messages, upto = self.store.compaction_batch(session_id, self.keep_recent)
+        summary = None
+        try:
+            if messages:
+                started = time.perf_counter()
+                summary = self.summarize(previous, messages)
+                self.total_seconds += time.perf_counter() - started
+                self.summaries += 1
+        except Exception as e:
+            self.failures += 1
+            print(f"Conversation summary error: {e}")
+        finally:
+            self.store.compact(session_id, summary, upto)
+
+    def run(self):
+        while True:
+            session_id = self._queue.get()
+            if session_id is None:
+                break
+            try:
+                self.compact(session_id)
+            except Exception as e:
+                print(f"Conversation summarizer error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name="conversation-summarizer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Finish the queued sessions (up to `timeout` seconds) and stop the worker."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=timeout)
+
+    def wait(self):
+        """Block until every queued session has been compacted."""
+        self._queue.join()
+
+    def stats(self) -> dict:
+        return {
+            "threshold_messages": self.threshold,
+            "keep_recent": self.keep_recent,
+            "queued": self._queue.qsize(),
+            "summaries": self.summaries,
+            "llm_summaries": self.llm_summaries,
+            "failures": self.failures,
+            "average_ms": round(self.total_seconds / self.summaries * 1000, 1) if self.summaries else 0
+        }
+
+
+def create_conversation_summarizer(store: ConversationStore,
+                                   complete: Optional[Callable[[str], Optional[str]]] = None
+                                   ) -> Optional[ConversationSummarizer]:
+    """Summarizer for `store` configured by CONVERSATION_SUMMARIZE_AFTER (messages, 0 disables),
+    CONVERSATION_KEEP_RECENT, CONVERSATION_SUMMARY_TOKENS and CONVERSATION_SUMMARY_MODE
+    ("llm" uses `complete` when given, "extractive" never calls an LLM)."""
+    threshold = int(os.getenv('CONVERSATION_SUMMARIZE_AFTER', '0'))
+    if threshold <= 0:
+        return None
+    if os.getenv('CONVERSATION_SUMMARY_MODE', 'llm').lower() == 'extractive':
+        complete = None
+    return ConversationSummarizer(
+        store,
+        complete,
+        threshold=threshold,
+        keep_recent=int(os.getenv('CONVERSATION_KEEP_RECENT', '6')),
+        max_tokens=int(os.getenv('CONVERSATION_SUMMARY_TOKENS', '300'))
+    )
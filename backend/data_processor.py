@@ -1,33 +1,559 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Any
+from pandas.api.types import union_categoricals
+from typing import Iterable, List, Dict, Any, Optional, Callable, Tuple, Union
+import functools
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
+from search_index import InvertedIndex, tokenize_documents
+from keyword_matcher import KeywordMatcher, KeywordCounts
+from trend_cube import TrendCube
+from semantic_index import SemanticIndex, create_semantic_index, semantic_nprobe, semantic_search_enabled
+from dataset_cache import create_dataset_cache
+from tweet_results import FrameParts, TweetResults
+from live_ingest import FilePosition, file_position, is_continuation, read_appended_rows
+
+_URL_RE = re.compile(r'http\S+|www\S+|https\S+')
+_MENTION_RE = re.compile(r'@\w+|#')
+_SPACE_RE = re.compile(r'\s+')
+
+# Batches are cleaned as one string joined on a whitespace control character, so no
+# pattern can match across two rows
+_ROW_SEPARATOR = '\x1e'
+
+CLEAN_BATCH_ROWS = 100_000
+
+# Low-cardinality string columns stored as categoricals
+CATEGORY_COLUMNS = ['user', 'location', 'sentiment']
+
+# Source columns (lowercased) that hold the tweet text, and every column the chatbot reads
+TEXT_COLUMNS = {'text', 'tweet', 'content', 'message'}
+KNOWN_COLUMNS = TEXT_COLUMNS | {'id', 'date', 'created_at', 'timestamp', 'time'} | set(CATEGORY_COLUMNS)
+
+# Words counted for the sentiment overview, by category; counted as whole words while loading
+SENTIMENT_KEYWORDS = {
+    "Positive": ['good', 'better', 'recovered', 'healing', 'hope', 'positive', 'mild'],
+    "Negative": ['bad', 'worse', 'sick', 'severe', 'death', 'fear', 'worried', 'negative'],
+    "Symptoms": ['fever', 'cough', 'tired', 'headache', 'loss', 'taste', 'smell', 'sore', 'throat']
+}
+
+def clean_text(text: str) -> str:
+    """Clean tweet text."""
+    if pd.isna(text):
+        return ""
+    
+    # Remove URLs
+    text = _URL_RE.sub('', text)
+    # Remove user mentions and hashtags symbols
+    text = _MENTION_RE.sub('', text)
+    # Remove extra whitespace
+    text = _SPACE_RE.sub(' ', text).strip()
+    
+    return text
+
+def clean_text_batch(texts: List[str]) -> List[str]:
+    """Clean a batch of texts with one regex pass per pattern; same output as clean_text per row.
+    
+    str.split() splits on exactly the characters `\\s` matches, so splitting and
+    re-joining each row replaces the whitespace regex pass.
+    """
+    joined = _ROW_SEPARATOR.join(texts)
+    if joined.count(_ROW_SEPARATOR) != len(texts) - 1:
+        # The separator occurs in the data itself
+        return [clean_text(text) for text in texts]
+    
+    joined = _URL_RE.sub('', joined)
+    joined = _MENTION_RE.sub('', joined)
+    return [' '.join(text.split()) for text in joined.split(_ROW_SEPARATOR)]
+
+def clean_text_column(texts: pd.Series, executor: Optional[Executor] = None) -> pd.Series:
+    """Clean a string column in batches, spread over `executor` (e.g. a process pool) if given."""
+    values = texts.tolist()
+    batches = [values[i:i + CLEAN_BATCH_ROWS] for i in range(0, len(values), CLEAN_BATCH_ROWS)]
+    if executor is not None and len(batches) > 1:
+        cleaned = list(executor.map(clean_text_batch, batches))
+    else:
+        cleaned = [clean_text_batch(batch) for batch in batches]
+    return pd.Series([text for batch in cleaned for text in batch], index=texts.index, dtype=texts.dtype)
+
+def concat_chunks(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate prepared chunks, merging per-chunk categories instead of falling back to strings."""
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    
+    categorical = [column for column in frames[0].columns
+                   if any(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames)]
+    data = pd.concat([frame.drop(columns=categorical) for frame in frames], ignore_index=True)
+    for column in categorical:
+        parts = [frame[column] for frame in frames]
+        try:
+            data[column] = union_categoricals([part.astype('category') for part in parts])
+        except TypeError:
+            # A chunk held no strings for this column (e.g. all missing), so its categories differ in type
+            data[column] = pd.concat(parts, ignore_index=True).astype(object).astype('category')
+    return data[frames[0].columns]
+
+# Summaries remembered per dataset version; the oldest are dropped beyond this
+MEMO_MAX_ENTRIES = 512
+
+# Appended rows stay in frames of their own until they reach this share of the main frame
+# (and TAIL_MERGE_MIN_ROWS), so an append never copies the whole dataset; merging then
+# copies each row a bounded number of times
+TAIL_MERGE_FRACTION = 0.05
+TAIL_MERGE_MIN_ROWS = 10_000
+# Appended frames are merged with one another beyond this many, to keep lookups cheap
+TAIL_MAX_FRAMES = 32
+
+_MISSING = object()
+
+def memoized(method):
+    """Remember a processor method's result per dataset version and arguments.
+    
+    The memo is replaced whenever the data is reloaded or rows are removed, so a result
+    never outlives the data it was computed from; after appends it is kept for up to
+    DATA_SUMMARY_MAX_AGE seconds, so a steady feed does not recompute every summary
+    on each new row. Callers must not modify returned values.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        appended_at = self._appended_at
+        if appended_at is not None and time.monotonic() - appended_at >= self.summary_max_age:
+            self.advance_version()
+        memo = self._memo
+        key = (method.__name__,
+               tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args),
+               tuple(sorted((name, tuple(arg) if isinstance(arg, list) else arg) for name, arg in kwargs.items())))
+        value = memo.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        
+        value = method(self, *args, **kwargs)
+        with self._memo_lock:
+            # Results computed while the data changed underneath are not kept
+            if memo is self._memo:
+                memo[key] = value
+                if len(memo) > MEMO_MAX_ENTRIES:
+                    memo.popitem(last=False)
+        return value
+    return wrapper
+
+_shared_processors: Dict[str, "OmicronDataProcessor"] = {}
+_shared_processors_lock = threading.Lock()
+
+def get_data_processor(csv_path: str = "omicron_2025.csv") -> "OmicronDataProcessor":
+    """Process-wide shared processor for a CSV file.
+    
+    The file is loaded on first use only, and reloaded when its modification time changes.
+    """
+    key = os.path.abspath(csv_path)
+    with _shared_processors_lock:
+        processor = _shared_processors.get(key)
+        if processor is None:
+            processor = _shared_processors[key] = OmicronDataProcessor(csv_path)
+            return processor
+    
+    processor.reload_if_modified()
+    return processor
 
 class OmicronDataProcessor:
-    def __init__(self, csv_path: str = "omicron_2025.csv"):
-        """Initialize the data processor with omicron CSV data."""
+    def __init__(self, csv_path: str = "omicron_2025.csv",
+                 progress: Optional[Callable[[int, int, int], None]] = None):
+        """Initialize the data processor with omicron CSV data.
+        
+        `progress` is called after each chunk with (rows loaded, bytes read, file size);
+        by default progress is printed for files that take more than one chunk.
+        """
         self.csv_path = csv_path
+        # The main frame; rows appended since it was built wait in `tail` (see frame())
         self.data = None
+        self.tail: List[pd.DataFrame] = []
+        self.tail_rows = 0
+        self._frame_lock = threading.Lock()
+        # Buffers that text_lower and tombstones are views of while rows are appended
+        self._row_buffers: Dict[str, np.ndarray] = {}
+        self.search_index = InvertedIndex()
+        self.text_lower = np.empty(0, dtype=object)
+        self.keyword_matcher = KeywordMatcher(word for words in SENTIMENT_KEYWORDS.values() for word in words)
+        self.keyword_counts = KeywordCounts(self.keyword_matcher.keywords)
+        self.trends = TrendCube(self.keyword_matcher.keywords)
+        # Optional dense-vector index for search_tweets(mode="semantic"), see SEMANTIC_SEARCH
+        self.semantic_index: Optional[SemanticIndex] = None
+        self.loaded_mtime: Optional[float] = None
+        # How far the CSV was read, so rows appended to it later can be ingested on their own
+        self.loaded_position: Optional[FilePosition] = None
+        # Rows replaced by an upsert or deleted; they stay in the frame and indexes but are skipped
+        self.tombstones = np.zeros(0, dtype=bool)
+        self.removed_rows = 0
+        # Rows parsed, cleaned and indexed at a time; 0 reads the whole file at once
+        self.chunk_rows = int(os.getenv('DATA_CHUNK_ROWS', '100000'))
+        # Processes used to clean very large files; 1 keeps everything in-process
+        self.preprocess_workers = int(os.getenv('DATA_PREPROCESS_WORKERS', '1'))
+        self.progress = progress or self.print_progress
+        # Serializes reloads and appends; reentrant because a reload may ingest appended rows
+        self._reload_lock = threading.RLock()
+        # Bumped on every load or removal, and after appends once summaries are
+        # DATA_SUMMARY_MAX_AGE seconds behind; memoized summaries belong to one version
+        self.version = 0
+        self.summary_max_age = float(os.getenv('DATA_SUMMARY_MAX_AGE', '5'))
+        self._appended_at: Optional[float] = None
+        self._memo: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._memo_lock = threading.Lock()
         self.load_data()
     
     def load_data(self):
-        """Load and preprocess the omicron CSV data."""
+        """Load and preprocess the omicron CSV data, or its preprocessed copy from the dataset cache."""
+        with self._frame_lock:
+            self.tail, self.tail_rows = [], 0
         try:
-            self.data = pd.read_csv(self.csv_path)
-            self.preprocess_data()
-            print(f"Loaded {len(self.data)} omicron tweets")
+            self.loaded_mtime = self.get_file_mtime()
+            self.loaded_position = self.get_file_position()
+            if self.load_cached():
+                print(f"Loaded {len(self.data)} omicron tweets from cache")
+            else:
+                self.read_chunks()
+                print(f"Loaded {len(self.data)} omicron tweets")
+                self.save_cached()
+            self.tombstones = np.zeros(len(self.data), dtype=bool)
+            self.removed_rows = 0
+            self.semantic_index = None
+            if semantic_search_enabled():
+                self.load_semantic_index()
         except Exception as e:
             print(f"Error loading data: {e}")
             self.data = pd.DataFrame()
+            self.search_index = InvertedIndex()
+            self.text_lower = np.empty(0, dtype=object)
+            self.keyword_counts = KeywordCounts(self.keyword_matcher.keywords)
+            self.trends = TrendCube(self.keyword_matcher.keywords)
+            self.tombstones = np.zeros(0, dtype=bool)
+            self.removed_rows = 0
+            self.semantic_index = None
+        finally:
+            self.advance_version()
+    
+    def advance_version(self):
+        """Start a new dataset version, dropping every summary memoized for the previous one."""
+        with self._memo_lock:
+            self.version += 1
+            self._memo = OrderedDict()
+            self._appended_at = None
+    
+    def load_cached(self) -> bool:
+        """Load the frame and search structures from the dataset cache; False if there is no usable entry."""
+        cache = create_dataset_cache(self.csv_path)
+        if cache is None or not cache.exists():
+            return False
+        try:
+            (self.data, self.text_lower, self.search_index,
+             self.keyword_counts, self.trends) = cache.load(self.keyword_matcher.keywords)
+            return True
+        except Exception as e:
+            print(f"Ignoring unreadable dataset cache {cache.directory}: {e}")
+            return False
+    
+    def save_cached(self):
+        """Store the preprocessed data so the next process start can skip parsing the CSV."""
+        try:
+            cache = create_dataset_cache(self.csv_path)
+            if cache is not None and not self.data.empty:
+                cache.save(self.data, self.text_lower, self.search_index, self.keyword_counts, self.trends)
+        except Exception as e:
+            print(f"Could not write dataset cache: {e}")
+    
+    def load_semantic_index(self):
+        """Load the semantic index stored with the dataset cache, or build it (and store it there)."""
+        cache = create_dataset_cache(self.csv_path)
+        directory = cache.semantic_directory if cache is not None and cache.exists() else None
+        if directory and SemanticIndex.exists(directory):
+            try:
+                self.semantic_index = SemanticIndex.load(directory, semantic_nprobe())
+                return
+            except Exception as e:
+                print(f"Ignoring unreadable semantic index {directory}: {e}")
+        
+        print(f"Building semantic index for {len(self.text_lower)} tweets")
+        self.semantic_index = create_semantic_index(pd.Series(self.text_lower, dtype=object))
+        if directory:
+            try:
+                self.semantic_index.save(directory)
+            except Exception as e:
+                print(f"Could not write semantic index: {e}")
+    
+    def read_chunks(self):
+        """Stream the CSV in chunks, cleaning and indexing each one as it is read.
+        
+        Only the columns the chatbot uses are kept, so peak memory is the final
+        frame plus one chunk rather than several copies of the whole file.
+        """
+        usecols = self.select_columns()
+        total_bytes = os.path.getsize(self.csv_path)
+        index = InvertedIndex()
+        keyword_counts = KeywordCounts(self.keyword_matcher.keywords)
+        trends = TrendCube(self.keyword_matcher.keywords)
+        frames, lowered_parts = [], []
+        rows = 0
+        
+        with open(self.csv_path, 'rb') as handle, self.clean_executor() as executor:
+            chunks = pd.read_csv(handle, usecols=usecols, chunksize=self.chunk_rows or None)
+            if isinstance(chunks, pd.DataFrame):
+                chunks = [chunks]
+            for chunk in chunks:
+                chunk = self.prepare_frame(chunk, executor)
+                lowered = self.searchable_text(chunk)
+                trends.add(chunk, *self.index_text(lowered, index, keyword_counts))
+                frames.append(chunk)
+                lowered_parts.append(lowered.to_numpy(dtype=object))
+                rows += len(chunk)
+                self.progress(rows, handle.tell(), total_bytes)
+        
+        self.data = concat_chunks(frames)
+        self.text_lower = np.concatenate(lowered_parts) if lowered_parts else np.empty(0, dtype=object)
+        self.search_index = index
+        self.keyword_counts = keyword_counts
+        self.trends = trends
+    
+    def select_columns(self) -> Optional[List[str]]:
+        """CSV columns worth loading: the known tweet columns, or everything if there is no text column."""
+        header = pd.read_csv(self.csv_path, nrows=0).columns
+        if not any(column.lower() in TEXT_COLUMNS for column in header):
+            return None
+        return [column for column in header if column.lower() in KNOWN_COLUMNS]
+    
+    def clean_executor(self):
+        """Process pool for text cleaning while loading, or a no-op context when single-process."""
+        if self.preprocess_workers > 1:
+            return ProcessPoolExecutor(max_workers=self.preprocess_workers)
+        return nullcontext()
+    
+    def print_progress(self, rows: int, bytes_read: int, total_bytes: int):
+        if rows > self.chunk_rows > 0:
+            print(f"Loading {self.csv_path}: {rows:,} rows ({bytes_read / max(total_bytes, 1):.0%})")
+    
+    def get_file_mtime(self) -> Optional[float]:
+        """Modification time of the CSV file, or None if it does not exist."""
+        try:
+            return os.path.getmtime(self.csv_path)
+        except OSError:
+            return None
+    
+    def get_file_position(self) -> Optional[FilePosition]:
+        """End of the CSV file's last complete line, or None if it does not exist."""
+        try:
+            with open(self.csv_path, 'rb') as handle:
+                handle.seek(0, os.SEEK_END)
+                size = handle.tell()
+                handle.seek(max(0, size - 1))
+                if handle.read(1) != b'\n':
+                    # Rows are still being written; the next append cannot continue from here
+                    return None
+            return file_position(self.csv_path, size)
+        except OSError:
+            return None
+    
+    def reload_if_modified(self) -> bool:
+        """Pick up changes to the CSV file since it was loaded; returns True if the data changed.
+        
+        Rows appended to the file are ingested on their own; any other change reloads it.
+        """
+        if self.get_file_mtime() == self.loaded_mtime:
+            return False
+        
+        with self._reload_lock:
+            # Another thread may have reloaded while we waited for the lock
+            if self.get_file_mtime() == self.loaded_mtime:
+                return False
+            if self.ingest_appended_rows():
+                return True
+            print(f"{self.csv_path} changed on disk, reloading")
+            self.load_data()
+            return True
+    
+    def ingest_appended_rows(self) -> bool:
+        """Append the rows added to the end of the CSV since it was read; False if it changed otherwise."""
+        position = self.loaded_position
+        if position is None or self.data is None or not is_continuation(self.csv_path, position):
+            return False
+        try:
+            mtime = self.get_file_mtime()
+            names = list(pd.read_csv(self.csv_path, nrows=0).columns)
+            usecols = self.select_columns()
+            frame, position = read_appended_rows(self.csv_path, position, names, usecols)
+        except (OSError, ValueError) as e:
+            print(f"Could not read rows appended to {self.csv_path}: {e}")
+            return False
+        
+        self.append_tweets(frame)
+        self.loaded_position = position
+        self.loaded_mtime = mtime
+        if len(frame):
+            print(f"Ingested {len(frame)} rows appended to {self.csv_path}")
+        return True
+    
+    def append_tweets(self, rows: Union[pd.DataFrame, Iterable[Dict[str, Any]]]) -> int:
+        """Add new tweets without reloading; returns the number added.
+        
+        Only the new rows are cleaned and tokenized. The search index, keyword counts,
+        trend cube and semantic index are extended in place, and memoized summaries
+        start over. Appends are not written to the dataset cache.
+        """
+        return self.ingest(rows, upsert=False)
+    
+    def upsert_tweets(self, rows: Union[pd.DataFrame, Iterable[Dict[str, Any]]]) -> int:
+        """Add tweets, replacing any existing tweet with the same id; returns the number added.
+        
+        Replaced tweets are tombstoned (uncounted and no longer returned) rather than
+        removed from the indexes. Tweets without an id column are simply appended.
+        """
+        return self.ingest(rows, upsert=True)
+    
+    def delete_tweets(self, ids: Iterable[Any]) -> int:
+        """Tombstone the tweets with these ids; returns the number deleted."""
+        with self._reload_lock:
+            if self.data is None or 'id' not in self.data.columns:
+                return 0
+            deleted = self.remove_rows(np.flatnonzero(self.isin('id', list(ids))))
+            if deleted:
+                self.advance_version()
+            return deleted
+    
+    def ingest(self, rows: Union[pd.DataFrame, Iterable[Dict[str, Any]]], upsert: bool) -> int:
+        frame = rows.copy() if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+        if frame.empty:
+            return 0
+        frame = self.prepare_frame(frame).reset_index(drop=True)
+        
+        with self._reload_lock:
+            data = self.data if self.data is not None else pd.DataFrame()
+            if len(data.columns):
+                # Keep the loaded schema: missing columns become NaN, extra ones are dropped
+                frame = frame.reindex(columns=data.columns)
+                if 'date' in frame.columns:
+                    frame['date'] = pd.to_datetime(frame['date'], errors='coerce')
+            removed = 0
+            if upsert and 'id' in frame.columns:
+                frame = frame.drop_duplicates('id', keep='last').reset_index(drop=True)
+                if 'id' in data.columns:
+                    removed = self.remove_rows(np.flatnonzero(self.isin('id', frame['id'])))
+            
+            first_row = len(self.text_lower)
+            lowered = self.searchable_text(frame)
+            # Rows reach the frame and text before the index, so searches never see a row id
+            # past the end of the frame. New rows go to the tail rather than being copied
+            # into the main frame with all the others.
+            with self._frame_lock:
+                if len(data.columns):
+                    self.tail = self.tail + [frame]
+                    self.tail_rows += len(frame)
+                else:
+                    self.data = frame
+            self.extend_rows('text_lower', lowered.to_numpy(dtype=object))
+            self.extend_rows('tombstones', np.zeros(len(frame), dtype=bool))
+            self.trends.add(frame, *self.index_text(lowered, self.search_index, self.keyword_counts))
+            if self.semantic_index is not None:
+                self.semantic_index.add(lowered, first_row)
+            self.merge_tail()
+            if removed or self.summary_max_age <= 0:
+                self.advance_version()
+            elif self._appended_at is None:
+                self._appended_at = time.monotonic()
+        return len(frame)
+    
+    def extend_rows(self, name: str, values: np.ndarray):
+        """Append to a per-row array (text_lower or tombstones) in amortized constant time per row.
+        
+        The array becomes a view of a buffer with room to grow, doubled when full;
+        views handed out earlier keep their length and contents.
+        """
+        view = getattr(self, name)
+        start, end = len(view), len(view) + len(values)
+        buffer = self._row_buffers.get(name)
+        if buffer is None or view.base is not buffer or len(buffer) < end:
+            buffer = np.empty(max(end, 2 * start, 1024), dtype=view.dtype)
+            buffer[:start] = view
+            self._row_buffers[name] = buffer
+        buffer[start:end] = values
+        setattr(self, name, buffer[:end])
+    
+    def merge_tail(self, force: bool = False):
+        """Merge appended frames into the main frame once they reach TAIL_MERGE_FRACTION of it
+        (or now, with `force`), and into one another beyond TAIL_MAX_FRAMES."""
+        with self._reload_lock:
+            if not self.tail:
+                return
+            if force or self.tail_rows >= max(TAIL_MERGE_MIN_ROWS, TAIL_MERGE_FRACTION * len(self.data)):
+                data, tail = concat_chunks([self.data, *self.tail]), []
+            elif len(self.tail) > TAIL_MAX_FRAMES:
+                data, tail = self.data, [concat_chunks(self.tail)]
+            else:
+                return
+            with self._frame_lock:
+                self.data, self.tail = data, tail
+                if not tail:
+                    self.tail_rows = 0
+    
+    def frame(self) -> Union[pd.DataFrame, FrameParts]:
+        """Every row, by position: the main frame, plus the appended frames not merged into it yet."""
+        with self._frame_lock:
+            data, tail = self.data, self.tail
+        return FrameParts([data, *tail]) if tail else data
+    
+    def isin(self, column: str, values: Any) -> np.ndarray:
+        """Boolean mask over every row of whether `column` holds one of `values`."""
+        frame = self.frame()
+        if isinstance(frame, FrameParts):
+            return frame.isin(column, values)
+        return frame[column].isin(values).to_numpy()
+    
+    def tweet_count(self) -> int:
+        """Number of tweets, not counting replaced or deleted ones."""
+        return len(self.text_lower) - self.removed_rows
+    
+    def remove_rows(self, rows: np.ndarray) -> int:
+        """Tombstone rows by position, taking them out of the keyword counts and trend cube."""
+        rows = rows[~self.tombstones[rows]]
+        if len(rows) == 0:
+            return 0
+        self.tombstones[rows] = True
+        self.removed_rows += len(rows)
+        positions, keyword_ids = self.keyword_counts.remove(rows)
+        frame = self.frame()
+        self.trends.remove(frame.select(rows) if isinstance(frame, FrameParts) else frame.iloc[rows],
+                           positions, keyword_ids)
+        return len(rows)
+    
+    def live_data(self) -> pd.DataFrame:
+        """The frame without tombstoned rows (appended rows are merged into it first)."""
+        self.merge_tail(force=True)
+        if not self.removed_rows:
+            return self.data
+        return self.data[~self.tombstones[:len(self.data)]]
     
     def preprocess_data(self):
         """Clean and preprocess the data."""
         if self.data.empty:
             return
         
+        self.data = self.prepare_frame(self.live_data().reset_index(drop=True))
+        self.tombstones = np.zeros(len(self.data), dtype=bool)
+        self.removed_rows = 0
+        self.build_search_index()
+        if self.semantic_index is not None:
+            # Row numbers changed with the tombstoned rows gone
+            self.semantic_index = create_semantic_index(pd.Series(self.text_lower, dtype=object))
+        self.advance_version()
+    
+    def prepare_frame(self, frame: pd.DataFrame, executor: Optional[Executor] = None) -> pd.DataFrame:
+        """Normalize column names, clean text and convert a frame (or chunk) to compact dtypes."""
         # Convert column names to lowercase for consistency
-        self.data.columns = self.data.columns.str.lower()
+        frame.columns = frame.columns.str.lower()
         
         # Handle common column name variations
         column_mapping = {
@@ -40,85 +566,201 @@ class OmicronDataProcessor:
         }
         
         for old_col, new_col in column_mapping.items():
-            if old_col in self.data.columns and new_col not in self.data.columns:
-                self.data.rename(columns={old_col: new_col}, inplace=True)
+            if old_col in frame.columns and new_col not in frame.columns:
+                frame.rename(columns={old_col: new_col}, inplace=True)
         
         # Clean text data if available
-        if 'text' in self.data.columns:
-            self.data['text'] = self.data['text'].astype(str)
-            self.data['text_clean'] = self.data['text'].apply(self.clean_text)
+        if 'text' in frame.columns:
+            frame['text'] = frame['text'].astype(str)
+            frame['text_clean'] = clean_text_column(frame['text'], executor)
+        
+        for column in CATEGORY_COLUMNS:
+            if column in frame.columns and pd.api.types.is_string_dtype(frame[column]):
+                frame[column] = frame[column].astype('category')
+        
+        if 'id' in frame.columns and pd.api.types.is_integer_dtype(frame['id']):
+            frame['id'] = pd.to_numeric(frame['id'], downcast='integer')
         
         # Process dates if available
-        if 'date' in self.data.columns:
-            self.data['date'] = pd.to_datetime(self.data['date'], errors='coerce')
+        if 'date' in frame.columns:
+            frame['date'] = pd.to_datetime(frame['date'], errors='coerce')
+        
+        return frame
     
-    def clean_text(self, text: str) -> str:
-        """Clean tweet text."""
-        if pd.isna(text):
-            return ""
+    def searchable_text(self, frame: Optional[pd.DataFrame] = None) -> pd.Series:
+        """Lowercase text that searches run against: the text column, or all string columns."""
+        frame = self.data if frame is None else frame
+        if 'text' in frame.columns:
+            return frame['text'].astype(str).str.lower()
         
-        # Remove URLs
-        text = re.sub(r'http\S+|www\S+|https\S+', '', text, flags=re.MULTILINE)
-        # Remove user mentions and hashtags symbols
-        text = re.sub(r'@\w+|#', '', text)
-        # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+        columns = frame.select_dtypes(include=['object', 'category']).columns
+        if len(columns) == 0:
+            return pd.Series([""] * len(frame), index=frame.index)
+        # Missing values stay NaN under astype(str) with pandas' string dtype
+        return frame[columns].astype(str).fillna('').agg(' '.join, axis=1).str.lower()
+    
+    def build_search_index(self):
+        """Precompute the lowercase search column and the token index over it."""
+        lowered = self.searchable_text()
+        self.text_lower = lowered.to_numpy(dtype=object)
+        self.search_index = InvertedIndex()
+        self.keyword_counts = KeywordCounts(self.keyword_matcher.keywords)
+        self.trends = TrendCube(self.keyword_matcher.keywords)
+        self.trends.add(self.data, *self.index_text(lowered, self.search_index, self.keyword_counts))
+    
+    def index_text(self, lowered: pd.Series, index: InvertedIndex,
+                   keyword_counts: KeywordCounts) -> Tuple[np.ndarray, np.ndarray]:
+        """Tokenize a batch of lowercase rows once and add it to the index and the keyword counts.
         
-        return text
+        Returns the batch's keyword matches as (row in batch, keyword id) arrays.
+        """
+        batch = tokenize_documents(lowered)
+        first_row = index.num_docs
+        index.add_tokens(batch)
+        matches = self.keyword_matcher.match(batch)
+        keyword_counts.add(*matches, first_row)
+        return matches
+    
+    def clean_text(self, text: str) -> str:
+        """Clean tweet text."""
+        return clean_text(text)
     
-    def search_tweets(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search for tweets containing specific keywords."""
+    def search_tweets(self, query: str, limit: int = 10, mode: str = "keyword",
+                      columns: Optional[List[str]] = None) -> TweetResults:
+        """Search for tweets containing specific keywords.
+        
+        With mode="semantic" tweets are matched by meaning instead (see semantic_search_tweets).
+        Results are dict-like records read lazily from the frame; `columns` limits them to
+        the fields the caller needs.
+        """
         if self.data.empty:
-            return []
+            return TweetResults(self.data, [], columns)
+        if mode == "semantic":
+            return self.semantic_search_tweets(query, limit, columns)
         
         # Convert query to lowercase for case-insensitive search
         query_lower = query.lower()
         
-        # Search in text column if available
-        if 'text' in self.data.columns:
-            mask = self.data['text'].str.lower().str.contains(query_lower, na=False)
-            results = self.data[mask].head(limit)
-        else:
-            # Search in all string columns
-            mask = pd.Series([False] * len(self.data))
-            for col in self.data.select_dtypes(include=['object']).columns:
-                mask |= self.data[col].astype(str).str.lower().str.contains(query_lower, na=False)
-            results = self.data[mask].head(limit)
+        rows = self.find_rows(query_lower, limit)
+        # Read after searching, so the frame covers every row found
+        return TweetResults(self.frame(), rows, columns)
+    
+    @memoized
+    def rank_tweets(self, query: str, limit: int = 10, columns: Optional[List[str]] = None) -> TweetResults:
+        """The tweets most relevant to a free-text query under BM25, best first, each with its "score"."""
+        if self.data.empty:
+            return TweetResults(self.data, [], columns)
         
-        return results.to_dict('records')
+        # Ask for enough extra rows to make up for any that were tombstoned
+        ranked = self.search_index.rank(query.lower(), limit + self.removed_rows)
+        # Read after ranking: appends extend the frame and tombstones before the index
+        tombstones = self.tombstones
+        ranked = [(row, score) for row, score in ranked if not tombstones[row]][:limit]
+        return TweetResults(self.frame(), [row for row, _ in ranked], columns,
+                            {'score': [round(score, 3) for _, score in ranked]})
     
+    @memoized
+    def semantic_search_tweets(self, query: str, limit: int = 10, columns: Optional[List[str]] = None) -> TweetResults:
+        """The tweets closest in meaning to a query, best first, each with its "similarity".
+        
+        Falls back to BM25 ranking when semantic search is not enabled.
+        """
+        if self.data.empty:
+            return TweetResults(self.data, [], columns)
+        if self.semantic_index is None:
+            return self.rank_tweets(query, limit, columns)
+        
+        matches = self.semantic_index.search(query, limit + self.removed_rows)
+        tombstones = self.tombstones
+        matches = [(row, similarity) for row, similarity in matches if not tombstones[row]][:limit]
+        return TweetResults(self.frame(), [row for row, _ in matches], columns,
+                            {'similarity': [round(similarity, 3) for _, similarity in matches]})
+    
+    def find_rows(self, query_lower: str, limit: int) -> List[int]:
+        """Positions of the first `limit` rows matching a lowercase query, in file order.
+        
+        Query tokens match word prefixes via the inverted index; only the candidate
+        rows are checked against the full phrase.
+        """
+        if not query_lower:
+            return np.flatnonzero(~self.tombstones)[:limit].tolist()
+        
+        blocks = self.search_index.candidate_blocks(query_lower)
+        tombstones = self.tombstones
+        if blocks is None:
+            # No word characters to look up, fall back to scanning the lowercase column
+            blocks = [range(len(self.text_lower))]
+        
+        rows = []
+        for block in blocks:
+            for row in block:
+                if query_lower in self.text_lower[row] and not tombstones[row]:
+                    rows.append(int(row))
+                    if len(rows) >= limit:
+                        return rows
+        return rows
+    
+    @memoized
     def get_statistics(self) -> Dict[str, Any]:
         """Get basic statistics about the omicron data."""
-        if self.data.empty:
+        frame = self.frame()
+        frames = frame.frames if isinstance(frame, FrameParts) else [frame]
+        tombstones = self.tombstones
+        total = sum(len(part) for part in frames) - self.removed_rows
+        if total == 0 or len(frames[0].columns) == 0:
             return {"error": "No data available"}
         
         stats = {
-            "total_tweets": len(self.data),
-            "columns": list(self.data.columns),
+            "total_tweets": total,
+            "columns": list(frames[0].columns),
             "date_range": None,
             "sample_tweet": None
         }
         
-        # Date statistics
-        if 'date' in self.data.columns:
-            valid_dates = self.data['date'].dropna()
-            if not valid_dates.empty:
-                stats["date_range"] = {
-                    "start": valid_dates.min().strftime("%Y-%m-%d"),
-                    "end": valid_dates.max().strftime("%Y-%m-%d")
-                }
-        
-        # Sample tweet
-        if 'text' in self.data.columns:
-            sample_tweets = self.data['text'].dropna()
-            if not sample_tweets.empty:
-                stats["sample_tweet"] = sample_tweets.iloc[0][:200] + "..." if len(sample_tweets.iloc[0]) > 200 else sample_tweets.iloc[0]
+        # Appended frames are read where they are rather than merged first
+        starts, ends, sample = [], [], None
+        first_row = 0
+        for part in frames:
+            rows = len(part)
+            if self.removed_rows:
+                part = part[~tombstones[first_row:first_row + rows]]
+            first_row += rows
+            # Date statistics
+            if 'date' in part.columns:
+                valid_dates = part['date'].dropna()
+                if not valid_dates.empty:
+                    starts.append(valid_dates.min())
+                    ends.append(valid_dates.max())
+            # Sample tweet
+            if sample is None and 'text' in part.columns:
+                sample_tweets = part['text'].dropna()
+                if not sample_tweets.empty:
+                    sample = sample_tweets.iloc[0]
+        if starts:
+            stats["date_range"] = {
+                "start": min(starts).strftime("%Y-%m-%d"),
+                "end": max(ends).strftime("%Y-%m-%d")
+            }
+        if sample is not None:
+            stats["sample_tweet"] = sample[:200] + "..." if len(sample) > 200 else sample
         
         return stats
     
+    @memoized
+    def query_trends(self, location: Optional[str] = None, sentiment: Optional[str] = None,
+                     keyword: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None,
+                     freq: str = "W", group_by: Optional[str] = "sentiment") -> Dict[str, Any]:
+        """Tweet counts over time from the precomputed trend cube (see TrendCube.query)."""
+        if self.data.empty:
+            return {"error": "No data available"}
+        if 'date' not in self.data.columns:
+            return {"error": "The data has no date column"}
+        return self.trends.query(location, sentiment, keyword, start, end, freq, group_by)
+    
+    @memoized
     def get_topic_summary(self, topic: str) -> str:
         """Get a summary of tweets related to a specific topic."""
-        tweets = self.search_tweets(topic, limit=50)
+        tweets = self.search_tweets(topic, limit=50, columns=['text', 'text_clean'])
         
         if not tweets:
             return f"No tweets found related to '{topic}'"
@@ -143,21 +785,23 @@ class OmicronDataProcessor:
         
         return summary
     
+    @memoized
     def analyze_sentiment_keywords(self) -> Dict[str, int]:
-        """Analyze basic sentiment keywords in the data."""
+        """Whole-word mentions of the sentiment keywords, counted while the data was loaded."""
         if self.data.empty or 'text' not in self.data.columns:
             return {}
         
-        # Define keyword categories
-        positive_keywords = ['good', 'better', 'recovered', 'healing', 'hope', 'positive', 'mild']
-        negative_keywords = ['bad', 'worse', 'sick', 'severe', 'death', 'fear', 'worried', 'negative']
-        symptom_keywords = ['fever', 'cough', 'tired', 'headache', 'loss', 'taste', 'smell', 'sore', 'throat']
-        
-        # Count occurrences
-        keyword_counts = {}
-        all_text = ' '.join(self.data['text'].astype(str).str.lower())
-        
-        for keyword in positive_keywords + negative_keywords + symptom_keywords:
-            keyword_counts[keyword] = all_text.count(keyword)
-        
-        return keyword_counts
+        return self.keyword_counts.totals()
+    
+    @memoized
+    def count_keywords(self, keywords: List[str]) -> Dict[str, int]:
+        """Whole-word occurrences of arbitrary keywords or phrases across all tweets."""
+        if self.data.empty:
+            return {}
+        matcher = KeywordMatcher(keywords)
+        # Only rows containing some keyword's first word can match
+        first_words = {pattern[0] for pattern in matcher.patterns if pattern}
+        rows = np.unique(np.concatenate([self.search_index.postings(word) for word in first_words] or [[]]))
+        rows = rows.astype(np.int64)
+        rows = rows[~self.tombstones[rows]]
+        return matcher.count(pd.Series(self.text_lower[rows], dtype=object))
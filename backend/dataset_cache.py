@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import shutil
+from typing import Optional, List, Dict, Any, Tuple
+import numpy as np
+import pandas as pd
+from search_index import InvertedIndex
+from keyword_matcher import KeywordCounts
+from trend_cube import TrendCube
+
+# Bump when the stored layout or the preprocessing that produces it changes
+CACHE_FORMAT_VERSION = 4
+
+# Strings are stored joined on this character when it does not occur in them, so a
+# whole column decodes with one split instead of one slice per row
+_STRING_SEPARATOR = '\x1e'
+
+
+class UnsupportedColumn(Exception):
+    """Raised for a column the cache cannot store losslessly."""
+
+
+class DatasetCache:
+    def __init__(self, csv_path: str, cache_dir: str):
+        """Initialize a columnar cache of the preprocessed dataset for one CSV file.
+
+        Entries are keyed on the CSV's path, size and modification time, so an edited
+        file gets a fresh entry. Each entry is a directory of .npy files: numeric,
+        date and categorical code columns, the index postings, keyword counts and trend
+        tables are memory-mapped on load, string columns are stored as one UTF-8 blob each.
+        """
+        self.csv_path = os.path.abspath(csv_path)
+        self.cache_dir = cache_dir
+        self.source_key = "{}-{}".format(
+            os.path.splitext(os.path.basename(self.csv_path))[0],
+            hashlib.sha1(self.csv_path.encode('utf-8')).hexdigest()[:10]
+        )
+        stat = os.stat(self.csv_path)
+        self.directory = os.path.join(
+            cache_dir, f"{self.source_key}-{stat.st_size}-{stat.st_mtime_ns}-v{CACHE_FORMAT_VERSION}"
+        )
+
+    @property
+    def semantic_directory(self) -> str:
+        """Where the optional semantic index for this entry is stored."""
+        return os.path.join(self.directory, "semantic")
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.directory, "meta.json"))
+
+    def load(self, keywords: List[str]) -> Tuple[pd.DataFrame, np.ndarray, InvertedIndex, KeywordCounts, TrendCube]:
+        """Read the frame, search column, index, keyword counts and trend tables back from the entry."""
+        with open(os.path.join(self.directory, "meta.json"), encoding='utf-8') as handle:
+            meta = json.load(handle)
+        if meta["keywords"] != list(keywords):
+            raise ValueError("entry was counted for a different keyword list")
+
+        data = self._load_frame(meta["columns"])
+
+        text_lower = np.array(self._load_strings("text_lower", meta["text_lower"]), dtype=object)
+
+        terms = self._load_strings("index_terms", meta["index"]["terms"])
+        search_index = InvertedIndex.from_csr(
+            terms,
+            self._load_array("index_offsets"),
+            self._load_array("index_postings"),
+            self._load_array("index_frequencies"),
+            self._load_array("index_doc_lengths")
+        )
+        keyword_counts = KeywordCounts.from_arrays(
+            meta["keywords"], {name: self._load_array(name) for name in ("keyword_keys", "keyword_counts")}
+        )
+        trends = TrendCube.from_frames(meta["keywords"], self._load_frame(meta["trends"]["tweets"]),
+                                       self._load_frame(meta["trends"]["mentions"]))
+        return data, text_lower, search_index, keyword_counts, trends
+
+    def save(self, data: pd.DataFrame, text_lower: np.ndarray, search_index: InvertedIndex,
+             keyword_counts: KeywordCounts, trends: TrendCube):
+        """Write a new entry atomically and remove older entries for the same CSV."""
+        temp_directory = f"{self.directory}.tmp-{os.getpid()}"
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        os.makedirs(temp_directory)
+        try:
+            meta: Dict[str, Any] = {
+                "version": CACHE_FORMAT_VERSION,
+                "source": self.csv_path,
+                "rows": len(data),
+                "columns": self._save_frame(temp_directory, data)
+            }
+            meta["text_lower"] = self._save_strings(temp_directory, "text_lower", list(text_lower))
+
+            terms, offsets, postings, frequencies = search_index.to_csr()
+            meta["index"] = {
+                "num_docs": search_index.num_docs,
+                "terms": self._save_strings(temp_directory, "index_terms", terms)
+            }
+            np.save(os.path.join(temp_directory, "index_offsets.npy"), offsets)
+            np.save(os.path.join(temp_directory, "index_postings.npy"), postings)
+            np.save(os.path.join(temp_directory, "index_frequencies.npy"), frequencies)
+            np.save(os.path.join(temp_directory, "index_doc_lengths.npy"),
+                    np.asarray(search_index.doc_lengths, dtype=np.uint32))
+
+            meta["keywords"] = keyword_counts.keywords
+            for name, values in keyword_counts.to_arrays().items():
+                np.save(os.path.join(temp_directory, f"{name}.npy"), values)
+
+            tweets, mentions = trends.to_frames()
+            meta["trends"] = {
+                "tweets": self._save_frame(temp_directory, tweets),
+                "mentions": self._save_frame(temp_directory, mentions)
+            }
+
+            with open(os.path.join(temp_directory, "meta.json"), "w", encoding='utf-8') as handle:
+                json.dump(meta, handle)
+            os.replace(temp_directory, self.directory)
+        except BaseException:
+            shutil.rmtree(temp_directory, ignore_errors=True)
+            raise
+        self._remove_stale_entries()
+
+    def _save_frame(self, directory: str, frame: pd.DataFrame) -> List[Dict[str, Any]]:
+        return [self._save_column(directory, name, frame[name]) for name in frame.columns]
+
+    def _load_frame(self, columns: List[Dict[str, Any]]) -> pd.DataFrame:
+        return pd.DataFrame({column["name"]: self._load_column(column) for column in columns},
+                            columns=[column["name"] for column in columns])
+
+    def _save_column(self, directory: str, name: str, series: pd.Series) -> Dict[str, Any]:
+        file_name = f"column_{len(os.listdir(directory))}"
+        column: Dict[str, Any] = {"name": name, "file": file_name, "dtype": str(series.dtype)}
+
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories
+            if not all(isinstance(value, str) for value in categories):
+                raise UnsupportedColumn(f"{name}: non-string categories")
+            column["kind"] = "category"
+            column["ordered"] = bool(series.cat.ordered)
+            column["categories"] = self._save_strings(directory, f"{file_name}_categories", list(categories))
+            np.save(os.path.join(directory, f"{file_name}.npy"), series.cat.codes.to_numpy())
+        elif pd.api.types.is_datetime64_dtype(series.dtype) or (
+                pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_extension_array_dtype(series.dtype)):
+            column["kind"] = "array"
+            np.save(os.path.join(directory, f"{file_name}.npy"), series.to_numpy())
+        elif pd.api.types.is_string_dtype(series.dtype):
+            missing = series.isna().to_numpy()
+            values = series.where(~missing, "").tolist()
+            if not all(isinstance(value, str) for value in values):
+                raise UnsupportedColumn(f"{name}: mixed value types")
+            column["kind"] = "string"
+            column["strings"] = self._save_strings(directory, file_name, values)
+            if missing.any():
+                column["missing"] = True
+                np.save(os.path.join(directory, f"{file_name}_missing.npy"), missing)
+        else:
+            raise UnsupportedColumn(f"{name}: dtype {series.dtype}")
+        return column
+
+    def _load_column(self, column: Dict[str, Any]):
+        file_name = column["file"]
+        if column["kind"] == "category":
+            categories = self._load_strings(f"{file_name}_categories", column["categories"])
+            return pd.Categorical.from_codes(self._load_array(file_name), categories=categories,
+                                             ordered=column["ordered"])
+        if column["kind"] == "array":
+            return pd.Series(self._load_array(file_name), copy=False)
+
+        series = pd.Series(self._load_strings(file_name, column["strings"]), dtype=column["dtype"])
+        if column.get("missing"):
+            series[self._load_array(f"{file_name}_missing")] = np.nan
+        return series
+
+    def _save_strings(self, directory: str, file_name: str, values: List[str]) -> Dict[str, Any]:
+        joined = _STRING_SEPARATOR.join(values)
+        split = joined.count(_STRING_SEPARATOR) == max(len(values) - 1, 0)
+        np.save(os.path.join(directory, f"{file_name}.npy"), np.frombuffer(joined.encode('utf-8'), dtype=np.uint8))
+        if not split:
+            # Per-row character offsets into the joined text, which also contains the separator
+            offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            np.cumsum([len(value) + 1 for value in values], out=offsets[1:])
+            np.save(os.path.join(directory, f"{file_name}_offsets.npy"), offsets)
+        return {"count": len(values), "split": split}
+
+    def _load_strings(self, file_name: str, info: Dict[str, Any]) -> List[str]:
+        if info["count"] == 0:
+            return []
+        text = str(memoryview(self._load_array(file_name)), 'utf-8')
+        if info["split"]:
+            return text.split(_STRING_SEPARATOR)
+        bounds = self._load_array(f"{file_name}_offsets").tolist()
+        return [text[bounds[i]:bounds[i + 1] - 1] for i in range(info["count"])]
+
+    def _load_array(self, file_name: str) -> np.ndarray:
+        path = os.path.join(self.directory, f"{file_name}.npy")
+        try:
+            # A plain ndarray view of the map: slicing np.memmap objects is several times slower
+            return np.load(path, mmap_mode='r').view(np.ndarray)
+        except ValueError:
+            # Empty arrays cannot be memory-mapped
+            return np.load(path)
+
+    def _remove_stale_entries(self):
+        current = os.path.basename(self.directory)
+        for entry in os.listdir(self.cache_dir):
+            if entry.startswith(f"{self.source_key}-") and entry != current and ".tmp-" not in entry:
+                shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+
+
+def create_dataset_cache(csv_path: str) -> Optional[DatasetCache]:
+    """Cache for a CSV configured by DATA_CACHE_DIR (default: .omicron_cache next to the CSV; "off" disables)."""
+    cache_dir = os.getenv('DATA_CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(csv_path)), ".omicron_cache")
+    if cache_dir.lower() in ('off', 'none', 'disabled') or not os.path.exists(csv_path):
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+    return DatasetCache(csv_path, cache_dir)
@@ -0,0 +1,168 @@
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+from search_index import tokenize
+
+# Word endings a keyword still matches with, so "csv" matches "csvs" and "use" "used"
+INFLECTION_SUFFIXES = ('s', 'es', 'd', 'ed', 'ing')
+
+# Shortest word left after removing an inflection, so "is" is not read as "i" + "s"
+MIN_STEM_LENGTH = 3
+
+# Keyword words at least this long also match the start of longer words, as prefix search
+# does in search_index: "health" matches "healthy", "symptom" "symptomatic", "pain" "painful"
+MIN_PREFIX_LENGTH = 4
+
+# Words that start with a keyword but mean something else; they only match a keyword exactly.
+# Matching at word starts already rules out the old substring hits ("cure" in "secure",
+# "test" in "latest", "pain" in "spain").
+NOT_KEYWORD_FORMS = frozenset({
+    'paint', 'paints', 'painted', 'painting', 'paintings', 'painter',
+    'country', 'countries', 'county', 'counties', 'countless',
+    'testament', 'testimony', 'testify', 'testified',
+})
+
+# Keywords per intent, matched as words (or phrases) in a single pass over a message
+INTENT_KEYWORDS: Dict[str, List[str]] = {
+    # MedicalChatbot routing
+    "data_context": [
+        'omicron', 'covid', 'coronavirus', 'symptom', 'experience',
+        'recovery', 'people', 'tweet', 'social media', 'report',
+        'trend', 'sentiment'
+    ],
+    # Questions about people's experiences, answered with sample tweets
+    "data_samples": ['symptom', 'experience', 'recovery', 'fever', 'cough'],
+    "trend": ['trend', 'change', 'over time', 'weekly', 'daily', 'per week', 'per day', 'rise', 'drop'],
+    "medical": [
+        'symptom', 'disease', 'medicine', 'treatment', 'doctor', 'hospital',
+        'health', 'medical', 'diagnosis', 'cure', 'therapy', 'medication',
+        'covid', 'omicron', 'virus', 'vaccine', 'vaccinated', 'vaccination', 'infection', 'infected',
+        'fever', 'cough', 'pain', 'sick', 'illness', 'patient', 'clinic', 'headache',
+        'fatigue', 'sore throat', 'body ache', 'recovery', 'quarantine',
+        'isolation', 'test', 'positive', 'negative', 'healthcare'
+    ],
+    "disclaimer": ['treatment', 'cure', 'medication', 'diagnosis'],
+    "data_query": [
+        'omicron', 'tweet', 'data', 'statistics', 'how many', 'count',
+        'analyze', 'search', 'find', 'show me', 'tweets about',
+        'dataset', 'csv', 'trends', 'summary'
+    ],
+    "statistics": ['statistics', 'stats', 'how many', 'count', 'total'],
+    "search": ['search', 'find', 'about', 'related to'],
+    "summary": ['summary', 'summarize', 'tell me about'],
+    "sentiment": ['sentiment', 'feeling', 'emotion', 'positive', 'negative'],
+    "data_tip": ['covid', 'pandemic', 'health', 'social media'],
+    # APIHandler offline responses
+    "api_medical": [
+        'symptom', 'disease', 'medicine', 'treatment', 'doctor', 'hospital',
+        'health', 'medical', 'diagnosis', 'cure', 'therapy', 'medication',
+        'covid', 'omicron', 'virus', 'vaccine', 'vaccinated', 'vaccination', 'infection', 'infected',
+        'fever', 'cough', 'pain', 'sick', 'illness', 'patient', 'clinic'
+    ],
+    "mock_medical": ['symptom', 'omicron', 'covid', 'fever', 'cough', 'health'],
+    "mock_data": ['analyze', 'data', 'statistics', 'trend'],
+    "mock_symptom": ['symptom', 'fever', 'cough', 'headache'],
+    "omicron": ['omicron', 'covid'],
+}
+
+
+class Intents:
+    """The intents a message was classified into, with the keywords that triggered each."""
+    __slots__ = ('matches',)
+
+    def __init__(self, matches: Dict[str, Tuple[str, ...]]):
+        self.matches = matches
+
+    def __contains__(self, intent: str) -> bool:
+        return intent in self.matches
+
+    def __bool__(self) -> bool:
+        return bool(self.matches)
+
+    def __repr__(self) -> str:
+        return f"Intents({self.matches!r})"
+
+    @property
+    def names(self) -> FrozenSet[str]:
+        return frozenset(self.matches)
+
+    def keywords(self, intent: str) -> Tuple[str, ...]:
+        """Keywords of `intent` found in the message, in order of first occurrence."""
+        return self.matches.get(intent, ())
+
+
+class IntentClassifier:
+    def __init__(self, intents: Dict[str, Iterable[str]]):
+        """Compile keyword lists for any number of intents into one word-level trie.
+
+        Keywords match at the start of words (and phrases, word by word): a keyword
+        word of MIN_PREFIX_LENGTH letters or more matches any word beginning with it
+        except NOT_KEYWORD_FORMS, a shorter one the word itself with an inflection
+        suffix. So "health" matches "healthy" and "cure" "cures", but "cure" never
+        matches "secure". Classifying walks the message's words once; the cost
+        depends on the message length, not on how many keywords there are.
+
+        That only pays off for large vocabularies: with the ~100 routing keywords
+        of INTENT_KEYWORDS, any() substring scans are faster on long messages
+        (benchmark.py intents), while the trie wins from thousands of keywords.
+        """
+        self.intents = list(intents)
+        # Word -> trie node; a node maps a word to its child node, and None to the
+        # (keyword, intent ids) pairs ending there
+        self._root: Dict[Optional[str], object] = {}
+        for intent_id, intent in enumerate(self.intents):
+            for keyword in intents[intent]:
+                words = tokenize(keyword)
+                if not words:
+                    continue
+                node = self._root
+                for word in words:
+                    node = node.setdefault(word, {})
+                ending: Dict[str, List[int]] = node.setdefault(None, {})
+                ending.setdefault(keyword, []).append(intent_id)
+
+    @staticmethod
+    def word_forms(word: str) -> List[str]:
+        """The keyword words `word` can match: itself, its stems without an inflection
+        suffix, and (unless it is one of NOT_KEYWORD_FORMS) its prefixes of
+        MIN_PREFIX_LENGTH letters or more."""
+        forms = {word: None}
+        for suffix in INFLECTION_SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+                forms[word[:-len(suffix)]] = None
+        if word not in NOT_KEYWORD_FORMS:
+            for end in range(MIN_PREFIX_LENGTH, len(word)):
+                forms[word[:end]] = None
+        return list(forms)
+
+    def classify(self, text: str) -> Intents:
+        """Every intent with a keyword in `text`, in a single pass over its words."""
+        words = tokenize(text)
+        forms = [self.word_forms(word) for word in words]
+        found: Dict[int, Dict[str, None]] = {}
+        root = self._root
+        for start in range(len(words)):
+            nodes = [root[form] for form in forms[start] if form in root]
+            position = start
+            while nodes:
+                for node in nodes:
+                    for keyword, intent_ids in node.get(None, {}).items():
+                        for intent_id in intent_ids:
+                            found.setdefault(intent_id, {})[keyword] = None
+                position += 1
+                if position == len(words):
+                    break
+                nodes = [node[form] for node in nodes for form in forms[position] if form in node]
+        return Intents({self.intents[intent_id]: tuple(keywords) for intent_id, keywords in sorted(found.items())})
+
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> IntentClassifier:
+    """Process-wide classifier for INTENT_KEYWORDS, compiled on first use."""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            _classifier = IntentClassifier(INTENT_KEYWORDS)
+        return _classifier
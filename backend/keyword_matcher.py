@@ -0,0 +1,165 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from search_index import TokenizedBatch, tokenize, tokenize_documents
+
+
+class KeywordMatcher:
+    def __init__(self, keywords: Iterable[str]):
+        """Initialize a whole-word matcher for a set of keywords or multi-word phrases.
+
+        Matching works on word tokens, so "bad" does not match inside "badge" and
+        "sore throat" only matches the two words in sequence.
+        """
+        self.keywords: List[str] = list(dict.fromkeys(keywords))
+        self.patterns: List[Tuple[str, ...]] = [tuple(tokenize(keyword)) for keyword in self.keywords]
+
+    def match(self, batch: TokenizedBatch) -> Tuple[np.ndarray, np.ndarray]:
+        """Every keyword occurrence in a tokenized batch, as (document, keyword id) arrays.
+
+        One vectorized pass maps each token to the group of keywords starting with
+        it; the remaining words of phrases are only checked at those positions.
+        """
+        empty = np.empty(0, dtype=np.int64)
+        if len(batch.codes) == 0:
+            return empty, empty
+
+        vocab = pd.Index(batch.vocab)
+        codes = np.asarray(batch.codes, dtype=np.int64)
+        documents = np.repeat(np.arange(len(batch.lengths), dtype=np.int64), batch.lengths)
+
+        # Keywords grouped by the vocabulary code of their first word
+        groups: Dict[int, List[int]] = {}
+        for keyword_id, pattern in enumerate(self.patterns):
+            if pattern:
+                code = vocab.get_indexer([pattern[0]])[0]
+                if code >= 0:
+                    groups.setdefault(int(code), []).append(keyword_id)
+        if not groups:
+            return empty, empty
+
+        first_words = np.full(len(vocab), -1, dtype=np.int64)
+        group_codes = list(groups)
+        first_words[group_codes] = np.arange(len(group_codes))
+        positions = np.flatnonzero(first_words[codes] >= 0)
+        candidate_groups = first_words[codes[positions]]
+
+        hit_documents, hit_keywords = [], []
+        for group, code in enumerate(group_codes):
+            starts = positions[candidate_groups == group]
+            for keyword_id in groups[code]:
+                found = starts
+                for offset, word in enumerate(self.patterns[keyword_id][1:], 1):
+                    word_code = vocab.get_indexer([word])[0]
+                    found = found[found + offset < len(codes)]
+                    if word_code < 0 or len(found) == 0:
+                        found = found[:0]
+                        break
+                    # The next word must follow in the same document
+                    found = found[(codes[found + offset] == word_code) &
+                                  (documents[found + offset] == documents[found])]
+                hit_documents.append(documents[found])
+                hit_keywords.append(np.full(len(found), keyword_id, dtype=np.int64))
+
+        return np.concatenate(hit_documents), np.concatenate(hit_keywords)
+
+    def count(self, texts_lower: pd.Series) -> Dict[str, int]:
+        """Occurrences of each keyword across lowercase texts."""
+        _, keyword_ids = self.match(tokenize_documents(texts_lower))
+        counts = np.bincount(keyword_ids, minlength=len(self.keywords))
+        return dict(zip(self.keywords, counts.tolist()))
+
+
+class KeywordCounts:
+    def __init__(self, keywords: List[str]):
+        """Initialize per-document and aggregate keyword counts, filled batch by batch."""
+        self.keywords = list(keywords)
+        self.occurrences = np.zeros(len(self.keywords), dtype=np.int64)
+        self.documents = np.zeros(len(self.keywords), dtype=np.int64)
+        self._keys = np.empty(0, dtype=np.int64)   # document * len(keywords) + keyword id, sorted
+        self._counts = np.empty(0, dtype=np.int64)
+        self._key_buffer: Optional[np.ndarray] = None   # room for _keys/_counts to grow into
+        self._count_buffer: Optional[np.ndarray] = None
+
+    def add(self, document_ids: np.ndarray, keyword_ids: np.ndarray, first_document: int = 0):
+        """Add the matches of a batch whose documents are numbered from `first_document`."""
+        if len(keyword_ids) == 0:
+            return
+        keys = (document_ids + first_document) * len(self.keywords) + keyword_ids
+        keys, counts = np.unique(keys, return_counts=True)
+        keyword_of_key = keys % len(self.keywords)
+        self.occurrences += np.bincount(keyword_of_key, weights=counts, minlength=len(self.keywords)).astype(np.int64)
+        self.documents += np.bincount(keyword_of_key, minlength=len(self.keywords))
+        if len(self._keys) and keys[0] <= self._keys[-1]:
+            # Documents out of order: merge with the existing counts
+            keys = np.concatenate((self._keys, keys))
+            counts = np.concatenate((self._counts, counts))
+            order = np.argsort(keys, kind='stable')
+            keys, counts = keys[order], counts[order]
+            keys, starts = np.unique(keys, return_index=True)
+            self._keys, self._counts = keys, np.add.reduceat(counts, starts)
+        else:
+            self._keys, self._key_buffer = self._appended(self._keys, self._key_buffer, keys)
+            self._counts, self._count_buffer = self._appended(self._counts, self._count_buffer, counts)
+
+    @staticmethod
+    def _appended(view: np.ndarray, buffer: Optional[np.ndarray],
+                  values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """`view` with `values` appended, as a view of `buffer` (reallocated at double the size
+        when full, or when `view` was replaced by a merge or removal)."""
+        start, end = len(view), len(view) + len(values)
+        if buffer is None or view.base is not buffer or len(buffer) < end:
+            buffer = np.empty(max(end, 2 * start, 1024), dtype=np.int64)
+            buffer[:start] = view
+        buffer[start:end] = values
+        return buffer[:end], buffer
+
+    def remove(self, documents: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Drop the counts of some documents, returning their matches as (position in `documents`,
+        keyword id) arrays with one entry per keyword each mentioned."""
+        documents = np.asarray(documents, dtype=np.int64)
+        lo = np.searchsorted(self._keys, documents * len(self.keywords))
+        hi = np.searchsorted(self._keys, (documents + 1) * len(self.keywords))
+        positions = np.repeat(np.arange(len(documents)), hi - lo)
+        removed = np.concatenate([np.arange(start, end) for start, end in zip(lo, hi)] or [np.empty(0, np.int64)])
+        if len(removed) == 0:
+            return positions, removed
+        
+        keyword_ids = self._keys[removed] % len(self.keywords)
+        self.occurrences -= np.bincount(keyword_ids, weights=self._counts[removed],
+                                        minlength=len(self.keywords)).astype(np.int64)
+        self.documents -= np.bincount(keyword_ids, minlength=len(self.keywords))
+        keep = np.ones(len(self._keys), dtype=bool)
+        keep[removed] = False
+        self._keys, self._counts = self._keys[keep], self._counts[keep]
+        return positions, keyword_ids
+
+    def totals(self) -> Dict[str, int]:
+        """Occurrences of each keyword across all documents."""
+        return dict(zip(self.keywords, self.occurrences.tolist()))
+
+    def document_counts(self) -> Dict[str, int]:
+        """Number of documents mentioning each keyword."""
+        return dict(zip(self.keywords, self.documents.tolist()))
+
+    def for_document(self, document: int) -> Dict[str, int]:
+        """Keyword occurrences in one document (keywords it does not mention are left out)."""
+        lo = np.searchsorted(self._keys, document * len(self.keywords))
+        hi = np.searchsorted(self._keys, (document + 1) * len(self.keywords))
+        return {self.keywords[key % len(self.keywords)]: int(count)
+                for key, count in zip(self._keys[lo:hi].tolist(), self._counts[lo:hi].tolist())}
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {"keyword_keys": self._keys, "keyword_counts": self._counts}
+
+    @classmethod
+    def from_arrays(cls, keywords: List[str], arrays: Dict[str, np.ndarray]) -> "KeywordCounts":
+        """Rebuild counts saved with to_arrays."""
+        counts = cls(keywords)
+        counts._keys = np.asarray(arrays["keyword_keys"], dtype=np.int64)
+        counts._counts = np.asarray(arrays["keyword_counts"], dtype=np.int64)
+        keyword_of_key = counts._keys % len(keywords) if keywords else counts._keys
+        counts.occurrences = np.bincount(keyword_of_key, weights=counts._counts,
+                                         minlength=len(keywords)).astype(np.int64)
+        counts.documents = np.bincount(keyword_of_key, minlength=len(keywords))
+        return counts
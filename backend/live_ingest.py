@@ -0,0 +1,236 @@
+import csv
+import io
+import os
+import threading
+import zlib
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Tuple
+import pandas as pd
+
+# Bytes before the read position that must be unchanged for a file to count as only appended to
+TAIL_CHECK_BYTES = 4096
+
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+
+# A CSV record still open (inside a quoted field) at the end of the file is waited for
+# until it grows past this size, then skipped as malformed
+MAX_PENDING_RECORD_BYTES = 1 << 20
+
+
+class FilePosition(NamedTuple):
+    """How far a growing file has been read."""
+    offset: int    # bytes consumed, always just after a newline
+    checksum: int  # crc32 of the TAIL_CHECK_BYTES before offset
+
+
+def file_position(path: str, offset: int) -> FilePosition:
+    with open(path, 'rb') as handle:
+        start = max(0, offset - TAIL_CHECK_BYTES)
+        handle.seek(start)
+        return FilePosition(offset, zlib.crc32(handle.read(offset - start)))
+
+
+def is_continuation(path: str, position: FilePosition) -> bool:
+    """Whether the file still starts with what was read up to `position` (it was only appended to).
+
+    Only the bytes just before the position are compared, which catches files that
+    were truncated, rotated or rewritten without rereading the whole file.
+    """
+    try:
+        if os.path.getsize(path) < position.offset:
+            return False
+        start = max(0, position.offset - TAIL_CHECK_BYTES)
+        with open(path, 'rb') as handle:
+            handle.seek(start)
+            before = handle.read(position.offset - start)
+    except OSError:
+        return False
+    return (not before or before.endswith(b'\n')) and zlib.crc32(before) == position.checksum
+
+
+def parse_lines(data: bytes, json_lines: bool, names: Optional[List[str]] = None,
+                usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """Rows of complete CSV (without header) or JSON Lines lines; raises ValueError on a malformed line."""
+    lines = io.BytesIO(data)
+    if json_lines:
+        frame = pd.read_json(lines, lines=True)
+        if usecols is not None:
+            frame = frame[[column for column in frame.columns if column in usecols]]
+        return frame
+    return pd.read_csv(lines, header=None, names=names, usecols=usecols)
+
+
+def report_bad_line(line: bytes, error: Exception):
+    print(f"Skipping malformed line {line[:200]!r}: {error}")
+
+
+def csv_records(data: bytes) -> Iterator[Tuple[bytes, Optional[csv.Error]]]:
+    """Split complete CSV lines into records (a quoted field may span lines), each with
+    the csv.Error that makes it malformed, or None."""
+    lines = io.BytesIO(data).readlines()
+    reader = csv.reader((line.decode('utf-8', 'surrogateescape') for line in lines), strict=True)
+    while True:
+        start = reader.line_num
+        try:
+            next(reader)
+            error = None
+        except StopIteration:
+            return
+        except csv.Error as e:
+            error = e
+        yield b''.join(lines[start:reader.line_num]), error
+
+
+def read_appended_rows(path: str, position: FilePosition, names: Optional[List[str]] = None,
+                       usecols: Optional[List[str]] = None,
+                       on_bad_line: Callable[[bytes, Exception], None] = report_bad_line
+                       ) -> Tuple[pd.DataFrame, FilePosition]:
+    """Rows in the complete lines appended to a CSV or JSON Lines file after `position`.
+
+    CSV lines carry no header, so the file's column `names` are required for CSV;
+    a line (or a CSV record with a quoted field) still being written is left for
+    the next call. Malformed lines or records are passed to `on_bad_line` and
+    skipped, so one bad line cannot stop the file from being read. Returns the
+    rows and the position after them.
+    """
+    with open(path, 'rb') as handle:
+        handle.seek(position.offset)
+        appended = handle.read()
+    end = appended.rfind(b'\n') + 1
+    if end == 0:
+        return pd.DataFrame(), position
+    new_position = file_position(path, position.offset + end)
+    if not appended[:end].strip():
+        return pd.DataFrame(), new_position
+
+    json_lines = path.lower().endswith(JSON_LINES_EXTENSIONS)
+    try:
+        return parse_lines(appended[:end], json_lines, names, usecols), new_position
+    except ValueError:
+        pass
+
+    # Some record is malformed: split the lines into records and keep the good ones
+    if json_lines:
+        records = [(line, None) for line in io.BytesIO(appended[:end]).readlines()]
+    else:
+        records = list(csv_records(appended[:end]))
+        last, error = records[-1] if records else (b'', None)
+        if error is not None and str(error) == "unexpected end of data" and len(last) < MAX_PENDING_RECORD_BYTES:
+            # A quoted field still open at the end of the file: its record may be unfinished
+            records.pop()
+            end -= len(last)
+            new_position = file_position(path, position.offset + end)
+    good = []
+    for record, error in records:
+        if error is not None:
+            on_bad_line(record, error)
+        elif record.strip():
+            good.append(record)
+    try:
+        frame = parse_lines(b''.join(good), json_lines, names, usecols) if good else pd.DataFrame()
+    except ValueError:
+        # Well-formed records pandas still rejects (e.g. too many fields): parse them one at a time
+        frames = []
+        for record in good:
+            try:
+                frames.append(parse_lines(record, json_lines, names, usecols))
+            except ValueError as e:
+                on_bad_line(record, e)
+        frames = [frame for frame in frames if not frame.empty]
+        frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return frame, new_position
+
+
+def csv_header(path: str) -> Tuple[List[str], FilePosition]:
+    """Column names of a CSV file and the position just after its header line."""
+    with open(path, 'rb') as handle:
+        header = handle.readline()
+    if not header.endswith(b'\n'):
+        return [], FilePosition(0, zlib.crc32(b''))
+    names = list(pd.read_csv(io.BytesIO(header), nrows=0).columns)
+    return names, file_position(path, len(header))
+
+
+class FileTailer:
+    def __init__(self, get_processor: Callable[[], Any], feed_path: Optional[str] = None, interval: float = 2.0):
+        """Initialize a background poller that keeps a data processor up to date with growing files.
+
+        Every `interval` seconds it fetches the processor (which picks up rows appended
+        to its own CSV) and upserts complete lines appended to `feed_path`, a CSV or
+        JSON Lines file, by tweet id. The feed is read from the start once, so
+        restarting re-upserts the same tweets rather than duplicating them.
+        """
+        self.get_processor = get_processor
+        self.feed_path = feed_path
+        self.interval = interval
+        self.position: Optional[FilePosition] = None
+        self.names: Optional[List[str]] = None
+        self.rows_ingested = 0
+        self.bad_lines = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def poll(self) -> int:
+        """Check the files once; returns the number of feed rows upserted."""
+        processor = self.get_processor()
+        if not self.feed_path or not os.path.exists(self.feed_path):
+            return 0
+
+        if self.position is None or not is_continuation(self.feed_path, self.position):
+            if self.position is not None:
+                print(f"{self.feed_path} was replaced, reading it from the start")
+            if self.feed_path.lower().endswith(JSON_LINES_EXTENSIONS):
+                self.names, self.position = None, FilePosition(0, zlib.crc32(b''))
+            else:
+                self.names, self.position = csv_header(self.feed_path)
+                if not self.names:
+                    self.position = None
+                    return 0
+
+        frame, self.position = read_appended_rows(self.feed_path, self.position, self.names,
+                                                  on_bad_line=self.skip_bad_line)
+        if frame.empty:
+            return 0
+        added = processor.upsert_tweets(frame)
+        self.rows_ingested += added
+        return added
+
+    def skip_bad_line(self, line: bytes, error: Exception):
+        self.bad_lines += 1
+        print(f"Skipping malformed line of {self.feed_path} {line[:200]!r}: {error}")
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"File tailer error: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Poll on a daemon thread until stop() is called."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name="file-tailer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+
+    def stats(self) -> dict:
+        return {
+            "feed_path": self.feed_path,
+            "interval_seconds": self.interval,
+            "offset": self.position.offset if self.position else 0,
+            "rows_ingested": self.rows_ingested,
+            "bad_lines_skipped": self.bad_lines
+        }
+
+
+def create_file_tailer(get_processor: Callable[[], Any]) -> Optional[FileTailer]:
+    """File tailer configured by DATA_WATCH_INTERVAL (seconds, 0 disables) and DATA_FEED_PATH."""
+    interval = float(os.getenv('DATA_WATCH_INTERVAL', '0'))
+    if interval <= 0:
+        return None
+    return FileTailer(get_processor, os.getenv('DATA_FEED_PATH') or None, interval)
@@ -0,0 +1,318 @@
+import asyncio
+import json
+import os
+import time
+from typing import Optional, Dict, Any, AsyncIterator, Awaitable, Callable
+import httpx
+from circuit_breaker import CircuitBreaker, get_breaker
+from prompt_cache import PrefixCache, cached_content_body, system_instruction_content
+from rate_limiter import ProviderRateLimiter, PRIORITY_NORMAL, estimate_tokens, get_rate_limiter
+
+DEFAULT_GEMINI_API_BASE = "https://generativelanguage.googleapis.com"
+
+# Statuses Gemini answers with when a request names a cached prefix it no longer holds
+STALE_CACHE_STATUSES = (400, 403, 404)
+
+# Finish reasons for an answer Gemini withheld under its content policies
+BLOCKED_FINISH_REASONS = frozenset({"SAFETY", "BLOCKLIST", "PROHIBITED_CONTENT", "SPII", "RECITATION"})
+
+
+def candidate_text(data: Dict[str, Any]) -> Optional[str]:
+    """Text of the first candidate of a generateContent response, None if it has none."""
+    for candidate in data.get('candidates', [])[:1]:
+        text = "".join(part.get('text', '') for part in candidate.get('content', {}).get('parts', []))
+        return text or None
+    return None
+
+
+def blocked_reason(data: Dict[str, Any]) -> str:
+    """Why a generateContent response carries no answer ("" if nothing says so)."""
+    reason = data.get('promptFeedback', {}).get('blockReason')
+    if reason:
+        return reason
+    for candidate in data.get('candidates', [])[:1]:
+        if candidate.get('finishReason') in BLOCKED_FINISH_REASONS:
+            return candidate['finishReason']
+    return ""
+
+
+class AsyncGeminiClient:
+    def __init__(self, api_key: Optional[str] = None, api_base: Optional[str] = None,
+                 max_connections: Optional[int] = None, max_keepalive: Optional[int] = None,
+                 max_concurrency: Optional[int] = None, timeout: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None, rate_limiter: Optional[ProviderRateLimiter] = None,
+                 prefix_cache: Optional[PrefixCache] = None):
+        """Initialize a non-blocking Gemini client backed by a shared connection pool.
+
+        With a `prefix_cache`, system instructions passed with a cache key are sent as
+        a cachedContents reference once registered (see maintain_prefix_cache()).
+        """
+        self.api_key = api_key if api_key is not None else os.getenv('GEMINI_API_KEY')
+        self.api_base = (api_base or os.getenv('GEMINI_API_BASE') or DEFAULT_GEMINI_API_BASE).rstrip('/')
+        self.max_connections = max_connections or int(os.getenv('GEMINI_MAX_CONNECTIONS', '100'))
+        self.max_keepalive = max_keepalive or int(os.getenv('GEMINI_MAX_KEEPALIVE', '20'))
+        self.max_concurrency = max_concurrency or int(os.getenv('GEMINI_MAX_CONCURRENCY', '64'))
+        self.timeout = timeout or float(os.getenv('GEMINI_TIMEOUT', '30'))
+        self.breaker = breaker or get_breaker("gemini")
+        self.rate_limiter = rate_limiter or get_rate_limiter("gemini", self.api_key or "")
+        self.prefix_cache = prefix_cache
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def start(self):
+        """Open the keep-alive connection pool (called once at app startup)."""
+        if self._client is not None:
+            return
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive
+        )
+        self._client = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(self.timeout))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        """Close the connection pool (called once at app shutdown)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+
+    @property
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    def model_url(self, model: str, method: str = "generateContent") -> str:
+        """Build the REST URL for a model method."""
+        return f"{self.api_base}/v1beta/models/{model}:{method}?key={self.api_key}"
+
+    @staticmethod
+    def build_payload(prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                      system_instruction: Optional[str] = None, cached_content: Optional[str] = None) -> Dict[str, Any]:
+        """generateContent request body; a `cached_content` name stands in for the system instruction."""
+        payload = {
+            "contents": [{
+                "parts": [{
+                    "text": prompt
+                }]
+            }],
+            "generationConfig": generation_config or {}
+        }
+        if cached_content:
+            payload["cachedContent"] = cached_content
+        elif system_instruction:
+            payload["systemInstruction"] = system_instruction_content(system_instruction)
+        return payload
+
+    def cached_prefix(self, model: str, system_instruction: Optional[str], cache_key: str) -> Optional[str]:
+        """The cachedContents name to send instead of `system_instruction`, if it is cached for `model`."""
+        if self.prefix_cache is None or not cache_key or not system_instruction or self.prefix_cache.model != model:
+            return None
+        return self.prefix_cache.lookup(cache_key, system_instruction)
+
+    async def create_cached_content(self, model: str, system_instruction: str, ttl: float,
+                                    display_name: str = "") -> Optional[str]:
+        """Register a system instruction with the cachedContents API; returns its name, None on failure."""
+        if self._client is None:
+            await self.start()
+        response = await self._client.post(f"{self.api_base}/v1beta/cachedContents?key={self.api_key}",
+                                           json=cached_content_body(model, system_instruction, ttl, display_name))
+        if response.status_code != 200:
+            print(f"Gemini cachedContents error - Status: {response.status_code}, Response: {response.text[:200]}")
+            return None
+        return response.json().get("name")
+
+    async def update_cached_content(self, name: str, ttl: float) -> bool:
+        """Extend a cached prefix's lifetime to `ttl` seconds from now."""
+        if self._client is None:
+            await self.start()
+        response = await self._client.patch(f"{self.api_base}/v1beta/{name}?key={self.api_key}&updateMask=ttl",
+                                            json={"ttl": f"{int(ttl)}s"})
+        return response.status_code == 200
+
+    async def maintain_prefix_cache(self):
+        """Register and refresh the prefix cache's entries until cancelled (run as a background task)."""
+        cache = self.prefix_cache
+        if cache is None or not self.api_key:
+            return
+        await cache.maintain(
+            lambda key, text: self.create_cached_content(cache.model, text, cache.ttl, key),
+            lambda name: self.update_cached_content(name, cache.ttl)
+        )
+
+    async def acquire_quota(self, prompt: str, generation_config: Optional[Dict[str, Any]], priority: int):
+        """Wait for request and token quota; raises RateLimitExceeded if none frees up in time."""
+        max_output_tokens = (generation_config or {}).get("maxOutputTokens", 0)
+        await self.rate_limiter.acquire_async(estimate_tokens(prompt, max_output_tokens), priority)
+
+    async def generate(self, model: str, prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                       priority: int = PRIORITY_NORMAL, system_instruction: Optional[str] = None,
+                       cache_key: str = "") -> Optional[str]:
+        """Generate a completion without blocking the event loop.
+
+        `system_instruction` is sent from the prefix cache under `cache_key` when it is
+        cached there, inline otherwise. Returns None on failure, or immediately while
+        the provider's circuit breaker is open. Raises RateLimitExceeded when the
+        request cannot get quota. Quota rejections (429) and blocked or empty
+        answers are not counted against the breaker.
+        """
+        if not self.api_key:
+            return None
+        # Check the breaker first, so calls it would reject never spend quota
+        admission = self.breaker.allow_request()
+        if not admission:
+            return None
+        try:
+            await self.acquire_quota((system_instruction or "") + prompt, generation_config, priority)
+        except BaseException:
+            self.breaker.release(admission)
+            raise
+        if self._client is None:
+            await self.start()
+
+        cached_content = self.cached_prefix(model, system_instruction, cache_key)
+        payload = self.build_payload(prompt, generation_config, system_instruction, cached_content)
+
+        started = time.perf_counter()
+        result = None
+        declined = False
+        try:
+            async with self._semaphore:
+                response = await self._client.post(self.model_url(model), json=payload)
+                if cached_content and response.status_code in STALE_CACHE_STATUSES:
+                    # The cached prefix expired or was deleted upstream; resend it inline
+                    self.prefix_cache.invalidate(cache_key, cached_content)
+                    payload = self.build_payload(prompt, generation_config, system_instruction)
+                    response = await self._client.post(self.model_url(model), json=payload)
+
+            if response.status_code != 200:
+                self.rate_limiter.record_response(response.status_code, response.headers.get("Retry-After"))
+                print(f"Gemini API error - Status: {response.status_code}, Response: {response.text[:200]}")
+                declined = response.status_code == 429
+            else:
+                data = response.json()
+                result = candidate_text(data)
+                if not result:
+                    print(f"Gemini returned no answer: {blocked_reason(data) or 'no candidates'}")
+                    declined = True
+            return result
+        finally:
+            if declined:
+                self.breaker.release(admission)
+            elif result:
+                self.breaker.record_success(time.perf_counter() - started, admission)
+            else:
+                self.breaker.record_failure(time.perf_counter() - started, admission)
+
+    async def stream_generate(self, model: str, prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                              priority: int = PRIORITY_NORMAL, system_instruction: Optional[str] = None,
+                              cache_key: str = "") -> AsyncIterator[str]:
+        """Yield text chunks from streamGenerateContent as they arrive.
+
+        The system instruction is sent as in generate(). Raises on HTTP or network
+        errors (and RateLimitExceeded without quota) so callers can decide how to
+        fall back. Yields nothing while the provider's circuit breaker is open.
+        As in generate(), a 429 or a stream without text does not count against it.
+        """
+        if not self.api_key:
+            return
+        admission = self.breaker.allow_request()
+        if not admission:
+            return
+        try:
+            await self.acquire_quota((system_instruction or "") + prompt, generation_config, priority)
+        except BaseException:
+            self.breaker.release(admission)
+            raise
+        if self._client is None:
+            await self.start()
+
+        cached_content = self.cached_prefix(model, system_instruction, cache_key)
+        url = self.model_url(model, "streamGenerateContent") + "&alt=sse"
+
+        started = time.perf_counter()
+        first_chunk_latency = None
+        declined = False
+        try:
+            async with self._semaphore:
+                response = await self._open_stream(url, prompt, generation_config, system_instruction, cached_content)
+                if cached_content and response.status_code in STALE_CACHE_STATUSES:
+                    # The cached prefix expired or was deleted upstream; resend it inline
+                    await response.aclose()
+                    self.prefix_cache.invalidate(cache_key, cached_content)
+                    response = await self._open_stream(url, prompt, generation_config, system_instruction, None)
+                try:
+                    if response.status_code != 200:
+                        self.rate_limiter.record_response(response.status_code, response.headers.get("Retry-After"))
+                        declined = response.status_code == 429
+                        body = await response.aread()
+                        raise httpx.HTTPStatusError(
+                            f"Gemini stream error - Status: {response.status_code}, Response: {body[:200]!r}",
+                            request=response.request, response=response
+                        )
+                    async for line in response.aiter_lines():
+                        text = parse_sse_chunk(line)
+                        if text:
+                            if first_chunk_latency is None:
+                                first_chunk_latency = time.perf_counter() - started
+                            yield text
+                    # A complete stream without text is a blocked or empty answer
+                    declined = first_chunk_latency is None
+                finally:
+                    await response.aclose()
+        finally:
+            # Health is judged on time to first chunk for streams
+            if first_chunk_latency is not None:
+                self.breaker.record_success(first_chunk_latency, admission)
+            elif declined:
+                self.breaker.release(admission)
+            else:
+                self.breaker.record_failure(time.perf_counter() - started, admission)
+
+    async def _open_stream(self, url: str, prompt: str, generation_config: Optional[Dict[str, Any]],
+                           system_instruction: Optional[str], cached_content: Optional[str]) -> httpx.Response:
+        payload = self.build_payload(prompt, generation_config, system_instruction, cached_content)
+        request = self._client.build_request("POST", url, json=payload)
+        return await self._client.send(request, stream=True)
+
+
+def parse_sse_chunk(line: str) -> str:
+    """Extract the candidate text from one `data:` line of a Gemini SSE stream."""
+    if not line.startswith("data:"):
+        return ""
+    data = json.loads(line[len("data:"):])
+    parts = []
+    for candidate in data.get('candidates', [])[:1]:
+        for part in candidate.get('content', {}).get('parts', []):
+            parts.append(part.get('text', ''))
+    return "".join(parts)
+
+
+class SingleFlight:
+    def __init__(self):
+        """Initialize a coalescer for concurrent identical upstream calls."""
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `func` once per key at a time; concurrent callers with the same key share its result.
+
+        The upstream call runs as its own task, so a caller that disconnects does not
+        cancel it for the others.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced
+        }
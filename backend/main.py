@@ -1,18 +1,106 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import Any, AsyncIterator, Optional, List, Dict, Tuple
+import asyncio
+import json
 import os
-import requests
+import secrets
+import time
 from dotenv import load_dotenv
 import uvicorn
+from llm_client import AsyncGeminiClient, SingleFlight
+from prompt_cache import create_prefix_cache
+from response_cache import create_response_cache, make_key
+from conversation_store import SUMMARY_ROLE, create_conversation_store
+from conversation_summarizer import create_conversation_summarizer
+from circuit_breaker import breaker_stats
+from rate_limiter import RateLimitExceeded, priority_for_service, rate_limiter_stats
+from data_processor import get_data_processor
+from live_ingest import create_file_tailer
+from prompt_builder import (AssembledPrompt, ContextAssembler, HISTORY_MESSAGE_TOKENS, PRIORITY_HISTORY, prompt_stats,
+                            prompt_token_budget)
 
 # Load environment variables
 load_dotenv()
 
+# Get Gemini API key
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "topK": 40,
+    "topP": 0.95,
+    "maxOutputTokens": 1200,
+}
+
+# /api/chat/batch: items answered at once per batch (requests may ask for fewer), and items per batch
+CHAT_BATCH_CONCURRENCY = int(os.getenv('CHAT_BATCH_CONCURRENCY', '16'))
+CHAT_BATCH_MAX_ITEMS = int(os.getenv('CHAT_BATCH_MAX_ITEMS', '500'))
+
+# Tweet dataset behind /api/trends, loaded on first use
+OMICRON_CSV_PATH = os.getenv('OMICRON_CSV_PATH', 'omicron_2025.csv')
+
+# Key /api/tweets requests must send in X-Admin-Key; the endpoint is disabled while unset
+TWEETS_ADMIN_KEY = os.getenv('TWEETS_ADMIN_KEY', '')
+
+# Cache of Gemini answers keyed on the normalized (message, service, model, generationConfig)
+response_cache = create_response_cache()
+
+# Concurrent identical prompts share one upstream Gemini call
+gemini_flights = SingleFlight()
+
+# Per-session chat history for requests that carry a session_id
+conversation_store = create_conversation_store()
+
+# Shared async Gemini client; its connection pool lives for the lifetime of the app.
+# With GEMINI_PROMPT_CACHE=on, each service's system instruction is cached upstream once.
+gemini_client = AsyncGeminiClient(api_key=GEMINI_API_KEY, prefix_cache=create_prefix_cache(GEMINI_MODEL))
+
+# Event loop the app runs on, for Gemini calls made from background threads
+app_loop: Optional[asyncio.AbstractEventLoop] = None
+
+SUMMARY_GENERATION_CONFIG = {"temperature": 0.2, "maxOutputTokens": 512}
+
+def complete_in_background(prompt: str) -> Optional[str]:
+    """Run a Gemini completion on the app's event loop from a worker thread."""
+    if not GEMINI_API_KEY or app_loop is None:
+        return None
+    future = asyncio.run_coroutine_threadsafe(
+        gemini_client.generate(GEMINI_MODEL, prompt, SUMMARY_GENERATION_CONFIG), app_loop
+    )
+    return future.result(timeout=60)
+
+# Optional background compaction of long sessions into a running summary (CONVERSATION_SUMMARIZE_AFTER)
+conversation_summarizer = create_conversation_summarizer(conversation_store, complete_in_background)
+
+# Optional background ingestion of rows appended to the dataset or a feed file (DATA_WATCH_INTERVAL)
+file_tailer = create_file_tailer(lambda: get_data_processor(OMICRON_CSV_PATH))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared Gemini connection pool and start the background workers on startup; stop them on shutdown."""
+    global app_loop
+    app_loop = asyncio.get_running_loop()
+    await gemini_client.start()
+    prefix_cache_task = asyncio.create_task(gemini_client.maintain_prefix_cache())
+    if file_tailer:
+        file_tailer.start()
+    yield
+    prefix_cache_task.cancel()
+    if file_tailer:
+        await asyncio.to_thread(file_tailer.stop)
+    if conversation_summarizer:
+        await asyncio.to_thread(conversation_summarizer.stop)
+    await gemini_client.close()
+
 app = FastAPI(
     title="MediCare AI API",
     description="Healthcare Assistant API powered by Gemini AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS for React frontend
@@ -35,13 +123,36 @@ class ChatRequest(BaseModel):
     message: str
     userName: str = ""
     selectedService: str = ""
+    session_id: str = ""
+
+class TweetsRequest(BaseModel):
+    tweets: List[Dict[str, Any]]
+    upsert: bool = True
 
 class ChatResponse(BaseModel):
     response: str
     success: bool = True
 
-# Get Gemini API key
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatRequest]
+    max_concurrency: Optional[int] = None
+
+class ChatBatchItem(BaseModel):
+    index: int
+    status: str  # "ok", "fallback" (canned answer, Gemini unavailable), "rate_limited" or "error"
+    response: str = ""
+    success: bool = True
+    error: str = ""
+    retry_after: Optional[int] = None
+    elapsed_ms: float = 0
+
+class ChatBatchResponse(BaseModel):
+    results: List[ChatBatchItem]
+    success: bool = True
+    succeeded: int = 0
+    fallbacks: int = 0
+    failed: int = 0
+    elapsed_ms: float = 0
 
 def get_service_context(service: str) -> str:
     """Get context for specific medical services."""
@@ -55,31 +166,7 @@ def get_service_context(service: str) -> str:
     }
     return service_contexts.get(service, "You are a healthcare assistant providing general medical information.")
 
-async def get_gemini_response(message: str, user_name: str = "", service: str = "") -> str:
-    """Get response from Gemini API."""
-    if not GEMINI_API_KEY:
-        return get_fallback_response(message, user_name, service)
-    
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={GEMINI_API_KEY}"
-    
-    service_context = get_service_context(service)
-    
-    prompt = f"""You are MediCare AI, a comprehensive healthcare assistant.
-
-User: {user_name if user_name else "User"}
-Service Selected: {service if service else "General Consultation"}
-
-{service_context}
-
-PRIORITY ORDER:
-1. GENERAL HEALTH QUERIES (highest priority)
-2. Service-specific assistance 
-3. Emergency medical guidance
-4. Insurance and appointment help
-
-User Query: {message}
-
-Instructions:
+PROMPT_INSTRUCTIONS = """Instructions:
 - Be professional, caring, and comprehensive
 - Prioritize general health guidance and service-specific help
 - Provide actionable, practical advice
@@ -89,32 +176,135 @@ Instructions:
 
 Response format: Professional, well-structured with clear sections and helpful guidance."""
 
+PRIORITY_ORDER = """PRIORITY ORDER:
+1. GENERAL HEALTH QUERIES (highest priority)
+2. Service-specific assistance 
+3. Emergency medical guidance
+4. Insurance and appointment help"""
+
+def build_system_instruction(service: str = "") -> str:
+    """The static part of the Gemini prompt for a service, sent as its system instruction."""
+    return f"""You are MediCare AI, a comprehensive healthcare assistant.
+
+Service Selected: {service if service else "General Consultation"}
+
+{get_service_context(service)}
+
+{PRIORITY_ORDER}
+
+{PROMPT_INSTRUCTIONS}"""
+
+def assemble_prompt(message: str, user_name: str = "", service: str = "",
+                    history: Optional[List[Dict[str, str]]] = None) -> AssembledPrompt:
+    """The per-request Gemini prompt for a chat message fitted into PROMPT_TOKEN_BUDGET, with its token breakdown.
+    
+    The service's system instruction (sent separately) and the question always fit;
+    the session's summary of compacted turns (a SUMMARY_ROLE message at the start
+    of `history`) comes next, and the recent messages fill what is left, newest first.
+    """
+    assembler = ContextAssembler(prompt_token_budget())
+    assembler.reserve("system", build_system_instruction(service))
+    assembler.add("user", f"User: {user_name if user_name else 'User'}")
+    history = history or []
+    if history and history[0]["role"] == SUMMARY_ROLE:
+        assembler.add("summary", f"Conversation so far:\n{history[0]['content']}", PRIORITY_HISTORY)
+        history = history[1:]
+    messages = [f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" for msg in history]
+    assembler.add_items("history", messages, PRIORITY_HISTORY, header="Recent conversation:",
+                        keep_last=True, item_tokens=HISTORY_MESSAGE_TOKENS)
+    assembler.add("query", f"User Query: {message}")
+    return assembler.build()
+
+def build_prompt(message: str, user_name: str = "", service: str = "",
+                 history: Optional[List[Dict[str, str]]] = None) -> str:
+    """Build the per-request Gemini prompt for a chat message (see build_system_instruction for the rest)."""
+    prompt = assemble_prompt(message, user_name, service, history)
+    prompt_stats.record(prompt)
+    return prompt.text
+
+def get_cache_key(message: str, user_name: str = "", service: str = "",
+                  history: Optional[List[Dict[str, str]]] = None) -> str:
+    """Response cache key for a chat message, or "" when caching is disabled.
+    
+    Answers that depend on earlier turns of a conversation are not cached.
+    """
+    if response_cache is None or history:
+        return ""
+    return response_cache.make_key(message, service, GEMINI_MODEL, GENERATION_CONFIG, scope=user_name)
+
+async def get_gemini_response(message: str, user_name: str = "", service: str = "",
+                              history: Optional[List[Dict[str, str]]] = None) -> Tuple[str, bool]:
+    """Get response from Gemini API, and whether it is the canned fallback response instead.
+    
+    Raises RateLimitExceeded when the Gemini quota queue cannot take the request.
+    """
+    if not GEMINI_API_KEY:
+        return get_fallback_response(message, user_name, service), True
+    
+    cache_key = get_cache_key(message, user_name, service, history)
+    if cache_key:
+        cached = response_cache.get(cache_key)
+        if cached:
+            return cached, False
+    
+    prompt = build_prompt(message, user_name, service, history)
+    flight_key = make_key(message, service, GEMINI_MODEL, GENERATION_CONFIG,
+                          scope=json.dumps([user_name, history or []]))
+
     try:
-        payload = {
-            "contents": [{
-                "parts": [{
-                    "text": prompt
-                }]
-            }],
-            "generationConfig": {
-                "temperature": 0.7,
-                "topK": 40,
-                "topP": 0.95,
-                "maxOutputTokens": 1200,
-            }
-        }
-        
-        response = requests.post(url, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if 'candidates' in data and len(data['candidates']) > 0:
-                return data['candidates'][0]['content']['parts'][0]['text']
+        response = await gemini_flights.do(
+            flight_key,
+            lambda: gemini_client.generate(GEMINI_MODEL, prompt, GENERATION_CONFIG,
+                                           priority=priority_for_service(service),
+                                           system_instruction=build_system_instruction(service), cache_key=service)
+        )
+        if response:
+            if cache_key:
+                response_cache.set(cache_key, response)
+            return response, False
                 
+    except RateLimitExceeded:
+        raise
     except Exception as e:
         print(f"Gemini API error: {e}")
         
-    return get_fallback_response(message, user_name, service)
+    return get_fallback_response(message, user_name, service), True
+
+async def stream_gemini_response(message: str, user_name: str = "", service: str = "",
+                                 history: Optional[List[Dict[str, str]]] = None) -> AsyncIterator[str]:
+    """Stream response chunks from Gemini, falling back to the canned response if nothing arrives."""
+    if GEMINI_API_KEY:
+        cache_key = get_cache_key(message, user_name, service, history)
+        cached = response_cache.get(cache_key) if cache_key else None
+        if cached:
+            yield cached
+            return
+        
+        prompt = build_prompt(message, user_name, service, history)
+        chunks = []
+        completed = False
+        try:
+            async for chunk in gemini_client.stream_generate(GEMINI_MODEL, prompt, GENERATION_CONFIG,
+                                                             priority=priority_for_service(service),
+                                                             system_instruction=build_system_instruction(service),
+                                                             cache_key=service):
+                chunks.append(chunk)
+                yield chunk
+            completed = True
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Gemini streaming error: {e}")
+        if chunks:
+            if completed and cache_key:
+                response_cache.set(cache_key, "".join(chunks))
+            return
+    
+    yield get_fallback_response(message, user_name, service)
+
+def sse_event(data: dict) -> str:
+    """Format a server-sent event."""
+    return f"data: {json.dumps(data)}\n\n"
 
 def get_fallback_response(message: str, user_name: str = "", service: str = "") -> str:
     """Fallback response when AI APIs are unavailable."""
@@ -216,6 +406,10 @@ async def root():
         "status": "healthy",
         "endpoints": {
             "chat": "/api/chat",
+            "chat_stream": "/api/chat/stream",
+            "chat_batch": "/api/chat/batch",
+            "trends": "/api/trends",
+            "tweets": "/api/tweets",
             "health": "/health"
         }
     }
@@ -227,26 +421,179 @@ async def health_check():
     return {
         "status": "healthy",
         "gemini_api": api_status,
+        "response_cache": response_cache.stats() if response_cache else "disabled",
+        "conversations": conversation_store.stats(),
+        "conversation_summarizer": conversation_summarizer.stats() if conversation_summarizer else "disabled",
+        "circuit_breakers": breaker_stats(),
+        "single_flight": gemini_flights.stats(),
+        "rate_limits": rate_limiter_stats(),
+        "file_tailer": file_tailer.stats() if file_tailer else "disabled",
+        "prompts": prompt_stats.stats(),
+        "prompt_cache": gemini_client.prefix_cache.stats() if gemini_client.prefix_cache else "disabled",
         "service": "MediCare AI API"
     }
 
+async def answer_chat(request: ChatRequest) -> Tuple[str, bool]:
+    """Answer one chat message and record the turn in its session; returns the answer and
+    whether it is the fallback response.
+    
+    Raises RateLimitExceeded when the Gemini quota queue cannot take the request.
+    """
+    history = conversation_store.history(request.session_id, include_summary=True) if request.session_id else None
+    response, used_fallback = await get_gemini_response(
+        request.message,
+        request.userName,
+        request.selectedService,
+        history
+    )
+    
+    if request.session_id:
+        conversation_store.append(request.session_id, "user", request.message)
+        conversation_store.append(request.session_id, "assistant", response)
+    
+    return response, used_fallback
+
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Main chat endpoint for healthcare assistance."""
     try:
-        response = await get_gemini_response(
-            request.message,
-            request.userName,
-            request.selectedService
-        )
-        
+        response, _ = await answer_chat(request)
         return ChatResponse(response=response, success=True)
         
+    except RateLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e),
+                            headers={"Retry-After": str(max(1, round(e.retry_after)))})
     except Exception as e:
         print(f"Chat error: {e}")
         fallback = get_fallback_response(request.message, request.userName, request.selectedService)
         return ChatResponse(response=fallback, success=True)
 
+@app.post("/api/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(batch: ChatBatchRequest):
+    """Answer many chat messages in one call, up to CHAT_BATCH_CONCURRENCY at a time.
+    
+    Results come back in request order, each with its own status and timing; a
+    failed item gets the canned fallback answer and does not fail the batch. Messages of
+    the same session are answered one after another, in order, so each sees the
+    previous turn.
+    """
+    if len(batch.requests) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {CHAT_BATCH_MAX_ITEMS} messages per batch")
+    
+    limit = min(batch.max_concurrency or CHAT_BATCH_CONCURRENCY, CHAT_BATCH_CONCURRENCY)
+    semaphore = asyncio.Semaphore(max(1, limit))
+    results: List[Optional[ChatBatchItem]] = [None] * len(batch.requests)
+    
+    async def answer(index: int, request: ChatRequest):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response, used_fallback = await answer_chat(request)
+                item = ChatBatchItem(index=index, status="fallback" if used_fallback else "ok", response=response)
+            except RateLimitExceeded as e:
+                item = ChatBatchItem(index=index, status="rate_limited", success=False, error=str(e),
+                                     retry_after=max(1, round(e.retry_after)))
+            except Exception as e:
+                print(f"Chat batch item {index} error: {e}")
+                fallback = get_fallback_response(request.message, request.userName, request.selectedService)
+                item = ChatBatchItem(index=index, status="error", response=fallback, success=False, error=str(e))
+            item.elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            results[index] = item
+    
+    async def answer_in_order(indexes: List[int]):
+        for index in indexes:
+            await answer(index, batch.requests[index])
+    
+    # One chain per session (or per message without one); chains run concurrently
+    chains: Dict[str, List[int]] = {}
+    for index, request in enumerate(batch.requests):
+        chains.setdefault(request.session_id or f"#{index}", []).append(index)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(answer_in_order(indexes) for indexes in chains.values()))
+    succeeded = sum(1 for item in results if item.success)
+    return ChatBatchResponse(
+        results=results,
+        success=succeeded == len(results),
+        succeeded=succeeded,
+        fallbacks=sum(1 for item in results if item.status == "fallback"),
+        failed=len(results) - succeeded,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 1)
+    )
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Streaming chat endpoint; sends response chunks as server-sent events as they arrive."""
+    async def events():
+        history = conversation_store.history(request.session_id, include_summary=True) if request.session_id else None
+        chunks = []
+        try:
+            async for chunk in stream_gemini_response(
+                request.message,
+                request.userName,
+                request.selectedService,
+                history
+            ):
+                chunks.append(chunk)
+                yield sse_event({"text": chunk})
+        except RateLimitExceeded as e:
+            yield sse_event({"error": "rate_limited", "retry_after": max(1, round(e.retry_after))})
+            yield "data: [DONE]\n\n"
+            return
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            fallback = get_fallback_response(request.message, request.userName, request.selectedService)
+            chunks.append(fallback)
+            yield sse_event({"text": fallback})
+        if request.session_id:
+            conversation_store.append(request.session_id, "user", request.message)
+            conversation_store.append(request.session_id, "assistant", "".join(chunks))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/api/trends")
+async def trends(location: Optional[str] = None, sentiment: Optional[str] = None, keyword: Optional[str] = None,
+                 start: Optional[str] = None, end: Optional[str] = None, freq: str = "W",
+                 group_by: Optional[str] = "sentiment"):
+    """Tweet counts per day, week or month from the omicron dataset, optionally filtered and grouped.
+    
+    Example: /api/trends?location=Texas&start=2024-01-01&end=2024-01-31&freq=D&group_by=sentiment
+    (group_by=none returns a single series).
+    """
+    processor = await asyncio.to_thread(get_data_processor, OMICRON_CSV_PATH)
+    try:
+        result = processor.query_trends(
+            location, sentiment, keyword, start, end, freq,
+            None if group_by in (None, "", "none") else group_by
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if "error" in result:
+        raise HTTPException(status_code=503, detail=result["error"])
+    return result
+
+@app.post("/api/tweets")
+async def add_tweets(request: TweetsRequest, x_admin_key: str = Header(default="")):
+    """Add tweets to the omicron dataset without reloading it.
+    
+    Disabled unless TWEETS_ADMIN_KEY is set, and then only for requests sending it
+    in the X-Admin-Key header. With upsert (the default) a tweet replaces any
+    existing tweet with the same id. Added tweets live in memory only: they are
+    not written to the CSV and are lost when the server restarts.
+    """
+    if not TWEETS_ADMIN_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(x_admin_key.encode(), TWEETS_ADMIN_KEY.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Key")
+    processor = await asyncio.to_thread(get_data_processor, OMICRON_CSV_PATH)
+    ingest = processor.upsert_tweets if request.upsert else processor.append_tweets
+    try:
+        added = await asyncio.to_thread(ingest, request.tweets)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"added": added, "total_tweets": processor.tweet_count()}
+
 if __name__ == "__main__":
     print("🏥 Starting MediCare AI Backend...")
     print(f"Gemini API: {'✅ Configured' if GEMINI_API_KEY else '❌ Not configured'}")
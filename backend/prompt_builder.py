@@ -0,0 +1,192 @@
+import functools
+import os
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# Approximates a BPE tokenizer: words cost one token per ~4 characters, other symbols one each
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+CHARS_PER_TOKEN = 4
+
+# Section priorities; lower numbers are fitted into the budget first
+PRIORITY_REQUIRED = 0
+PRIORITY_SERVICE = 1
+PRIORITY_EVIDENCE = 2
+PRIORITY_HISTORY = 3
+
+# Largest share of the budget a single history message or evidence item may take, in tokens
+HISTORY_MESSAGE_TOKENS = 200
+EVIDENCE_ITEM_TOKENS = 120
+
+# Items cut to fewer tokens than this are dropped instead
+MIN_ITEM_TOKENS = 8
+
+ELLIPSIS = "\u2026"
+
+
+# Distinct texts whose token counts are remembered; a session's history is recounted on every turn otherwise
+TOKEN_COUNT_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def count_tokens(text: str) -> int:
+    """Approximate model tokens in `text`, without a tokenizer download or a network call."""
+    return sum((len(match) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN for match in _TOKEN_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of `text` within `max_tokens` (ellipsis included), ending on a token boundary."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens - count_tokens(ELLIPSIS)
+    end = 0
+    for match in _TOKEN_RE.finditer(text):
+        cost = (len(match.group()) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        if cost > budget:
+            break
+        budget -= cost
+        end = match.end()
+    return text[:end].rstrip() + ELLIPSIS if end else ""
+
+
+class AssembledPrompt(NamedTuple):
+    """A prompt fitted into a token budget, with what each section used."""
+    text: str
+    tokens: Dict[str, int]   # tokens kept per section, including reserved ones
+    dropped: Dict[str, int]  # tokens cut per section
+    budget: int
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    def report(self) -> Dict[str, Any]:
+        return {"budget": self.budget, "total_tokens": self.total_tokens,
+                "sections": dict(self.tokens), "dropped": {name: n for name, n in self.dropped.items() if n}}
+
+
+class _Section(NamedTuple):
+    name: str
+    items: List[str]
+    priority: int
+    header: str
+    keep_last: bool
+    item_tokens: Optional[int]
+    rendered: bool
+
+
+class ContextAssembler:
+    def __init__(self, budget: int):
+        """Initialize an empty prompt to be filled with sections up to `budget` tokens.
+
+        Sections appear in the order they are added, but are fitted by priority:
+        required sections always go in whole, then each lower priority gets what
+        is left, cut item by item rather than dropped outright.
+        """
+        self.budget = budget
+        self._sections: List[_Section] = []
+
+    def add(self, name: str, text: str, priority: int = PRIORITY_REQUIRED):
+        """Add a block of text; below PRIORITY_REQUIRED it is shortened to fit."""
+        if text and text.strip():
+            self._sections.append(_Section(name, [text.strip()], priority, "", False, None, True))
+
+    def add_items(self, name: str, items: List[str], priority: int, header: str = "",
+                  keep_last: bool = False, item_tokens: Optional[int] = None):
+        """Add a list of items (one per line) under an optional header.
+
+        Items are kept in order of importance, first to last, or last to first with
+        `keep_last` (e.g. conversation history, newest first); each is cut to
+        `item_tokens`. They are rendered in their original order.
+        """
+        items = [item.strip() for item in items if item and item.strip()]
+        if items:
+            self._sections.append(_Section(name, items, priority, header, keep_last, item_tokens, True))
+
+    def reserve(self, name: str, text: str):
+        """Count text sent outside the prompt (e.g. the system message) against the budget."""
+        self._sections.append(_Section(name, [text], PRIORITY_REQUIRED, "", False, None, False))
+
+    def build(self) -> AssembledPrompt:
+        remaining = self.budget
+        kept: Dict[int, List[str]] = {}
+        tokens: Dict[str, int] = {}
+        dropped: Dict[str, int] = {}
+        order = sorted(range(len(self._sections)), key=lambda i: self._sections[i].priority)
+        for i in order:
+            section = self._sections[i]
+            # Each item is counted once; the header is charged with the first item kept,
+            # and line breaks cost nothing
+            sizes = [count_tokens(item) for item in section.items]
+            overhead = count_tokens(section.header)
+            used, chosen = 0, {}
+            positions = range(len(section.items))
+            for position in (reversed(positions) if section.keep_last else positions):
+                item, size = section.items[position], sizes[position]
+                if section.item_tokens is not None and size > section.item_tokens:
+                    item = truncate_to_tokens(item, section.item_tokens)
+                    size = count_tokens(item)
+                header_cost = 0 if chosen else overhead
+                if section.priority > PRIORITY_REQUIRED:
+                    available = remaining - used - header_cost
+                    if size > available:
+                        # Cut this item to what is left and stop, so kept history stays contiguous
+                        item = truncate_to_tokens(item, available) if available >= MIN_ITEM_TOKENS else ""
+                        if item:
+                            chosen[position] = item
+                            used += header_cost + count_tokens(item)
+                        break
+                chosen[position] = item
+                used += header_cost + size
+            if chosen:
+                kept[i] = [chosen[position] for position in sorted(chosen)]
+            remaining -= used
+            tokens[section.name] = tokens.get(section.name, 0) + used
+            dropped[section.name] = dropped.get(section.name, 0) + sum(sizes) - (used - (overhead if chosen else 0))
+
+        parts = []
+        for i, section in enumerate(self._sections):
+            if section.rendered and i in kept:
+                lines = ([section.header] if section.header else []) + kept[i]
+                parts.append("\n".join(lines))
+        return AssembledPrompt("\n\n".join(parts), tokens, dropped, self.budget)
+
+
+class PromptStats:
+    """Running token totals of the prompts built, per section, for the health endpoint."""
+
+    def __init__(self):
+        self.prompts = 0
+        self.trimmed = 0
+        self.tokens: Dict[str, int] = {}
+        self.dropped: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, prompt: AssembledPrompt):
+        with self._lock:
+            self.prompts += 1
+            self.trimmed += any(prompt.dropped.values())
+            for name, n in prompt.tokens.items():
+                self.tokens[name] = self.tokens.get(name, 0) + n
+            for name, n in prompt.dropped.items():
+                self.dropped[name] = self.dropped.get(name, 0) + n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            average = lambda totals: {name: round(n / self.prompts, 1) for name, n in totals.items() if n}
+            return {
+                "budget": prompt_token_budget(),
+                "prompts": self.prompts,
+                "trimmed": self.trimmed,
+                "average_tokens": round(sum(self.tokens.values()) / self.prompts, 1) if self.prompts else 0,
+                "average_section_tokens": average(self.tokens) if self.prompts else {},
+                "average_dropped_tokens": average(self.dropped) if self.prompts else {}
+            }
+
+
+prompt_stats = PromptStats()
+
+
+def prompt_token_budget() -> int:
+    """Prompt size target in tokens (PROMPT_TOKEN_BUDGET), system message included."""
+    return int(os.getenv('PROMPT_TOKEN_BUDGET', '1500'))
@@ -0,0 +1,208 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# A cached prefix is not used in its last seconds, so a request never races its expiry
+EXPIRY_SAFETY_SECONDS = 30
+
+
+def system_instruction_content(text: str) -> Dict[str, Any]:
+    """A system instruction in Gemini's Content format."""
+    return {"parts": [{"text": text}]}
+
+
+def cached_content_body(model: str, system_instruction: str, ttl: float, display_name: str = "") -> Dict[str, Any]:
+    """Request body registering a system instruction with Gemini's cachedContents API."""
+    body = {
+        "model": model if model.startswith("models/") else f"models/{model}",
+        "systemInstruction": system_instruction_content(system_instruction),
+        "ttl": f"{int(ttl)}s"
+    }
+    if display_name:
+        body["displayName"] = display_name[:128]
+    return body
+
+
+class _Prefix:
+    __slots__ = ("text", "name", "expires_at", "last_used", "retry_at")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.name: Optional[str] = None  # cachedContents/... once registered
+        self.expires_at = 0.0
+        self.last_used = time.time()
+        self.retry_at = 0.0              # when to try registering again after a failure
+
+
+class PrefixCache:
+    def __init__(self, model: str, ttl: float = 3600, refresh_margin: float = 300, retry_delay: float = 300,
+                 max_prefixes: int = 32):
+        """Initialize a registry of static prompt prefixes (system instructions) cached provider-side.
+
+        Requests look a prefix up by key (e.g. the selected service) and get the
+        cachedContents name to send instead of its text, or None while it is not
+        registered; they then send the text inline as systemInstruction. Registering
+        and refreshing happen in maintain() (or a maintenance thread), never on the
+        request path: prefixes still in use are given a new `ttl` `refresh_margin`
+        seconds before they expire, and unused ones are left to expire. A prefix
+        the provider rejects (e.g. below its minimum cacheable size) is retried
+        after `retry_delay` seconds. At most `max_prefixes` keys are cached; others
+        are always sent inline.
+        """
+        self.model = model
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl / 2)
+        self.retry_delay = retry_delay
+        self.max_prefixes = max_prefixes
+        self._prefixes: Dict[str, _Prefix] = {}
+        self._lock = threading.Lock()
+        self._wake: Optional[Callable[[], None]] = None
+        self.hits = 0
+        self.misses = 0
+        self.registrations = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def lookup(self, key: str, text: str) -> Optional[str]:
+        """The cachedContents name holding `text` for `key`, or None to send it inline."""
+        now = time.time()
+        with self._lock:
+            prefix = self._prefixes.get(key)
+            if prefix is None and len(self._prefixes) >= self.max_prefixes:
+                self.misses += 1
+                return None
+            if prefix is None or prefix.text != text:
+                prefix = self._prefixes[key] = _Prefix(text)
+                wake = self._wake
+            else:
+                wake = None
+            prefix.last_used = now
+            name = prefix.name if prefix.expires_at - now > EXPIRY_SAFETY_SECONDS else None
+            if name:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if wake is not None:
+            wake()
+        return name
+
+    def invalidate(self, key: str, name: str):
+        """Forget a cached prefix the provider no longer knows, so it is registered again."""
+        with self._lock:
+            prefix = self._prefixes.get(key)
+            if prefix is not None and prefix.name == name:
+                prefix.name, prefix.expires_at = None, 0.0
+        if self._wake is not None:
+            self._wake()
+
+    def due(self) -> List[Tuple[str, _Prefix]]:
+        """Prefixes to register, or to refresh because they were used since their last refresh."""
+        now = time.time()
+        with self._lock:
+            return [
+                (key, prefix) for key, prefix in self._prefixes.items()
+                if (prefix.name is None and now >= prefix.retry_at)
+                or (prefix.name is not None and prefix.expires_at - now <= self.refresh_margin
+                    and prefix.last_used > prefix.expires_at - self.ttl)
+            ]
+
+    def _stored(self, key: str, prefix: _Prefix, name: Optional[str], started: float, refreshed: bool):
+        with self._lock:
+            if self._prefixes.get(key) is not prefix:
+                return
+            if name:
+                # Measured from before the request, so the local expiry is never later than the provider's
+                prefix.name, prefix.expires_at = name, started + self.ttl
+                if refreshed:
+                    self.refreshes += 1
+                else:
+                    self.registrations += 1
+            else:
+                prefix.name, prefix.expires_at = None, 0.0
+                prefix.retry_at = time.time() + self.retry_delay
+                self.failures += 1
+
+    async def maintain(self, create: Callable[[str, str], Awaitable[Optional[str]]],
+                       update: Callable[[str], Awaitable[bool]], interval: float = 30):
+        """Register and refresh prefixes until cancelled, with async provider calls.
+
+        `create(key, text)` returns the new cachedContents name (None on failure);
+        `update(name)` extends a cached prefix by the TTL and reports success.
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        self._wake = lambda: loop.call_soon_threadsafe(wakeup.set)
+        try:
+            while True:
+                wakeup.clear()
+                for key, prefix in self.due():
+                    started = time.time()
+                    try:
+                        if prefix.name is not None and await update(prefix.name):
+                            self._stored(key, prefix, prefix.name, started, refreshed=True)
+                        else:
+                            self._stored(key, prefix, await create(key, prefix.text), started, refreshed=False)
+                    except Exception as e:
+                        print(f"Prompt prefix cache error: {e}")
+                        self._stored(key, prefix, None, started, refreshed=False)
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wake = None
+
+    def start_thread(self, create: Callable[[str, str], Optional[str]], update: Callable[[str], bool],
+                     interval: float = 30) -> threading.Thread:
+        """Like maintain(), with blocking provider calls on a daemon thread."""
+        wakeup = threading.Event()
+        self._wake = wakeup.set
+
+        def run():
+            while True:
+                wakeup.clear()
+                for key, prefix in self.due():
+                    started = time.time()
+                    try:
+                        if prefix.name is not None and update(prefix.name):
+                            self._stored(key, prefix, prefix.name, started, refreshed=True)
+                        else:
+                            self._stored(key, prefix, create(key, prefix.text), started, refreshed=False)
+                    except Exception as e:
+                        print(f"Prompt prefix cache error: {e}")
+                        self._stored(key, prefix, None, started, refreshed=False)
+                wakeup.wait(interval)
+
+        thread = threading.Thread(target=run, name="prompt-prefix-cache", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            cached = sum(1 for prefix in self._prefixes.values() if prefix.expires_at > now)
+            return {
+                "model": self.model,
+                "ttl_seconds": self.ttl,
+                "prefixes": len(self._prefixes),
+                "cached": cached,
+                "hits": self.hits,
+                "misses": self.misses,
+                "registrations": self.registrations,
+                "refreshes": self.refreshes,
+                "failures": self.failures
+            }
+
+
+def create_prefix_cache(model: str) -> Optional[PrefixCache]:
+    """Prefix cache configured by GEMINI_PROMPT_CACHE (on | off), GEMINI_PROMPT_CACHE_TTL and
+    GEMINI_PROMPT_CACHE_REFRESH (seconds before expiry to extend a prefix still in use)."""
+    if os.getenv('GEMINI_PROMPT_CACHE', 'off').lower() not in ('on', 'true', '1'):
+        return None
+    return PrefixCache(
+        model,
+        ttl=float(os.getenv('GEMINI_PROMPT_CACHE_TTL', '3600')),
+        refresh_margin=float(os.getenv('GEMINI_PROMPT_CACHE_REFRESH', '300'))
+    )
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Optional, Dict, Any
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot get provider quota in time or the wait queue is full."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text: str, max_output_tokens: int = 0) -> int:
+    """Rough request size in tokens: ~4 characters per prompt token plus the output allowance."""
+    return len(text) // 4 + 1 + max_output_tokens
+
+
+def priority_for_service(service: str) -> int:
+    """Emergency requests jump the quota queue."""
+    return PRIORITY_HIGH if service.lower() == "emergency" else PRIORITY_NORMAL
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        """Initialize a bucket refilled at `per_minute` units per minute (0 = unlimited)."""
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available."""
+        if self.unlimited:
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # A request larger than the whole bucket goes through once the bucket is full
+        needed = min(amount, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.tokens -= min(amount, self.capacity)
+
+
+class ProviderRateLimiter:
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_queue: int = 100, max_wait: float = 30.0):
+        """Initialize request and token buckets for one provider API key.
+
+        Callers wait in a bounded priority queue (lower value first, FIFO within a
+        priority). When the queue is full, or quota does not free up within `max_wait`
+        seconds, RateLimitExceeded is raised straight away.
+        """
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.blocked_until = 0.0
+        self.granted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None):
+        """Block the calling thread until the request may be sent."""
+        entry, deadline = self._enqueue(tokens, priority, timeout)
+        with self._condition:
+            while True:
+                wait = self._try_grant(entry, deadline)
+                if wait is None:
+                    return
+                self._condition.wait(wait)
+
+    def try_acquire(self, tokens: int, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> bool:
+        """Like acquire, but returns False instead of raising so callers can fall back."""
+        try:
+            self.acquire(tokens, priority, timeout)
+            return True
+        except RateLimitExceeded as e:
+            print(f"Rate limit: {e}")
+            return False
+
+    async def acquire_async(self, tokens: int, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None):
+        """Wait without blocking the event loop until the request may be sent."""
+        entry, deadline = self._enqueue(tokens, priority, timeout)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_grant(entry, deadline)
+                if wait is None:
+                    return
+                await asyncio.sleep(min(wait, 0.05))
+        except asyncio.CancelledError:
+            with self._condition:
+                self._remove(entry)
+            raise
+
+    def penalize(self, retry_after: float):
+        """Hold all requests after the provider answered 429 Too Many Requests."""
+        with self._condition:
+            self.throttled += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            self.requests.tokens = 0
+            self._condition.notify_all()
+
+    def record_response(self, status_code: int, retry_after: Optional[str] = None):
+        """Back off when a provider response says we are over quota."""
+        if status_code == 429:
+            delay = parse_retry_after(retry_after)
+            print(f"Rate limit: {self.name} returned 429, holding requests for {delay:g}s")
+            self.penalize(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queued": len(self._queue),
+                "granted": self.granted,
+                "rejected": self.rejected,
+                "throttled_by_provider": self.throttled
+            }
+
+    def _enqueue(self, tokens: int, priority: int, timeout: Optional[float]):
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise RateLimitExceeded(f"{self.name} quota queue is full", retry_after=1.0)
+            entry = (priority, next(self._sequence), tokens)
+            heapq.heappush(self._queue, entry)
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+        return entry, deadline
+
+    def _try_grant(self, entry, deadline: float) -> Optional[float]:
+        """Grant `entry` if it heads the queue and quota is available (lock held).
+
+        Returns None when granted, otherwise how long to wait before trying again.
+        """
+        now = time.monotonic()
+        if self._queue[0] is entry:
+            wait = max(self.blocked_until - now,
+                       self.requests.wait_time(1, now),
+                       self.tokens.wait_time(entry[2], now))
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(entry[2])
+                heapq.heappop(self._queue)
+                self.granted += 1
+                self._condition.notify_all()
+                return None
+        else:
+            wait = 0.05
+
+        if now + wait > deadline:
+            self._remove(entry)
+            self.rejected += 1
+            raise RateLimitExceeded(f"{self.name} quota not available within {self.max_wait:g}s",
+                                    retry_after=wait)
+        return min(wait, max(deadline - now, 0.001))
+
+    def _remove(self, entry):
+        if entry in self._queue:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+            self._condition.notify_all()
+
+
+_limiters: Dict[str, ProviderRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, api_key: str = "") -> ProviderRateLimiter:
+    """Process-wide limiter for a provider API key, configured by <PROVIDER>_RPM / <PROVIDER>_TPM."""
+    key_id = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]
+    name = f"{provider}:{key_id}"
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            prefix = provider.upper()
+            limiter = _limiters[name] = ProviderRateLimiter(
+                name,
+                requests_per_minute=float(os.getenv(f'{prefix}_RPM', '0')),
+                tokens_per_minute=float(os.getenv(f'{prefix}_TPM', '0')),
+                max_queue=int(os.getenv('RATE_LIMIT_MAX_QUEUE', '100')),
+                max_wait=float(os.getenv('RATE_LIMIT_MAX_WAIT', '30'))
+            )
+        return limiter
+
+
+def rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    """Queue and throttling counters of every limiter, for the health endpoint."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+def parse_retry_after(value: Optional[str], default: float = 5.0) -> float:
+    """Seconds from a Retry-After header (only the delta-seconds form is supported)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
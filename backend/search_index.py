@@ -0,0 +1,275 @@
+import re
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+# BM25 term-frequency saturation and document-length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Term frequencies are stored as uint16 and saturate here
+MAX_TERM_FREQUENCY = np.iinfo(np.uint16).max
+
+
+def tokenize(text: str) -> List[str]:
+    """Split lowercase text into word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class TokenizedBatch(NamedTuple):
+    """Word tokens of a batch of documents, in document order."""
+    lengths: np.ndarray  # tokens per document
+    codes: np.ndarray    # every token as an index into vocab
+    vocab: np.ndarray
+
+
+def tokenize_documents(texts_lower: pd.Series) -> TokenizedBatch:
+    """Tokenize a batch of lowercase documents once, for the index and any other consumers."""
+    tokens = texts_lower.str.findall(TOKEN_PATTERN)
+    lengths = tokens.str.len().fillna(0).to_numpy(dtype=np.int64)
+    if lengths.sum() == 0:
+        return TokenizedBatch(lengths, np.empty(0, dtype=np.int64), np.empty(0, dtype=object))
+    codes, vocab = pd.factorize(tokens.explode().dropna().to_numpy())
+    return TokenizedBatch(lengths, codes, vocab)
+
+
+class InvertedIndex:
+    def __init__(self):
+        """Initialize an empty token -> row id index with term frequencies for BM25 ranking."""
+        # Postings are kept as compact, appendable uint32 arrays in row order, with a
+        # parallel uint16 array of how often the term occurs in each row; an index
+        # loaded with from_csr holds read-only numpy views until a term is appended to
+        self._postings: Dict[str, Union[array, np.ndarray]] = {}
+        self._frequencies: Dict[str, Union[array, np.ndarray]] = {}
+        self._sorted_terms: Optional[List[str]] = None
+        self.doc_lengths: Union[array, np.ndarray] = array('I')
+        self.total_length = 0
+        self._length_norms: Optional[np.ndarray] = None
+        self.num_docs = 0
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def add_documents(self, texts_lower: pd.Series):
+        """Index a batch of lowercase documents, numbering them after the existing ones."""
+        self.add_tokens(tokenize_documents(texts_lower))
+
+    def add_tokens(self, batch: TokenizedBatch):
+        """Index an already tokenized batch of documents, numbering them after the existing ones."""
+        start = self.num_docs
+        count = len(batch.lengths)
+        # Concurrent readers only look at rows below num_docs, which is advanced last
+        self.doc_lengths = self._extended(self.doc_lengths, 'I', np.asarray(batch.lengths, dtype=np.uint32))
+        self.total_length += int(np.sum(batch.lengths))
+        self._length_norms = None
+        if len(batch.codes) == 0:
+            self.num_docs += count
+            return
+
+        rows = np.repeat(np.arange(start, start + count, dtype=np.uint32), batch.lengths)
+        codes, vocab = batch.codes, batch.vocab
+
+        # Sort by (term, row) and collapse repeated tokens within a document into a count
+        order = np.lexsort((rows, codes))
+        codes, rows = codes[order], rows[order]
+        keep = np.ones(len(codes), dtype=bool)
+        keep[1:] = (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])
+        runs = np.flatnonzero(keep)
+        frequencies = np.diff(np.append(runs, len(codes)))
+        frequencies = np.minimum(frequencies, MAX_TERM_FREQUENCY).astype(np.uint16)
+        codes, rows = codes[keep], rows[keep]
+
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(codes)]))
+        for code, lo, hi in zip(codes[starts], starts, ends):
+            term = vocab[code]
+            if term not in self._postings:
+                self._frequencies[term] = array('H')
+                self._postings[term] = array('I')
+                self._sorted_terms = None
+            # Frequencies first, so a reader never sees a posting without its frequency
+            self._frequencies[term] = self._extended(self._frequencies[term], 'H', frequencies[lo:hi])
+            self._postings[term] = self._extended(self._postings[term], 'I', rows[lo:hi])
+        self.num_docs += count
+
+    @staticmethod
+    def _extended(values: Union[array, np.ndarray], typecode: str, new: np.ndarray) -> array:
+        """`values` with `new` appended: in place when possible, otherwise as a copy.
+
+        Read-only arrays loaded with from_csr, and arrays a reader currently holds a
+        numpy view of (which cannot be resized), are copied instead.
+        """
+        if isinstance(values, array):
+            try:
+                values.frombytes(new.tobytes())
+                return values
+            except BufferError:
+                pass
+        extended = array(typecode, np.asarray(values).tobytes())
+        extended.frombytes(new.tobytes())
+        return extended
+
+    def postings(self, term: str) -> np.ndarray:
+        """Row ids containing exactly `term`, in row order."""
+        postings = self._postings.get(term)
+        if postings is None:
+            return np.empty(0, dtype=np.uint32)
+        if isinstance(postings, np.ndarray):
+            return postings
+        return np.frombuffer(postings, dtype=np.uint32)
+
+    def frequencies(self, term: str) -> np.ndarray:
+        """How often `term` occurs in each row of postings(term)."""
+        frequencies = self._frequencies.get(term)
+        if frequencies is None:
+            return np.empty(0, dtype=np.uint16)
+        if isinstance(frequencies, np.ndarray):
+            return frequencies
+        return np.frombuffer(frequencies, dtype=np.uint16)
+
+    def rank(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """The `limit` rows scoring highest for `query` under BM25, best first, as (row, score).
+
+        Every query token is looked up as an exact term; a row scores for each token it
+        contains, so rows need not contain all of them. Only the top `limit` scores are
+        selected and sorted, never the full candidate set.
+        """
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self._postings]
+        if not terms or limit <= 0:
+            return []
+
+        norms = self.length_norms()
+        rows_parts, score_parts = [], []
+        for term in terms:
+            # Rows appended after the norms were computed are left out
+            frequencies = self.frequencies(term)
+            rows = self.postings(term)
+            rows = rows[:np.searchsorted(rows, len(norms))]
+            frequencies = frequencies[:len(rows)].astype(np.float32)
+            idf = np.log(1.0 + (self.num_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            rows_parts.append(rows)
+            score_parts.append(idf * frequencies * (BM25_K1 + 1) / (frequencies + norms[rows]))
+
+        if len(terms) == 1:
+            rows, scores = rows_parts[0], score_parts[0]
+        elif sum(len(part) for part in rows_parts) * 8 > self.num_docs:
+            # Common terms: accumulate into one score per document (rows are unique within a term)
+            dense = np.zeros(len(norms), dtype=np.float32)
+            for part_rows, part_scores in zip(rows_parts, score_parts):
+                dense[part_rows] += part_scores
+            rows = np.flatnonzero(dense)
+            scores = dense[rows]
+        else:
+            rows, inverse = np.unique(np.concatenate(rows_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+
+        # Rows are in file order here, so ties at the cut-off keep the earliest rows
+        if len(scores) > limit:
+            threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            better = np.flatnonzero(scores > threshold)
+            tied = np.flatnonzero(scores == threshold)[:limit - len(better)]
+            top = np.concatenate((better, tied))
+        else:
+            top = np.arange(len(scores))
+        top = top[np.lexsort((rows[top], -scores[top]))]
+        return [(int(row), float(score)) for row, score in zip(rows[top], scores[top])]
+
+    def length_norms(self) -> np.ndarray:
+        """Per-row BM25 length normalization, k1 * (1 - b + b * length / average length)."""
+        norms = self._length_norms
+        if norms is None:
+            lengths = np.array(self.doc_lengths[:self.num_docs], dtype=np.float32)
+            average = float(lengths.mean()) if len(lengths) else 1.0
+            norms = self._length_norms = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(average, 1e-9))
+        return norms
+
+    def to_csr(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """Export as (sorted terms, offsets, postings, frequencies).
+
+        Term i's rows are postings[offsets[i]:offsets[i + 1]], and frequencies holds
+        its count in each of them.
+        """
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        terms = self._sorted_terms
+        lengths = np.fromiter((len(self._postings[term]) for term in terms), dtype=np.int64, count=len(terms))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if terms:
+            postings = np.concatenate([self.postings(term) for term in terms])
+            frequencies = np.concatenate([self.frequencies(term) for term in terms])
+        else:
+            postings = np.empty(0, dtype=np.uint32)
+            frequencies = np.empty(0, dtype=np.uint16)
+        return terms, offsets, postings, frequencies
+
+    @classmethod
+    def from_csr(cls, terms: List[str], offsets: np.ndarray, postings: np.ndarray, frequencies: np.ndarray,
+                 doc_lengths: np.ndarray) -> "InvertedIndex":
+        """Rebuild an index from to_csr output and doc_lengths; the arrays may be read-only memory maps."""
+        index = cls()
+        bounds = offsets.tolist()
+        index._postings = {term: postings[bounds[i]:bounds[i + 1]] for i, term in enumerate(terms)}
+        index._frequencies = {term: frequencies[bounds[i]:bounds[i + 1]] for i, term in enumerate(terms)}
+        index._sorted_terms = list(terms)
+        index.doc_lengths = doc_lengths
+        index.total_length = int(np.sum(doc_lengths, dtype=np.int64))
+        index.num_docs = len(doc_lengths)
+        return index
+
+    def terms_with_prefix(self, prefix: str) -> List[str]:
+        """All indexed terms starting with `prefix`."""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        terms = self._sorted_terms
+        matches = []
+        i = bisect_left(terms, prefix)
+        while i < len(terms) and terms[i].startswith(prefix):
+            matches.append(terms[i])
+            i += 1
+        return matches
+
+    def prefix_postings(self, prefix: str) -> np.ndarray:
+        """Row ids containing a term that starts with `prefix`, in row order."""
+        terms = self.terms_with_prefix(prefix)
+        if not terms:
+            return np.empty(0, dtype=np.uint32)
+        if len(terms) == 1:
+            return self.postings(terms[0])
+        return np.unique(np.concatenate([self.postings(term) for term in terms]))
+
+    def candidate_blocks(self, query: str, block_size: int = 1024) -> Optional[Iterator[np.ndarray]]:
+        """Blocks of row ids, in row order, whose tokens could match `query`.
+
+        Returns None if the query has no word tokens. Every query token must begin
+        an indexed term, so a phrase still needs to be verified against the
+        document text by the caller. Blocks are produced lazily so callers that
+        only need the first few matches stop early.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return None
+
+        postings = sorted((self.prefix_postings(term) for term in dict.fromkeys(terms)), key=len)
+        return self._iter_blocks(postings[0], postings[1:], block_size)
+
+    @staticmethod
+    def _iter_blocks(driver: np.ndarray, others: List[np.ndarray], block_size: int) -> Iterator[np.ndarray]:
+        for lo in range(0, len(driver), block_size):
+            block = driver[lo:lo + block_size]
+            for other in others:
+                if len(other) == 0:
+                    return
+                positions = np.searchsorted(other, block)
+                positions[positions == len(other)] = 0
+                block = block[other[positions] == block]
+                if len(block) == 0:
+                    break
+            if len(block):
+                yield block
@@ -0,0 +1,341 @@
+import json
+import os
+import sys
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+from search_index import tokenize_documents
+
+# Bump when the stored layout or the way vectors are computed changes
+SEMANTIC_FORMAT_VERSION = 1
+
+# Non-zeros (padding included) multiplied at a time in the sparse products, bounding their scratch memory
+_BLOCK_NONZEROS = 131_072
+
+
+class SparseRows(NamedTuple):
+    """Row-compressed sparse matrix: row i holds values[indptr[i]:indptr[i + 1]] at those columns."""
+    indptr: np.ndarray
+    columns: np.ndarray
+    values: np.ndarray
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.indptr) - 1
+
+    def row_ids(self) -> np.ndarray:
+        """The row of every stored value."""
+        return np.repeat(np.arange(self.num_rows, dtype=np.int64), np.diff(self.indptr))
+
+
+def hash_terms(vocab: np.ndarray, features: int) -> np.ndarray:
+    """Stable hash bucket of each term, so vectors do not depend on a fitted vocabulary."""
+    return np.fromiter((zlib.crc32(term.encode('utf-8')) % features for term in vocab),
+                       dtype=np.int64, count=len(vocab))
+
+
+def count_matrix(texts_lower: pd.Series, features: int, chunk_rows: int = 100_000) -> SparseRows:
+    """Hashed term counts of lowercase texts, tokenized a chunk at a time."""
+    row_counts, columns, values = [np.zeros(1, dtype=np.int64)], [], []
+    for lo in range(0, len(texts_lower), chunk_rows):
+        batch = tokenize_documents(texts_lower.iloc[lo:lo + chunk_rows])
+        rows = np.repeat(np.arange(len(batch.lengths), dtype=np.int64), batch.lengths)
+        buckets = hash_terms(batch.vocab, features)[batch.codes] if len(batch.codes) else rows
+        keys, counts = np.unique(rows * features + buckets, return_counts=True)
+        rows, buckets = np.divmod(keys, features)
+        row_counts.append(np.bincount(rows, minlength=len(batch.lengths)))
+        columns.append(buckets.astype(np.int32))
+        values.append(counts.astype(np.float32))
+    return SparseRows(
+        np.cumsum(np.concatenate(row_counts)),
+        np.concatenate(columns) if columns else np.empty(0, dtype=np.int32),
+        np.concatenate(values) if values else np.empty(0, dtype=np.float32)
+    )
+
+
+def tfidf(counts: SparseRows, idf: np.ndarray) -> SparseRows:
+    """Sublinear TF-IDF weights with every row scaled to unit length."""
+    values = (1 + np.log(counts.values)) * idf[counts.columns]
+    rows = counts.row_ids()
+    norms = np.sqrt(np.bincount(rows, weights=values * values, minlength=counts.num_rows)).astype(np.float32)
+    return SparseRows(counts.indptr, counts.columns, values / np.maximum(norms[rows], 1e-12))
+
+
+def transpose(matrix: SparseRows, num_columns: int) -> SparseRows:
+    """The same matrix compressed by column, so its transpose can be multiplied with sparse_dot."""
+    order = np.argsort(matrix.columns, kind='stable')
+    indptr = np.zeros(num_columns + 1, dtype=np.int64)
+    np.cumsum(np.bincount(matrix.columns, minlength=num_columns), out=indptr[1:])
+    return SparseRows(indptr, matrix.row_ids()[order].astype(np.int32), matrix.values[order])
+
+
+def sparse_dot(matrix: SparseRows, dense: np.ndarray) -> np.ndarray:
+    """matrix @ dense.
+
+    Rows of similar length are padded to a common width and multiplied as one batched
+    matmul, which is several times faster than segment sums over the non-zeros.
+    """
+    lengths = np.diff(matrix.indptr)
+    out = np.zeros((matrix.num_rows, dense.shape[1]), dtype=np.float32)
+    length_classes = np.ceil(np.log2(np.maximum(lengths, 1))).astype(np.int64)
+    length_classes[lengths == 0] = -1
+    for length_class in np.unique(length_classes[length_classes >= 0]):
+        rows = np.flatnonzero(length_classes == length_class)
+        width = int(lengths[rows].max())
+        step = max(1, _BLOCK_NONZEROS // width)
+        for lo in range(0, len(rows), step):
+            block = rows[lo:lo + step]
+            valid = np.arange(width) < lengths[block, None]
+            positions = np.where(valid, matrix.indptr[block, None] + np.arange(width), 0)
+            # Padding multiplies row 0 of dense by a zero weight
+            columns = np.where(valid, matrix.columns[positions], 0)
+            values = np.where(valid, matrix.values[positions], 0).astype(np.float32)
+            out[block] = np.matmul(values[:, None, :], dense[columns])[:, 0, :]
+    return out
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def orthonormalize(vectors: np.ndarray) -> np.ndarray:
+    """Orthonormal basis for the columns of a tall matrix (Cholesky QR, far cheaper than np.linalg.qr)."""
+    gram = vectors.T.astype(np.float64) @ vectors
+    gram += np.eye(len(gram)) * (1e-10 * np.trace(gram) + 1e-30)
+    lower = np.linalg.cholesky(gram)
+    return (vectors @ np.linalg.inv(lower).T.astype(np.float32)).astype(np.float32)
+
+
+def randomized_svd_basis(matrix: SparseRows, features: int, dim: int, power_iterations: int = 2,
+                         oversample: int = 10, seed: int = 0) -> np.ndarray:
+    """Top `dim` right singular vectors (features x dim) of a sparse matrix, by randomized SVD.
+
+    Work happens on the columns that occur in the matrix only; with hashed features most
+    buckets are empty, and their rows of the result are zero.
+    """
+    active, columns = np.unique(matrix.columns, return_inverse=True)
+    compact = SparseRows(matrix.indptr, columns.astype(np.int32), matrix.values)
+    rank = min(dim + oversample, matrix.num_rows, len(active))
+    rng = np.random.default_rng(seed)
+    by_column = transpose(compact, len(active))
+    basis = orthonormalize(sparse_dot(compact, rng.standard_normal((len(active), rank), dtype=np.float32)))
+    for _ in range(power_iterations):
+        basis = orthonormalize(sparse_dot(compact, orthonormalize(sparse_dot(by_column, basis))))
+
+    # The right singular vectors of basis.T @ matrix, from the eigenvectors of its small Gram matrix
+    transposed = sparse_dot(by_column, basis).astype(np.float64)
+    eigenvalues, eigenvectors = np.linalg.eigh(transposed.T @ transposed)
+    top = np.argsort(eigenvalues)[::-1][:min(dim, rank)]
+    top = top[eigenvalues[top] > 1e-12 * max(eigenvalues.max(), 1e-30)]
+    right = transposed @ eigenvectors[:, top] / np.sqrt(eigenvalues[top])
+
+    projection = np.zeros((features, max(len(top), 1)), dtype=np.float32)
+    projection[active, :len(top)] = right
+    return projection
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+    return np.concatenate([
+        np.argmax(vectors[lo:lo + block_rows].astype(np.float32) @ centroids.T, axis=1)
+        for lo in range(0, len(vectors), block_rows)
+    ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+
+def spherical_kmeans(vectors: np.ndarray, clusters: int, iterations: int = 8, seed: int = 0) -> np.ndarray:
+    """Unit-length centroids clustering unit vectors by cosine similarity."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = nearest_centroids(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.bincount(assignment, minlength=clusters) == 0
+        # Reseed clusters that lost all their members
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class SemanticIndex:
+    def __init__(self, projection: np.ndarray, idf: np.ndarray, centroids: np.ndarray, vectors: np.ndarray,
+                 row_ids: np.ndarray, list_offsets: np.ndarray, nprobe: int = 16):
+        """Initialize a dense-vector index for semantic tweet search.
+
+        Texts are embedded as hashed TF-IDF projected onto a latent basis found by
+        randomized SVD, so words that occur in similar tweets ("taste", "smell", "loss")
+        land close together. Vectors are stored as int8 grouped by nearest centroid;
+        a query scans only the `nprobe` groups closest to it.
+        """
+        self.projection = projection
+        self.idf = idf
+        self.features = len(idf)
+        self.centroids = centroids
+        self.vectors = vectors
+        self.row_ids = row_ids
+        self.list_offsets = list_offsets
+        self.nprobe = nprobe
+        # Rows added after the build, as (vectors, row ids, nearest centroid); kept in memory only
+        self._tail: Tuple[np.ndarray, np.ndarray, np.ndarray] = (
+            np.empty((0, projection.shape[1]), dtype=np.int8), np.empty(0, dtype=np.uint32),
+            np.empty(0, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.row_ids) + len(self._tail[1])
+
+    def add(self, texts_lower: pd.Series, first_row: int):
+        """Embed new rows, numbered from `first_row`, with the existing basis and groups.
+
+        They are searched along with the group they are nearest to until the index
+        is rebuilt; texts without any known word are left out, as in build.
+        """
+        embedded = self.embed(texts_lower.reset_index(drop=True))
+        quantized = np.round(embedded * 127).astype(np.int8)
+        nonzero = np.flatnonzero(np.any(quantized != 0, axis=1))
+        if len(nonzero) == 0 or len(self.centroids) == 0:
+            return
+        vectors, row_ids, lists = self._tail
+        self._tail = (np.concatenate((vectors, quantized[nonzero])),
+                      np.concatenate((row_ids, (nonzero + first_row).astype(np.uint32))),
+                      np.concatenate((lists, nearest_centroids(embedded[nonzero], self.centroids))))
+
+    @classmethod
+    def build(cls, texts_lower: pd.Series, dim: int = 128, features: int = 2 ** 17, sample_rows: int = 200_000,
+              nprobe: int = 16, seed: int = 0) -> "SemanticIndex":
+        """Fit the basis on a sample of the texts and embed all of them."""
+        texts_lower = texts_lower.reset_index(drop=True)
+        counts = count_matrix(texts_lower, features)
+        documents = np.bincount(counts.columns, minlength=features)
+        idf = (np.log((1 + counts.num_rows) / (1 + documents)) + 1).astype(np.float32)
+        weighted = tfidf(counts, idf)
+        del counts
+
+        rng = np.random.default_rng(seed)
+        if len(texts_lower) > sample_rows:
+            sample = np.sort(rng.choice(len(texts_lower), sample_rows, replace=False))
+            fit_matrix = tfidf(count_matrix(texts_lower.iloc[sample], features), idf)
+        else:
+            fit_matrix = weighted
+        if fit_matrix.num_rows == 0 or len(fit_matrix.values) == 0:
+            projection = np.zeros((features, 1), dtype=np.float32)
+        else:
+            projection = randomized_svd_basis(fit_matrix, features, dim, seed=seed)
+
+        embedded = normalize_rows(sparse_dot(weighted, projection))
+        quantized = np.round(embedded * 127).astype(np.int8)
+        return cls.from_vectors(projection, idf, embedded, quantized, nprobe, seed)
+
+    @classmethod
+    def from_vectors(cls, projection: np.ndarray, idf: np.ndarray, embedded: np.ndarray, quantized: np.ndarray,
+                     nprobe: int, seed: int) -> "SemanticIndex":
+        """Group embedded rows by nearest centroid, about sqrt(rows) groups."""
+        nonzero = np.flatnonzero(np.any(quantized != 0, axis=1))
+        clusters = int(np.clip(np.sqrt(len(nonzero)), 1, 4096)) if len(nonzero) else 0
+        if clusters:
+            sample = embedded[nonzero]
+            if len(sample) > clusters * 64:
+                sample = sample[np.random.default_rng(seed).choice(len(sample), clusters * 64, replace=False)]
+            centroids = spherical_kmeans(sample, clusters, seed=seed)
+            assignment = nearest_centroids(embedded[nonzero], centroids)
+        else:
+            centroids = np.zeros((0, projection.shape[1]), dtype=np.float32)
+            assignment = np.empty(0, dtype=np.int64)
+
+        order = np.argsort(assignment, kind='stable')
+        list_offsets = np.zeros(clusters + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=clusters), out=list_offsets[1:])
+        row_ids = nonzero[order].astype(np.uint32)
+        return cls(projection, idf, centroids, quantized[row_ids], row_ids, list_offsets, nprobe)
+
+    def embed(self, texts_lower: pd.Series) -> np.ndarray:
+        """Unit-length vectors for lowercase texts (zero for texts without known words)."""
+        return normalize_rows(sparse_dot(tfidf(count_matrix(texts_lower, self.features), self.idf), self.projection))
+
+    def search(self, query: str, limit: int = 10, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """The `limit` rows most similar to `query` by cosine, best first, as (row, similarity)."""
+        if len(self.centroids) == 0 or limit <= 0:
+            return []
+        vector = self.embed(pd.Series([query.lower()], dtype=object))[0]
+        if not vector.any():
+            return []
+
+        probe = min(nprobe or self.nprobe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ vector), probe - 1)[:probe]
+        positions = np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists])
+        vectors, row_ids = self.vectors[positions], self.row_ids[positions]
+        tail_vectors, tail_row_ids, tail_lists = self._tail
+        if len(tail_row_ids):
+            probed = np.isin(tail_lists, lists)
+            vectors = np.concatenate((vectors, tail_vectors[probed]))
+            row_ids = np.concatenate((row_ids, tail_row_ids[probed]))
+        similarities = vectors.astype(np.float32) @ vector / 127
+
+        if len(similarities) > limit:
+            top = np.argpartition(-similarities, limit - 1)[:limit]
+        else:
+            top = np.arange(len(similarities))
+        top = top[np.argsort(-similarities[top], kind='stable')]
+        return [(int(row), float(score)) for row, score in zip(row_ids[top], similarities[top])]
+
+    def save(self, directory: str):
+        """Write the index as .npy files, atomically replacing any previous copy (rows added later are not saved)."""
+        temp_directory = f"{directory}.tmp-{os.getpid()}"
+        os.makedirs(temp_directory, exist_ok=True)
+        for name in ("projection", "idf", "centroids", "vectors", "row_ids", "list_offsets"):
+            np.save(os.path.join(temp_directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(temp_directory, "meta.json"), "w", encoding='utf-8') as handle:
+            json.dump({"version": SEMANTIC_FORMAT_VERSION, "rows": len(self)}, handle)
+        os.replace(temp_directory, directory)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, "meta.json"))
+
+    @classmethod
+    def load(cls, directory: str, nprobe: int = 16) -> "SemanticIndex":
+        """Load a saved index; the projection and vectors are memory-mapped."""
+        with open(os.path.join(directory, "meta.json"), encoding='utf-8') as handle:
+            meta: Dict[str, Any] = json.load(handle)
+        if meta["version"] != SEMANTIC_FORMAT_VERSION:
+            raise ValueError(f"semantic index format {meta['version']} is not {SEMANTIC_FORMAT_VERSION}")
+
+        def load_array(name: str) -> np.ndarray:
+            path = os.path.join(directory, f"{name}.npy")
+            try:
+                return np.load(path, mmap_mode='r').view(np.ndarray)
+            except ValueError:
+                # Empty arrays cannot be memory-mapped
+                return np.load(path)
+
+        return cls(load_array("projection"), np.load(os.path.join(directory, "idf.npy")), load_array("centroids"),
+                   load_array("vectors"), load_array("row_ids"), load_array("list_offsets"), nprobe)
+
+
+def semantic_search_enabled() -> bool:
+    """Whether SEMANTIC_SEARCH turns on the optional semantic retrieval mode."""
+    return os.getenv('SEMANTIC_SEARCH', 'off').lower() in ('on', 'true', '1', 'yes')
+
+
+def semantic_nprobe() -> int:
+    return int(os.getenv('SEMANTIC_NPROBE', '16'))
+
+
+def create_semantic_index(texts_lower: pd.Series) -> SemanticIndex:
+    """Build a semantic index configured by SEMANTIC_DIM, SEMANTIC_FEATURES, SEMANTIC_FIT_ROWS and SEMANTIC_NPROBE."""
+    return SemanticIndex.build(
+        texts_lower,
+        dim=int(os.getenv('SEMANTIC_DIM', '128')),
+        features=int(os.getenv('SEMANTIC_FEATURES', str(2 ** 17))),
+        sample_rows=int(os.getenv('SEMANTIC_FIT_ROWS', '200000')),
+        nprobe=semantic_nprobe()
+    )
+
+
+if __name__ == "__main__":
+    # Build the index ahead of time and store it with the dataset cache:
+    #     python semantic_index.py omicron_2025.csv
+    os.environ['SEMANTIC_SEARCH'] = 'on'
+    from data_processor import OmicronDataProcessor
+    processor = OmicronDataProcessor(sys.argv[1] if len(sys.argv) > 1 else "omicron_2025.csv")
+    print(f"Semantic index: {len(processor.semantic_index or [])} vectors")
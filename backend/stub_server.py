@@ -0,0 +1,184 @@
+"""Local stand-in for the Gemini and OpenAI REST APIs, used by benchmark.py.
+
+Run standalone with: uvicorn stub_server:app --port 8100
+Behaviour is controlled with environment variables (times in seconds):
+    STUB_LATENCY       delay before the first token (prefill)
+    STUB_TOKEN_DELAY   delay between streamed chunks
+    STUB_ERROR_RATE    fraction of requests answered with HTTP 500
+    STUB_SLOW_RATE     fraction of requests delayed by an extra STUB_SLOW_LATENCY
+    STUB_RPM           requests per minute before answering 429 with Retry-After (0 = no quota)
+    STUB_PREFILL_PER_1K_CHARS  extra delay per 1000 characters of prompt not served from cachedContents
+    STUB_MIN_CACHE_CHARS       smallest system instruction cachedContents accepts
+"""
+import asyncio
+import json
+import os
+import math
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="LLM Provider Stub")
+
+STUB_LATENCY = float(os.getenv('STUB_LATENCY', '0.2'))
+STUB_TOKEN_DELAY = float(os.getenv('STUB_TOKEN_DELAY', '0.02'))
+STUB_ERROR_RATE = float(os.getenv('STUB_ERROR_RATE', '0'))
+STUB_SLOW_RATE = float(os.getenv('STUB_SLOW_RATE', '0'))
+STUB_SLOW_LATENCY = float(os.getenv('STUB_SLOW_LATENCY', '5'))
+STUB_RPM = float(os.getenv('STUB_RPM', '0'))
+STUB_PREFILL_PER_1K_CHARS = float(os.getenv('STUB_PREFILL_PER_1K_CHARS', '0'))
+STUB_MIN_CACHE_CHARS = int(os.getenv('STUB_MIN_CACHE_CHARS', '0'))
+STUB_CHUNK_WORDS = 4
+
+# cachedContents/{id} -> {"model", "systemInstruction", "expires_at"}
+_cached_contents = {}
+
+# Per-minute quota as a token bucket: a full minute's worth may burst, then it refills steadily
+_quota = {"tokens": STUB_RPM, "updated": time.monotonic()}
+
+
+def stub_answer(prompt: str) -> str:
+    """Deterministic canned answer for a prompt."""
+    return (
+        f"Stub answer ({len(prompt)} prompt chars): rest as much as you can, drink plenty of fluids, "
+        "monitor your temperature twice a day, take fever reducers if needed, and contact a doctor "
+        "if symptoms worsen or you have difficulty breathing. This is educational information only."
+    )
+
+
+def answer_chunks(prompt: str):
+    words = stub_answer(prompt).split(" ")
+    for i in range(0, len(words), STUB_CHUNK_WORDS):
+        yield " ".join(words[i:i + STUB_CHUNK_WORDS]) + " "
+
+
+def candidate(text: str) -> dict:
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP"
+        }]
+    }
+
+
+def over_quota():
+    """Returns a 429 response once the per-minute request quota is used up."""
+    if STUB_RPM <= 0:
+        return None
+    now = time.monotonic()
+    _quota["tokens"] = min(STUB_RPM, _quota["tokens"] + (now - _quota["updated"]) * STUB_RPM / 60)
+    _quota["updated"] = now
+    if _quota["tokens"] >= 1:
+        _quota["tokens"] -= 1
+        return None
+    retry_after = math.ceil((1 - _quota["tokens"]) * 60 / STUB_RPM)
+    return JSONResponse({"error": {"code": 429, "message": "quota exceeded"}}, status_code=429,
+                        headers={"Retry-After": str(retry_after)})
+
+
+async def inject_faults():
+    """Apply the configured quota and slow-down; returns an error response if this request should fail."""
+    quota_error = over_quota()
+    if quota_error:
+        return quota_error
+    if random.random() < STUB_SLOW_RATE:
+        await asyncio.sleep(STUB_SLOW_LATENCY)
+    if random.random() < STUB_ERROR_RATE:
+        await asyncio.sleep(STUB_LATENCY)
+        return JSONResponse({"error": {"code": 500, "message": "injected failure"}}, status_code=500)
+    return None
+
+
+def parse_ttl(ttl: str) -> float:
+    return float(ttl.rstrip("s"))
+
+
+def not_found(name: str):
+    return JSONResponse({"error": {"code": 404, "message": f"{name} not found"}}, status_code=404)
+
+
+@app.post("/v1beta/cachedContents")
+async def create_cached_content(request: Request):
+    """Emulate cachedContents.create for a system instruction."""
+    body = await request.json()
+    instruction = body.get("systemInstruction", {}).get("parts", [{}])[0].get("text", "")
+    if len(instruction) < STUB_MIN_CACHE_CHARS:
+        return JSONResponse({"error": {"code": 400, "message": "cached content is too small"}}, status_code=400)
+    name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+    _cached_contents[name] = {
+        "model": body["model"],
+        "systemInstruction": instruction,
+        "expires_at": time.time() + parse_ttl(body.get("ttl", "3600s"))
+    }
+    return {"name": name, "model": body["model"], "usageMetadata": {"totalTokenCount": len(instruction) // 4}}
+
+
+@app.patch("/v1beta/cachedContents/{cache_id}")
+async def update_cached_content(cache_id: str, request: Request):
+    """Emulate cachedContents.patch with updateMask=ttl."""
+    name = f"cachedContents/{cache_id}"
+    entry = _cached_contents.get(name)
+    if entry is None or entry["expires_at"] <= time.time():
+        _cached_contents.pop(name, None)
+        return not_found(name)
+    entry["expires_at"] = time.time() + parse_ttl((await request.json()).get("ttl", "3600s"))
+    return {"name": name, "model": entry["model"]}
+
+
+@app.delete("/v1beta/cachedContents/{cache_id}")
+async def delete_cached_content(cache_id: str):
+    name = f"cachedContents/{cache_id}"
+    return {} if _cached_contents.pop(name, None) else not_found(name)
+
+
+@app.post("/v1beta/models/{model_method}")
+async def generate_content(model_method: str, request: Request):
+    """Emulate models/{model}:generateContent and models/{model}:streamGenerateContent.
+
+    Prefill takes longer the more prompt text arrives uncached (STUB_PREFILL_PER_1K_CHARS).
+    """
+    body = await request.json()
+    prompt = body["contents"][-1]["parts"][0]["text"]
+    uncached = len(prompt) + len(body.get("systemInstruction", {}).get("parts", [{}])[0].get("text", ""))
+    if "cachedContent" in body:
+        entry = _cached_contents.get(body["cachedContent"])
+        if entry is None or entry["expires_at"] <= time.time():
+            return not_found(body["cachedContent"])
+    error = await inject_faults()
+    if error:
+        return error
+    prefill = STUB_LATENCY + STUB_PREFILL_PER_1K_CHARS * uncached / 1000
+
+    if model_method.endswith(":streamGenerateContent"):
+        async def events():
+            await asyncio.sleep(prefill)
+            for i, chunk in enumerate(answer_chunks(prompt)):
+                if i:
+                    await asyncio.sleep(STUB_TOKEN_DELAY)
+                yield f"data: {json.dumps(candidate(chunk))}\r\n\r\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    chunks = list(answer_chunks(prompt))
+    await asyncio.sleep(prefill + STUB_TOKEN_DELAY * (len(chunks) - 1))
+    return candidate("".join(chunks))
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """Emulate the OpenAI chat completions endpoint."""
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    error = await inject_faults()
+    if error:
+        return error
+    chunks = list(answer_chunks(prompt))
+    await asyncio.sleep(STUB_LATENCY + STUB_TOKEN_DELAY * (len(chunks) - 1))
+    return {
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": "".join(chunks)},
+            "finish_reason": "stop"
+        }]
+    }
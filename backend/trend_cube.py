@@ -0,0 +1,173 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+# Period lengths trends can be bucketed by (pandas period aliases)
+TREND_FREQUENCIES = {"D": "day", "W": "week", "M": "month"}
+
+# Dimensions trend series can be split by
+TREND_GROUPS = ('location', 'sentiment')
+
+# Label for tweets without a location or sentiment
+UNKNOWN = "Unknown"
+
+TWEET_KEYS = ['day', 'location', 'sentiment']
+MENTION_KEYS = TWEET_KEYS + ['keyword']
+
+
+class TrendCube:
+    def __init__(self, keywords: List[str]):
+        """Initialize daily tweet counts by location and sentiment, and by keyword mentioned.
+
+        Counts are kept per distinct (day, location, sentiment[, keyword]) combination,
+        which is far smaller than the tweets they summarize, so trend queries never
+        scan the tweets themselves. Batches can be added as they are loaded.
+        """
+        self.keywords = list(keywords)
+        self._tweets = self._empty(TWEET_KEYS)
+        self._mentions = self._empty(MENTION_KEYS)
+        self._pending: List[Tuple[pd.DataFrame, pd.DataFrame]] = []
+        self._lock = threading.Lock()
+
+    def add(self, frame: pd.DataFrame, document_ids: np.ndarray, keyword_ids: np.ndarray):
+        """Count a batch of tweets; keyword matches are (row in `frame`, keyword id) pairs.
+
+        Repeated matches of a keyword in one tweet must be adjacent, as they are in
+        KeywordMatcher.match output.
+        """
+        self._add(frame, document_ids, keyword_ids, 1)
+
+    def remove(self, frame: pd.DataFrame, document_ids: np.ndarray, keyword_ids: np.ndarray):
+        """Uncount tweets added earlier, e.g. ones replaced by a newer version; arguments as for add."""
+        self._add(frame, document_ids, keyword_ids, -1)
+
+    def _add(self, frame: pd.DataFrame, document_ids: np.ndarray, keyword_ids: np.ndarray, sign: int):
+        if frame.empty or 'date' not in frame.columns:
+            return
+
+        keys = pd.DataFrame({
+            'day': frame['date'].dt.floor('D').to_numpy(),
+            'location': self._labels(frame, 'location'),
+            'sentiment': self._labels(frame, 'sentiment')
+        })
+        tweets = self._count(keys, TWEET_KEYS)
+
+        # Each tweet counts once per keyword it mentions
+        first = np.ones(len(keyword_ids), dtype=bool)
+        first[1:] = (document_ids[1:] != document_ids[:-1]) | (keyword_ids[1:] != keyword_ids[:-1])
+        mentions = keys.iloc[document_ids[first]].reset_index(drop=True)
+        mentions['keyword'] = pd.Categorical.from_codes(keyword_ids[first], categories=self.keywords)
+        mentions = self._count(mentions, MENTION_KEYS)
+        if sign < 0:
+            tweets['tweets'] *= -1
+            mentions['tweets'] *= -1
+
+        with self._lock:
+            self._pending.append((tweets, mentions))
+
+    @staticmethod
+    def _labels(frame: pd.DataFrame, column: str) -> pd.Series:
+        if column not in frame.columns:
+            return pd.Series(np.full(len(frame), UNKNOWN, dtype=object))
+        return frame[column].reset_index(drop=True)
+
+    @staticmethod
+    def _count(keys: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+        """Tweets per distinct key, skipping tweets without a valid date."""
+        counts = keys[keys['day'].notna()].groupby(columns, observed=True, dropna=False).size()
+        counts = counts.reset_index(name='tweets')
+        for column in ('location', 'sentiment'):
+            counts[column] = counts[column].astype(object).fillna(UNKNOWN).astype(str)
+        return counts
+
+    def _compacted(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Merge batches added since the last query into the stored counts."""
+        with self._lock:
+            if self._pending:
+                pending, self._pending = self._pending, []
+                self._tweets = self._merge([self._tweets] + [tweets for tweets, _ in pending], TWEET_KEYS)
+                self._mentions = self._merge([self._mentions] + [mentions for _, mentions in pending], MENTION_KEYS)
+            return self._tweets, self._mentions
+
+    @classmethod
+    def _merge(cls, frames: List[pd.DataFrame], columns: List[str]) -> pd.DataFrame:
+        frames = [frame.astype({column: str for column in columns[1:]}) for frame in frames if not frame.empty]
+        if not frames:
+            return cls._empty(columns)
+        merged = pd.concat(frames, ignore_index=True)
+        merged = merged.groupby(columns, sort=True)['tweets'].sum().reset_index()
+        # Keys whose tweets were all removed again
+        merged = merged[merged['tweets'] != 0].reset_index(drop=True)
+        return merged.astype({column: 'category' for column in columns[1:]})
+
+    @staticmethod
+    def _empty(columns: List[str]) -> pd.DataFrame:
+        frame = pd.DataFrame({column: pd.Series(dtype='category') for column in columns})
+        return frame.astype({'day': 'datetime64[ns]'}).assign(tweets=pd.Series(dtype='int64'))
+
+    def to_frames(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """The merged (tweets, mentions) count tables, for storing in the dataset cache."""
+        return self._compacted()
+
+    @classmethod
+    def from_frames(cls, keywords: List[str], tweets: pd.DataFrame, mentions: pd.DataFrame) -> "TrendCube":
+        """Rebuild a cube from tables returned by to_frames."""
+        cube = cls(keywords)
+        cube._tweets, cube._mentions = tweets, mentions
+        return cube
+
+    def locations(self) -> List[str]:
+        """Every location with at least one dated tweet."""
+        tweets, _ = self._compacted()
+        return sorted(set(tweets['location']) - {UNKNOWN})
+
+    def query(self, location: Optional[str] = None, sentiment: Optional[str] = None,
+              keyword: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None,
+              freq: str = "W", group_by: Optional[str] = "sentiment") -> Dict[str, Any]:
+        """Tweet counts per period, optionally filtered and split into one series per group.
+
+        Location and sentiment match case-insensitively; `start` and `end` are inclusive
+        dates. With a keyword, only tweets mentioning it are counted. Raises ValueError
+        for an unknown frequency, group or keyword.
+        """
+        freq = freq.upper()
+        if freq not in TREND_FREQUENCIES:
+            raise ValueError(f"freq must be one of {', '.join(TREND_FREQUENCIES)}")
+        if group_by is not None and group_by not in TREND_GROUPS:
+            raise ValueError(f"group_by must be one of {', '.join(TREND_GROUPS)}")
+
+        tweets, mentions = self._compacted()
+        if keyword is not None:
+            keyword = keyword.lower()
+            if keyword not in self.keywords:
+                raise ValueError(f"keyword must be one of {', '.join(self.keywords)}")
+            counts = mentions[mentions['keyword'] == keyword]
+        else:
+            counts = tweets
+
+        if location is not None:
+            counts = counts[counts['location'].str.lower() == location.lower()]
+        if sentiment is not None:
+            counts = counts[counts['sentiment'].str.lower() == sentiment.lower()]
+        if start is not None:
+            counts = counts[counts['day'] >= pd.Timestamp(start)]
+        if end is not None:
+            counts = counts[counts['day'] <= pd.Timestamp(end)]
+
+        periods = pd.DatetimeIndex(counts['day']).to_period(freq).start_time
+        series = counts.groupby([periods, counts[group_by] if group_by else np.full(len(counts), "tweets")])
+        table = series['tweets'].sum().unstack(fill_value=0)
+        if not table.empty:
+            # Periods without tweets are reported as zeros rather than left out
+            table = table.reindex(pd.period_range(table.index.min(), table.index.max(), freq=freq).start_time,
+                                  fill_value=0)
+
+        return {
+            "freq": freq,
+            "group_by": group_by,
+            "filters": {"location": location, "sentiment": sentiment, "keyword": keyword, "start": start, "end": end},
+            "periods": [period.strftime("%Y-%m-%d") for period in table.index],
+            "series": {str(group): table[group].astype(int).tolist() for group in table.columns},
+            "total": int(counts['tweets'].sum())
+        }
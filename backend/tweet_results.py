@@ -0,0 +1,134 @@
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterator, List, Optional, Sequence as SequenceType, Union
+import numpy as np
+import pandas as pd
+
+
+class FrameParts:
+    def __init__(self, frames: SequenceType[pd.DataFrame]):
+        """Initialize a read-only view of frames holding consecutive rows of one table.
+
+        Rows are addressed by position across all the frames, as if they were one
+        frame, so rows appended in frames of their own need not be copied into the
+        main frame first. All frames must have the same columns.
+        """
+        self.frames = list(frames)
+        self.starts = np.cumsum([0] + [len(frame) for frame in self.frames])
+
+    @property
+    def columns(self) -> pd.Index:
+        return self.frames[0].columns
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0 or len(self.columns) == 0
+
+    def __len__(self) -> int:
+        return int(self.starts[-1])
+
+    def parts(self, rows: np.ndarray) -> Iterator[tuple]:
+        """(frame, positions in `rows`, row positions in that frame) for each frame `rows` reach."""
+        rows = np.asarray(rows, dtype=np.int64)
+        part = np.searchsorted(self.starts, rows, side='right') - 1
+        for index in np.unique(part):
+            positions = np.flatnonzero(part == index)
+            yield self.frames[index], positions, rows[positions] - self.starts[index]
+
+    def take(self, column: str, rows: SequenceType[int]) -> List[Any]:
+        """Values of one column for `rows`, in the order given."""
+        values: List[Any] = [None] * len(rows)
+        for frame, positions, frame_rows in self.parts(rows):
+            for position, value in zip(positions, frame[column].iloc[frame_rows].tolist()):
+                values[position] = value
+        return values
+
+    def select(self, rows: SequenceType[int]) -> pd.DataFrame:
+        """The rows as one frame; `rows` must be in ascending order."""
+        frames = [frame.iloc[frame_rows] for frame, _, frame_rows in self.parts(rows)]
+        return pd.concat(frames, ignore_index=True) if frames else self.frames[0].iloc[:0]
+
+    def isin(self, column: str, values: Any) -> np.ndarray:
+        """Boolean mask over all rows of whether `column` holds one of `values`."""
+        return np.concatenate([frame[column].isin(values).to_numpy() for frame in self.frames])
+
+
+def take(frame: Union[pd.DataFrame, FrameParts], column: str, rows: SequenceType[int]) -> List[Any]:
+    """Values of one column of a frame (or FrameParts) for row positions, in the order given."""
+    if isinstance(frame, FrameParts):
+        return frame.take(column, rows)
+    return frame[column].iloc[rows].tolist()
+
+
+class TweetRecord(Mapping):
+    """One search result, read-only and dict-like over the result set's columns.
+
+    Holds only a reference to its result set and a position in it; values are
+    looked up when accessed, so unread fields cost nothing.
+    """
+    __slots__ = ('_results', '_position')
+
+    def __init__(self, results: "TweetResults", position: int):
+        self._results = results
+        self._position = position
+
+    def __getitem__(self, column: str) -> Any:
+        return self._results.column(column)[self._position]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._results.columns)
+
+    def __len__(self) -> int:
+        return len(self._results.columns)
+
+    def __repr__(self) -> str:
+        return f"TweetRecord({dict(self)!r})"
+
+
+class TweetResults(Sequence):
+    def __init__(self, frame: Union[pd.DataFrame, FrameParts], rows: SequenceType[int],
+                 columns: Optional[List[str]] = None, extra: Optional[Dict[str, List[Any]]] = None):
+        """Initialize a lazy result set: row positions into `frame` (or FrameParts) plus the columns to expose.
+
+        Nothing is copied up front. A column's values are gathered for just these rows
+        the first time any record reads it; `columns` limits which frame columns are
+        visible (names the frame lacks are skipped), and `extra` adds per-row values
+        such as scores.
+        """
+        self.frame = frame
+        self.rows = np.asarray(rows, dtype=np.int64)
+        visible = frame.columns if columns is None else [column for column in columns if column in frame.columns]
+        self.extra = extra or {}
+        self.columns: List[str] = list(dict.fromkeys(list(visible) + list(self.extra)))
+        self._values: Dict[str, List[Any]] = dict(self.extra)
+
+    def column(self, name: str) -> List[Any]:
+        """Values of one column for every result, in result order."""
+        values = self._values.get(name)
+        if values is None:
+            if name not in self.columns:
+                raise KeyError(name)
+            values = self._values[name] = take(self.frame, name, self.rows)
+        return values
+
+    def __getitem__(self, position: Union[int, slice]) -> Union[TweetRecord, "TweetResults"]:
+        if isinstance(position, slice):
+            extra = {name: values[position] for name, values in self.extra.items()}
+            return TweetResults(self.frame, self.rows[position], [c for c in self.columns if c not in extra], extra)
+        if position < 0:
+            position += len(self.rows)
+        if not 0 <= position < len(self.rows):
+            raise IndexError("result index out of range")
+        return TweetRecord(self, position)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __repr__(self) -> str:
+        return f"TweetResults({len(self)} rows, columns={self.columns})"
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Plain dicts, one per result, e.g. for a JSON response."""
+        if not self.columns:
+            return [{} for _ in self.rows]
+        values = [self.column(name) for name in self.columns]
+        return [dict(zip(self.columns, row)) for row in zip(*values)]